@@ -3,30 +3,130 @@
 Simple Flask web app for face comparison.
 """
 
+import base64
+import binascii
+import concurrent.futures
+import io
 import os
+import re
+import shutil
 import tempfile
+import threading
+import time
 import logging
 import json
 from datetime import datetime
 from pathlib import Path
 
-from flask import Flask, render_template, request, redirect, url_for, flash,send_from_directory
+from flask import Flask, Response, abort, render_template, request, redirect, url_for, flash,send_from_directory, send_file, jsonify, stream_with_context
 from werkzeug.utils import secure_filename
 
 # Import after path modification  # noqa: E402
-from src.face_compare import FaceComparator
+from src.activity_aggregates import AGGREGATE_MAX_AGE_SECONDS, AGGREGATE_WINDOW_MINUTES, ActivityAggregates
+from src.activity_log import ActivityLog, ActivityLogFile, parse_sample_rates
+from src.activity_store import ACTIVITY_PAGE_SIZE, ActivityStore
+from src.archive_batch import ArchiveError, ArchiveReader, read_archive_pairs, stream_archive_batch
+from src.encoding_scheduler import EncodingScheduler
+from src.face_compare import DetectionCache, FaceComparator, compute_face_descriptors
+from src.image_derivatives import DERIVATIVE_FORMATS, DerivativeMaker
 from src.image_masking import ImageMasker
+from src.image_sessions import ImageCache, compare_handles, unmasked_face_data
+from src.image_validation import ImageRejected, validate_image
+from src.job_queue import FINISHED_STATES, JobQueue
+from src.jobs import JobWorker, default_worker_id, load_rgb, run_comparison_job
+from src.mask_preview import PreviewManager, RateLimited, estimate_masked_match
+from src.per_process import PerProcess
+from src.result_store import ResultStore
+from src.single_flight import SingleFlight
+from src.upload_retention import UploadSweeper
+from src.upload_store import UploadStore
 from flask import send_from_directory
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['LOG_FOLDER'] = 'logs'
+app.config['DATA_FOLDER'] = 'data'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Cross-request micro-batching of face encoding: how long the first request in
+# a batch waits for others, and how many faces trigger an immediate run
+app.config['ENCODE_BATCH_MAX_WAIT_MS'] = float(os.environ.get('ENCODE_BATCH_MAX_WAIT_MS', 5))
+app.config['ENCODE_BATCH_MAX_SIZE'] = int(os.environ.get('ENCODE_BATCH_MAX_SIZE', 32))
+app.config['COMPARE_TOLERANCE'] = float(os.environ.get('COMPARE_TOLERANCE', 0.45))
+# Asynchronous comparison jobs: queue database and in-process worker threads.
+# Set JOB_WORKER_THREADS to 0 when separate 'main.py worker' processes run them.
+app.config['JOB_DATABASE'] = os.environ.get('JOB_DATABASE', os.path.join(app.config['DATA_FOLDER'], 'jobs.sqlite3'))
+app.config['JOB_WORKER_THREADS'] = int(os.environ.get('JOB_WORKER_THREADS', 1))
+app.config['JOB_EVENTS_POLL_SECONDS'] = 0.25
+# Server-Sent Event streams (job and preview events) each hold a server thread
+# while open; more than this many per process get a 503. Keep it below the
+# threads per process (WEB_THREADS) so streams never take them all.
+app.config['EVENT_STREAM_MAX'] = int(os.environ.get('EVENT_STREAM_MAX', 4))
+# Archive batches: upload size limit and threads encoding archive members
+# (shared by all batch requests)
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.environ.get('BATCH_MAX_CONTENT_LENGTH', 512 * 1024 * 1024))
+app.config['BATCH_WORKERS'] = int(os.environ.get('BATCH_WORKERS', 2))
+# Largest expanded size of one archive member (like a single upload) and of
+# a whole archive, checked from the archive's headers before decompressing
+app.config['BATCH_MAX_MEMBER_BYTES'] = int(os.environ.get('BATCH_MAX_MEMBER_BYTES', app.config['MAX_CONTENT_LENGTH']))
+app.config['BATCH_MAX_EXPANDED_BYTES'] = int(os.environ.get('BATCH_MAX_EXPANDED_BYTES', 2 * 1024 * 1024 * 1024))
+# Archives larger than this are spooled to a temporary file while they stream
+app.config['BATCH_SPOOL_MEMORY'] = int(os.environ.get('BATCH_SPOOL_MEMORY', 32 * 1024 * 1024))
+# Uploads are checked from their headers before decoding: at most this many
+# pixels (width * height) and animation frames
+app.config['MAX_IMAGE_PIXELS'] = int(os.environ.get('MAX_IMAGE_PIXELS', 50 * 1000 * 1000))
+app.config['MAX_IMAGE_FRAMES'] = int(os.environ.get('MAX_IMAGE_FRAMES', 50))
+# Per-request scratch files (decoded API uploads, spooled archives) go below
+# this directory, the tmpfs /tmp under docker-compose, never the upload volume
+app.config['SCRATCH_FOLDER'] = os.environ.get('SCRATCH_FOLDER', tempfile.gettempdir())
+# Upload retention: uploads unused for UPLOAD_MAX_AGE_SECONDS are removed, as
+# are the least recently used ones while the store exceeds UPLOAD_MAX_BYTES,
+# by a background sweep every UPLOAD_SWEEP_INTERVAL_SECONDS (0 disables it)
+app.config['UPLOAD_MAX_AGE_SECONDS'] = float(os.environ.get('UPLOAD_MAX_AGE_SECONDS', 7 * 24 * 60 * 60))
+app.config['UPLOAD_MAX_BYTES'] = int(os.environ.get('UPLOAD_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+app.config['UPLOAD_SWEEP_INTERVAL_SECONDS'] = float(os.environ.get('UPLOAD_SWEEP_INTERVAL_SECONDS', 10 * 60))
+# Result pages show display-sized copies of the uploads, at most this many
+# pixels on their long edge; browsers may cache stored images for a year
+app.config['DISPLAY_IMAGE_MAX_SIZE'] = int(os.environ.get('DISPLAY_IMAGE_MAX_SIZE', 800))
+app.config['STORED_IMAGE_MAX_AGE'] = 365 * 24 * 60 * 60
+
+# Finished /compare results, served from /result/<id>, and how long browsers
+# may reuse a rendered result page without asking again
+app.config['RESULT_DATABASE'] = os.environ.get('RESULT_DATABASE', os.path.join(app.config['DATA_FOLDER'], 'results.sqlite3'))
+app.config['RESULT_CACHE_MAX_AGE'] = int(os.environ.get('RESULT_CACHE_MAX_AGE', 24 * 60 * 60))
+# Images uploaded once to /api/images and compared by id: memory for their
+# decoded arrays (per process) and how long an unused image is kept decoded
+app.config['IMAGE_CACHE_MAX_BYTES'] = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+app.config['IMAGE_CACHE_TTL_SECONDS'] = float(os.environ.get('IMAGE_CACHE_TTL_SECONDS', 30 * 60))
+# Threads finding faces on images uploaded ahead, before Compare is clicked
+app.config['UPLOAD_AHEAD_WORKERS'] = int(os.environ.get('UPLOAD_AHEAD_WORKERS', 2))
+# Images whose detected faces are kept for masked re-comparisons
+app.config['DETECTION_CACHE_ENTRIES'] = int(os.environ.get('DETECTION_CACHE_ENTRIES', 128))
+# Live mask previews: quiet time before an edit is estimated, edits accepted
+# per session each second, and how long an unused session is kept
+app.config['PREVIEW_DEBOUNCE_MS'] = float(os.environ.get('PREVIEW_DEBOUNCE_MS', 50))
+app.config['PREVIEW_MAX_UPDATES_PER_SECOND'] = int(os.environ.get('PREVIEW_MAX_UPDATES_PER_SECOND', 20))
+app.config['PREVIEW_IDLE_SECONDS'] = float(os.environ.get('PREVIEW_IDLE_SECONDS', 10 * 60))
+# User activity log: share of high-volume actions kept ("action=rate,..."),
+# longest time before queued events are written, and rotation of the file
+# (rotated files are gzipped)
+app.config['ACTIVITY_SAMPLE_RATES'] = parse_sample_rates(os.environ.get('ACTIVITY_SAMPLE_RATES', 'file_access=0.1'))
+app.config['ACTIVITY_FLUSH_SECONDS'] = float(os.environ.get('ACTIVITY_FLUSH_SECONDS', 1.0))
+app.config['ACTIVITY_LOG_MAX_BYTES'] = int(os.environ.get('ACTIVITY_LOG_MAX_BYTES', 50 * 1024 * 1024))
+app.config['ACTIVITY_LOG_MAX_AGE_SECONDS'] = float(os.environ.get('ACTIVITY_LOG_MAX_AGE_SECONDS', 24 * 60 * 60))
+app.config['ACTIVITY_LOG_BACKUPS'] = int(os.environ.get('ACTIVITY_LOG_BACKUPS', 14))
+# Activity events are also kept, indexed, in this database for /admin/logs,
+# for ACTIVITY_MAX_AGE_SECONDS
+app.config['ACTIVITY_DATABASE'] = os.environ.get('ACTIVITY_DATABASE', os.path.join(app.config['DATA_FOLDER'], 'activity.sqlite3'))
+app.config['ACTIVITY_MAX_AGE_SECONDS'] = float(os.environ.get('ACTIVITY_MAX_AGE_SECONDS', 90 * 24 * 60 * 60))
+# Per-minute activity counters for /admin/activity are added to the same
+# database this often by each process
+app.config['ACTIVITY_SNAPSHOT_SECONDS'] = float(os.environ.get('ACTIVITY_SNAPSHOT_SECONDS', 60))
 
 # Create directories if they don't exist
 Path(app.config['UPLOAD_FOLDER']).mkdir(exist_ok=True)
 Path(app.config['LOG_FOLDER']).mkdir(exist_ok=True)
+Path(app.config['DATA_FOLDER']).mkdir(exist_ok=True)
 
 # Configure logging
 logging.basicConfig(
@@ -38,16 +138,102 @@ logging.basicConfig(
     ]
 )
 
-# Create user activity logger
-activity_logger = logging.getLogger('user_activity')
-activity_handler = logging.FileHandler(os.path.join(app.config['LOG_FOLDER'], 'user_activity.log'))
-activity_formatter = logging.Formatter('%(asctime)s - %(message)s')
-activity_handler.setFormatter(activity_formatter)
-activity_logger.addHandler(activity_handler)
-activity_logger.setLevel(logging.INFO)
+# User activity is queued and written in batches by a background thread;
+# requests never wait for the disk
+class ConfiguredActivitySink:
+    """Activity log sink writing to the store or counters of the configured database."""
+    
+    def __init__(self, get_sink):
+        self.get_sink = get_sink
+    
+    def write(self, events):
+        self.get_sink().write(events)
+    
+    def close(self):
+        sink = self.get_sink()
+        if hasattr(sink, 'close'):
+            sink.close()
+    
+    def metrics(self):
+        return self.get_sink().metrics()
+
+
+activity_log = ActivityLog(
+    [ActivityLogFile(
+        os.path.join(app.config['LOG_FOLDER'], 'user_activity.log'),
+        max_bytes=app.config['ACTIVITY_LOG_MAX_BYTES'],
+        max_age_seconds=app.config['ACTIVITY_LOG_MAX_AGE_SECONDS'],
+        backup_count=app.config['ACTIVITY_LOG_BACKUPS']
+    ), ConfiguredActivitySink(lambda: get_activity_store()),
+     ConfiguredActivitySink(lambda: get_activity_aggregates())],
+    sample_rates=app.config['ACTIVITY_SAMPLE_RATES'],
+    flush_seconds=app.config['ACTIVITY_FLUSH_SECONDS']
+)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 
+# Shared by every request so concurrent comparisons encode their faces together
+encoding_scheduler = EncodingScheduler(
+    compute_face_descriptors,
+    max_wait_ms=app.config['ENCODE_BATCH_MAX_WAIT_MS'],
+    max_batch_size=app.config['ENCODE_BATCH_MAX_SIZE']
+)
+
+# Faces found on recently compared images, so masking an image compared
+# before re-encodes only the faces the masks touch
+detection_cache = DetectionCache(max_entries=app.config['DETECTION_CACHE_ENTRIES'])
+
+# Decoded images and their unmasked faces, by image id
+image_cache = ImageCache(
+    max_bytes=app.config['IMAGE_CACHE_MAX_BYTES'],
+    ttl_seconds=app.config['IMAGE_CACHE_TTL_SECONDS']
+)
+
+# In-flight comparisons keyed by image content, masks and tolerance
+comparison_flights = SingleFlight()
+
+# In-flight face detection on uploaded images, keyed by image id, shared by
+# upload-ahead encoding and the comparison waiting for it
+face_flights = SingleFlight()
+
+
+class PerKey:
+    """Objects opened once per key (a database path, a folder), under their own lock."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._objects = {}
+    
+    def get(self, key, open_object):
+        with self._lock:
+            if key not in self._objects:
+                self._objects[key] = open_object()
+            return self._objects[key]
+
+
+# Stores and the objects built on them, by database path or folder
+_job_queues = PerKey()
+_result_stores = PerKey()
+_upload_sweepers = PerKey()
+_derivative_makers = PerKey()
+_activity_stores = PerKey()
+_activity_aggregates = PerKey()
+
+# Thread pools and job worker threads of this process
+_upload_ahead_executor = PerProcess(lambda: concurrent.futures.ThreadPoolExecutor(
+    app.config['UPLOAD_AHEAD_WORKERS'], thread_name_prefix='upload-ahead'))
+_batch_executor = PerProcess(lambda: concurrent.futures.ThreadPoolExecutor(
+    app.config['BATCH_WORKERS'], thread_name_prefix='batch-encode'))
+_job_workers = PerProcess(lambda: start_job_workers())
+
+# Images uploaded ahead whose faces were found by the time they were compared
+_upload_ahead = {'ready': 0, 'waited': 0}
+_upload_ahead_lock = threading.Lock()
+
+# Event streams this process is serving, and those turned away
+_event_streams = {'open': 0, 'rejected': 0}
+_event_streams_lock = threading.Lock()
+
 
 def log_user_activity(action, details=None, ip_address=None):
     """Log user activity with timestamp, IP, and action details."""
@@ -62,7 +248,7 @@ def log_user_activity(action, details=None, ip_address=None):
         'user_agent': request.headers.get('User-Agent', 'unknown')
     }
     
-    activity_logger.info(json.dumps(log_entry))
+    activity_log.log(log_entry)
 
 
 def allowed_file(filename):
@@ -79,6 +265,74 @@ def allowed_file(filename):
     return name != '' and ext.lower() in ALLOWED_EXTENSIONS
 
 
+def upload_error(files):
+    """
+    Check that a request carries two usable images.
+
+    Returns:
+        None if both uploads are acceptable, otherwise a tuple of
+        (log reason, user-facing message, extra log details)
+    """
+    if 'image1' not in files or 'image2' not in files:
+        return 'missing_files', 'Please select both images', {}
+    
+    file1 = files['image1']
+    file2 = files['image2']
+    
+    # Check if files were actually selected
+    if file1.filename == '' or file2.filename == '':
+        return 'empty_filenames', 'Please select both images', {}
+    
+    # Check file types
+    if not (allowed_file(file1.filename) and allowed_file(file2.filename)):
+        return ('invalid_file_types',
+                'Please upload valid image files (PNG, JPG, JPEG, GIF, BMP)',
+                {'files': [file1.filename, file2.filename]})
+    
+    return None
+
+
+def normalize_rectangles(rectangles):
+    """Hashable, rounding-tolerant form of parsed rectangles for use as a key."""
+    return tuple(
+        tuple(round(rect[key], 4) for key in ('x', 'y', 'width', 'height'))
+        for rect in rectangles
+    )
+
+
+def make_comparator(tolerance):
+    """FaceComparator sharing the encoding batches and detection cache."""
+    return FaceComparator(
+        tolerance=tolerance,
+        encoder=encoding_scheduler.encode,
+        detection_cache=detection_cache
+    )
+
+
+def compare_uploaded_ahead(masker, handles, rectangles, tolerance):
+    """Compare two images uploaded ahead, waiting for their faces if still running."""
+    comparator = make_comparator(tolerance)
+    ready = sum(handle.face_data is not None for handle in handles)
+    with _upload_ahead_lock:
+        _upload_ahead['ready'] += ready
+        _upload_ahead['waited'] += len(handles) - ready
+    for handle in handles:
+        unmasked_face_data(handle, comparator, face_flights)
+    return compare_handles(handles, rectangles, tolerance, comparator, masker, lambda stage, data: None)
+
+
+def run_comparison(masker, filepath1, filepath2, rectangles, tolerance):
+    """Mask (if rectangles are given) and compare two saved uploads."""
+    payload = {
+        'image1': filepath1,
+        'image2': filepath2,
+        'rectangles': rectangles,
+        'tolerance': tolerance
+    }
+    comparator = make_comparator(tolerance)
+    return run_comparison_job(payload, comparator, masker, lambda stage, data: None)
+
+
 @app.route('/')
 def index():
     """Main page with upload form."""
@@ -91,37 +345,38 @@ def compare_faces():
     """Handle face comparison request."""
     log_user_activity('face_comparison_attempt')
     
-    # Check if files were uploaded
-    if 'image1' not in request.files or 'image2' not in request.files:
-        flash('Please select both images')
-        log_user_activity('face_comparison_failed', {'reason': 'missing_files'})
-        return redirect(url_for('index'))
+    # Images chosen in the form may have been uploaded ahead; then only
+    # their ids are posted and their faces are usually found already
+    upload_ids = [request.form.get('image1_id'), request.form.get('image2_id')]
+    handles = [load_image_handle(image_id) for image_id in upload_ids] if all(upload_ids) else []
+    uploaded_ahead = len(handles) == 2 and all(handles)
     
-    file1 = request.files['image1']
-    file2 = request.files['image2']
-    
-    # Check if files were actually selected
-    if file1.filename == '' or file2.filename == '':
-        flash('Please select both images')
-        log_user_activity('face_comparison_failed', {'reason': 'empty_filenames'})
-        return redirect(url_for('index'))
-    
-    # Check file types
-    if not (allowed_file(file1.filename) and allowed_file(file2.filename)):
-        flash('Please upload valid image files (PNG, JPG, JPEG, GIF, BMP)')
-        log_user_activity('face_comparison_failed', {'reason': 'invalid_file_types', 'files': [file1.filename, file2.filename]})
+    error = None if uploaded_ahead else upload_error(request.files)
+    if error:
+        reason, message, extra = error
+        flash(message)
+        log_user_activity('face_comparison_failed', dict(reason=reason, **extra))
         return redirect(url_for('index'))
     
     try:
-        # Save uploaded files
-        filename1 = secure_filename(file1.filename)
-        filename2 = secure_filename(file2.filename)
-        
-        filepath1 = os.path.join(app.config['UPLOAD_FOLDER'], filename1)
-        filepath2 = os.path.join(app.config['UPLOAD_FOLDER'], filename2)
-        
-        file1.save(filepath1)
-        file2.save(filepath2)
+        if uploaded_ahead:
+            filename1, filename2 = handles[0].filename, handles[1].filename
+            digest1, digest2 = handles[0].id, handles[1].id
+        else:
+            file1 = request.files['image1']
+            file2 = request.files['image2']
+            
+            # Store uploads by content, hashing them on the way to disk, so
+            # same-named uploads never collide and repeats are stored once
+            filename1 = secure_filename(file1.filename)
+            filename2 = secure_filename(file2.filename)
+            
+            store = get_upload_store()
+            stored1 = store.save(file1.stream, filename1)
+            stored2 = store.save(file2.stream, filename2)
+            
+            filepath1, digest1 = stored1.path, stored1.digest
+            filepath2, digest2 = stored2.path, stored2.digest
         
         # Get rectangle data from form
         rectangles1_json = request.form.get('rectangles1', '')
@@ -132,51 +387,38 @@ def compare_faces():
         rectangles1 = masker.parse_rectangle_data(rectangles1_json)
         rectangles2 = masker.parse_rectangle_data(rectangles2_json)
         
-        # Determine comparison images (original or masked)
-        comparison_filepath1 = filepath1
-        comparison_filepath2 = filepath2
-        mask_applied = False
-        
-        # Apply masks if rectangles are present
-        if rectangles1 or rectangles2:
-            # Create masked versions
-            masked_filename1 = f"masked_{filename1}"
-            masked_filename2 = f"masked_{filename2}"
-            
-            masked_filepath1 = os.path.join(app.config['UPLOAD_FOLDER'], masked_filename1)
-            masked_filepath2 = os.path.join(app.config['UPLOAD_FOLDER'], masked_filename2)
-            
-            # Apply masks (use same rectangles for both images for synchronized masking)
-            # Use rectangles1 as primary, fall back to rectangles2
-            primary_rectangles = rectangles1 if rectangles1 else rectangles2
-            
-            masker.create_masked_image_file(filepath1, masked_filepath1, primary_rectangles)
-            masker.create_masked_image_file(filepath2, masked_filepath2, primary_rectangles)
-            
-            comparison_filepath1 = masked_filepath1
-            comparison_filepath2 = masked_filepath2
-            mask_applied = True
-        
-        # Perform face comparison
-        comparator = FaceComparator()
-        is_same_person, details = comparator.compare_faces(comparison_filepath1, comparison_filepath2)
+        # Use same rectangles for both images for synchronized masking
+        # Use rectangles1 as primary, fall back to rectangles2
+        primary_rectangles = rectangles1 if rectangles1 else rectangles2
+        tolerance = app.config['COMPARE_TOLERANCE']
         
-        # Get mask statistics if masks were applied
-        mask_stats = None
-        if mask_applied:
-            primary_rectangles = rectangles1 if rectangles1 else rectangles2
-            mask = masker.create_mask_from_rectangles(filepath1, primary_rectangles)
-            mask_stats = masker.get_mask_statistics(mask)
+        # Identical submissions already being processed (double clicks,
+        # retries) wait for that run and share its result
+        flight_key = (digest1, digest2, normalize_rectangles(primary_rectangles), tolerance)
+        if uploaded_ahead:
+            comparison, coalesced = comparison_flights.do(
+                flight_key, compare_uploaded_ahead, masker,
+                handles, primary_rectangles, tolerance
+            )
+        else:
+            comparison, coalesced = comparison_flights.do(
+                flight_key, run_comparison, masker,
+                filepath1, filepath2, primary_rectangles, tolerance
+            )
+        is_same_person = comparison['is_same_person']
+        mask_applied = comparison['mask_applied']
         
         # Prepare result data
         result_data = {
             'image1': filename1,
             'image2': filename2,
+            'image1_id': digest1,
+            'image2_id': digest2,
             'is_same_person': is_same_person,
-            'details': details,
-            'confidence': 'High' if 'Distance: 0.' in details else 'Medium',
+            'details': comparison['details'],
+            'confidence': comparison['confidence_label'],
             'mask_applied': mask_applied,
-            'mask_stats': mask_stats,
+            'mask_stats': comparison['mask_stats'],
             'rectangles_count': len(rectangles1) if rectangles1 else len(rectangles2) if rectangles2 else 0
         }
         
@@ -185,57 +427,855 @@ def compare_faces():
             'files': [filename1, filename2],
             'result': is_same_person,
             'mask_applied': mask_applied,
-            'rectangles_count': result_data['rectangles_count']
+            'rectangles_count': result_data['rectangles_count'],
+            'coalesced': coalesced,
+            'uploaded_ahead': uploaded_ahead
         })
         
-        return render_template('result.html', **result_data)
+        # Post/Redirect/Get: refreshing or going back to the result page
+        # re-reads the stored result instead of resubmitting the uploads
+        result_id = get_result_store().save(result_data)
+        return redirect(url_for('view_result', result_id=result_id), code=303)
         
+    except ImageRejected as e:
+        flash(str(e))
+        log_user_activity('face_comparison_failed', {'reason': 'invalid_image', 'error': str(e)})
+        return redirect(url_for('index'))
     except Exception as e:
         flash(f'Error processing images: {str(e)}')
         log_user_activity('face_comparison_error', {'error': str(e)})
         return redirect(url_for('index'))
 
 
+def get_upload_sweeper():
+    """Retention sweeper of the configured upload folder, started on first use."""
+    root = os.path.join(app.config['UPLOAD_FOLDER'], 'store')
+    
+    def open_sweeper():
+        store = UploadStore(root, max_pixels=app.config['MAX_IMAGE_PIXELS'],
+                            max_frames=app.config['MAX_IMAGE_FRAMES'])
+        return UploadSweeper(
+            store,
+            legacy_folder=app.config['UPLOAD_FOLDER'],
+            max_age_seconds=app.config['UPLOAD_MAX_AGE_SECONDS'],
+            max_bytes=app.config['UPLOAD_MAX_BYTES'],
+            interval_seconds=app.config['UPLOAD_SWEEP_INTERVAL_SECONDS']
+        )
+    
+    sweeper = _upload_sweepers.get(root, open_sweeper)
+    sweeper.start()
+    return sweeper
+
+
+def get_upload_store():
+    """Content-addressed store below the configured upload folder, opened once per path."""
+    return get_upload_sweeper().store
+
+
+def get_derivative_maker():
+    """Display derivatives of the configured upload store."""
+    store = get_upload_store()
+    key = (store.root, app.config['DISPLAY_IMAGE_MAX_SIZE'])
+    return _derivative_makers.get(key, lambda: DerivativeMaker(store, max_size=key[1]))
+
+
+def get_activity_store():
+    """Activity store for the configured database, opened once per path."""
+    path = app.config['ACTIVITY_DATABASE']
+    return _activity_stores.get(
+        path, lambda: ActivityStore(path, max_age_seconds=app.config['ACTIVITY_MAX_AGE_SECONDS']))
+
+
+def get_activity_aggregates():
+    """Activity counters kept in the configured database, opened once per path."""
+    path = app.config['ACTIVITY_DATABASE']
+    return _activity_aggregates.get(
+        path, lambda: ActivityAggregates(path, snapshot_seconds=app.config['ACTIVITY_SNAPSHOT_SECONDS']))
+
+
+def get_result_store():
+    """Result store for the configured database, opened once per path."""
+    path = app.config['RESULT_DATABASE']
+    # Results go when the uploads they show would
+    return _result_stores.get(
+        path, lambda: ResultStore(path, max_age_seconds=app.config['UPLOAD_MAX_AGE_SECONDS']))
+
+
+def result_images_exist(result_data):
+    """Whether the uploads a stored result shows are still kept."""
+    for n in (1, 2):
+        image_id = result_data.get(f'image{n}_id')
+        if image_id:
+            if get_upload_store().get(image_id, touch=False) is None:
+                return False
+        elif not os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], result_data[f'image{n}'])):
+            return False
+    return True
+
+
+def result_expired_page(status):
+    """Page for a result whose images (or the result itself) have been removed."""
+    max_age_days = f"{app.config['UPLOAD_MAX_AGE_SECONDS'] / (24 * 60 * 60):g}"
+    return render_template('result_expired.html', max_age_days=max_age_days), status
+
+
+@app.route('/result/<result_id>')
+def view_result(result_id):
+    """Show a stored comparison result."""
+    log_user_activity('result_view', {'result_id': result_id})
+    
+    result_data = get_result_store().get(result_id)
+    if result_data is None:
+        # Unknown, or removed once older than the upload retention
+        return result_expired_page(404)
+    if not result_images_exist(result_data):
+        return result_expired_page(410)
+    
+    # A result never changes, so its id is a strong validator and
+    # revalidation answers 304 without rendering the page again
+    response = app.response_class()
+    response.set_etag(result_id)
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config['RESULT_CACHE_MAX_AGE']
+    response.cache_control.immutable = True
+    if request.if_none_match.contains(result_id):
+        response.status_code = 304
+        return response
+    
+    response.set_data(render_template('result.html', **result_data))
+    return response
+
+
+class ApiInputError(ValueError):
+    """Problem with the images or options sent to the JSON API."""
+    
+    def __init__(self, message, reason='invalid_input'):
+        super().__init__(message)
+        # Fixed code logged as the failure reason; the message is shown
+        self.reason = reason
+
+
+def check_image(stream, name):
+    """
+    Validate an upload's headers against the configured limits before decoding.
+
+    ``name`` is the uploaded filename, whose extension must match the
+    content, or a field name without one.
+
+    Raises:
+        ApiInputError: With the reason if the image is rejected
+    """
+    try:
+        return validate_image(stream, name, app.config['MAX_IMAGE_PIXELS'],
+                              app.config['MAX_IMAGE_FRAMES'])
+    except ImageRejected as e:
+        raise ApiInputError(str(e), 'invalid_image')
+
+
+def decode_base64_image(data, field):
+    """Decode a base64 (optionally data: URL) image, checking it is one we accept."""
+    if not isinstance(data, str) or not data:
+        raise ApiInputError(f'{field} must be a base64 encoded image', 'invalid_image')
+    if data.startswith('data:') and ',' in data:
+        data = data.split(',', 1)[1]
+    try:
+        content = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        raise ApiInputError(f'{field} is not valid base64', 'invalid_image')
+    
+    info = check_image(io.BytesIO(content), field)
+    return content, 'jpg' if info.format == 'JPEG' else info.format.lower()
+
+
+def parse_api_tolerance(value):
+    """Tolerance requested through the API, defaulting to the configured one."""
+    if value in (None, ''):
+        return app.config['COMPARE_TOLERANCE']
+    try:
+        tolerance = float(value)
+    except (TypeError, ValueError):
+        raise ApiInputError('tolerance must be a number', 'invalid_tolerance')
+    if not 0 < tolerance <= 1:
+        raise ApiInputError('tolerance must be between 0 and 1', 'invalid_tolerance')
+    return tolerance
+
+
+def save_api_images(folder, masker):
+    """
+    Store the two images of an /api/compare request in ``folder``.
+
+    Accepts either multipart uploads or a JSON body with base64 images.
+
+    Returns:
+        Tuple of (filepath1, filepath2, rectangles, tolerance)
+    """
+    if request.is_json:
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            raise ApiInputError('Request body must be a JSON object', 'invalid_body')
+        paths = []
+        for field in ('image1', 'image2'):
+            content, extension = decode_base64_image(body.get(field), field)
+            path = os.path.join(folder, f'{field}.{extension}')
+            with open(path, 'wb') as out:
+                out.write(content)
+            paths.append(path)
+        rectangles = body.get('rectangles') or body.get('rectangles1') or body.get('rectangles2') or []
+        rectangles = masker.parse_rectangle_data(json.dumps(rectangles))
+        return paths[0], paths[1], rectangles, parse_api_tolerance(body.get('tolerance'))
+    
+    error = upload_error(request.files)
+    if error:
+        raise ApiInputError(error[1], error[0])
+    paths = []
+    for field in ('image1', 'image2'):
+        file = request.files[field]
+        path = os.path.join(folder, f'{field}_{secure_filename(file.filename)}')
+        file.save(path)
+        with open(path, 'rb') as saved:
+            check_image(saved, file.filename)
+        paths.append(path)
+    rectangles = (masker.parse_rectangle_data(request.form.get('rectangles1', ''))
+                  or masker.parse_rectangle_data(request.form.get('rectangles2', '')))
+    return paths[0], paths[1], rectangles, parse_api_tolerance(request.form.get('tolerance'))
+
+
+@app.route('/api/compare', methods=['POST'])
+def api_compare():
+    """Compare two images and return the structured result as JSON."""
+    log_user_activity('api_compare_attempt')
+    
+    # Scratch space for this request only, removed however it ends
+    folder = tempfile.mkdtemp(prefix='api-compare-', dir=app.config['SCRATCH_FOLDER'])
+    try:
+        masker = ImageMasker()
+        filepath1, filepath2, rectangles, tolerance = save_api_images(folder, masker)
+        result = run_comparison(masker, filepath1, filepath2, rectangles, tolerance)
+    except ApiInputError as e:
+        log_user_activity('api_compare_failed', {'reason': e.reason, 'error': str(e)})
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log_user_activity('api_compare_error', {'error': str(e)})
+        return jsonify({'error': f'Error processing images: {str(e)}'}), 500
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    
+    log_user_activity('api_compare_success', {
+        'result': result['is_same_person'],
+        'mask_applied': result['mask_applied'],
+        'total_ms': result['timings_ms']['total']
+    })
+    return jsonify(result)
+
+
+IMAGE_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def store_image(file):
+    """
+    Save one /api/images upload in the upload store and cache it decoded.
+
+    Returns:
+        The cached ImageHandle, whose id is the image's SHA-256
+    """
+    if not allowed_file(file.filename):
+        raise ApiInputError(f'{file.filename or "Upload"} is not a PNG, JPG, GIF or BMP image',
+                            'invalid_file_types')
+    
+    filename = secure_filename(file.filename)
+    try:
+        stored = get_upload_store().save(file.stream, filename)
+    except ImageRejected as e:
+        raise ApiInputError(str(e), 'invalid_image')
+    try:
+        image = load_rgb(stored.path)
+    except Exception:
+        raise ApiInputError(f'{file.filename} is not a readable image', 'invalid_image')
+    
+    try:
+        return image_cache.put(stored.digest, filename, stored.path, image)
+    except ValueError as e:
+        raise ApiInputError(str(e), 'image_too_large')
+
+
+def load_image_handle(image_id):
+    """
+    Cached handle for an uploaded image id, decoding it again if needed.
+
+    Images evicted from the cache, or uploaded through another server
+    process, are still in the upload store and are decoded once more.
+
+    Returns:
+        The ImageHandle, or None if no image with that id was uploaded
+    """
+    if not isinstance(image_id, str) or not IMAGE_ID_PATTERN.match(image_id):
+        return None
+    handle = image_cache.get(image_id)
+    if handle is not None:
+        return handle
+    
+    stored = get_upload_store().get(image_id)
+    if stored is None:
+        return None
+    return image_cache.put(image_id, stored.filename, stored.path, load_rgb(stored.path))
+
+
+@app.route('/api/images', methods=['POST'])
+def upload_images():
+    """Upload images once to compare them by id with /api/images/compare."""
+    log_user_activity('api_images_attempt')
+    
+    files = [file for file in request.files.values() if file.filename]
+    if not files:
+        log_user_activity('api_images_failed', {'reason': 'missing_files'})
+        return jsonify({'error': 'Please upload at least one image'}), 400
+    
+    try:
+        handles = [store_image(file) for file in files]
+    except ApiInputError as e:
+        log_user_activity('api_images_failed', {'reason': e.reason, 'error': str(e)})
+        return jsonify({'error': str(e)}), 400
+    
+    log_user_activity('api_images_success', {'images': [handle.id for handle in handles]})
+    return jsonify({'images': [handle.describe() for handle in handles]}), 201
+
+
+def get_upload_ahead_executor():
+    """Thread pool finding faces on images uploaded ahead, created once per process."""
+    return _upload_ahead_executor.get()
+
+
+@app.route('/api/images/ahead', methods=['POST'])
+def upload_ahead():
+    """
+    Receive an image as soon as it is chosen in the form and start finding
+    its faces in the background.
+    
+    The returned id is posted as image1_id or image2_id with the form, so
+    Compare only has to wait for whatever detection is still running.
+    """
+    log_user_activity('upload_ahead_attempt')
+    
+    files = [file for file in request.files.values() if file.filename]
+    if len(files) != 1:
+        return jsonify({'error': 'Please upload exactly one image'}), 400
+    
+    try:
+        handle = store_image(files[0])
+    except ApiInputError as e:
+        log_user_activity('upload_ahead_failed', {'reason': e.reason, 'error': str(e)})
+        return jsonify({'error': str(e)}), 400
+    
+    if handle.face_data is None:
+        comparator = make_comparator(app.config['COMPARE_TOLERANCE'])
+        get_upload_ahead_executor().submit(unmasked_face_data, handle, comparator, face_flights)
+    
+    log_user_activity('upload_ahead_success', {'image': handle.id})
+    return jsonify({'image': handle.describe()}), 202
+
+
+@app.route('/api/images/compare', methods=['POST'])
+def compare_uploaded_images():
+    """Compare two images uploaded to /api/images, by id, with new masks."""
+    log_user_activity('api_images_compare_attempt')
+    
+    masker = ImageMasker()
+    if request.is_json:
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+        rectangles = masker.parse_rectangle_data(json.dumps(body.get('rectangles') or []))
+    else:
+        body = request.form
+        rectangles = masker.parse_rectangle_data(body.get('rectangles', ''))
+    
+    try:
+        tolerance = parse_api_tolerance(body.get('tolerance'))
+    except ApiInputError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    handles = []
+    for field in ('image1', 'image2'):
+        handle = load_image_handle(body.get(field))
+        if handle is None:
+            log_user_activity('api_images_compare_failed', {'reason': f'unknown_{field}'})
+            return jsonify({'error': f'{field} is not the id of an uploaded image'}), 404
+        handles.append(handle)
+    
+    try:
+        comparator = make_comparator(tolerance)
+        result = compare_handles(handles, rectangles, tolerance, comparator, masker, lambda stage, data: None)
+    except Exception as e:
+        log_user_activity('api_images_compare_error', {'error': str(e)})
+        return jsonify({'error': f'Error processing images: {str(e)}'}), 500
+    
+    log_user_activity('api_images_compare_success', {
+        'images': result['images'],
+        'result': result['is_same_person'],
+        'mask_applied': result['mask_applied'],
+        'total_ms': result['timings_ms']['total']
+    })
+    return jsonify(result)
+
+
+def estimate_preview(session, rectangles, cancelled):
+    """Estimate for a preview session's latest mask edit."""
+    comparator = make_comparator(session.tolerance)
+    return estimate_masked_match(session.handles, rectangles, comparator, ImageMasker(), cancelled)
+
+
+# Mask preview sessions of this process, by id
+preview_manager = PreviewManager(
+    estimate_preview,
+    debounce_seconds=app.config['PREVIEW_DEBOUNCE_MS'] / 1000,
+    max_updates_per_second=app.config['PREVIEW_MAX_UPDATES_PER_SECOND'],
+    idle_seconds=app.config['PREVIEW_IDLE_SECONDS']
+)
+
+
+@app.route('/api/previews', methods=['POST'])
+def create_preview():
+    """Start a live mask preview for two images uploaded to /api/images."""
+    log_user_activity('api_preview_attempt')
+    
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    try:
+        tolerance = parse_api_tolerance(body.get('tolerance'))
+    except ApiInputError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    handles = []
+    for field in ('image1', 'image2'):
+        handle = load_image_handle(body.get(field))
+        if handle is None:
+            log_user_activity('api_preview_failed', {'reason': f'unknown_{field}'})
+            return jsonify({'error': f'{field} is not the id of an uploaded image'}), 404
+        handles.append(handle)
+    
+    session = preview_manager.create(handles, tolerance)
+    log_user_activity('api_preview_started', {'preview_id': session.id})
+    return jsonify({
+        'preview_id': session.id,
+        'masks_url': url_for('update_preview', preview_id=session.id),
+        'events_url': url_for('preview_events', preview_id=session.id)
+    }), 201
+
+
+@app.route('/api/previews/<preview_id>/masks', methods=['POST'])
+def update_preview(preview_id):
+    """Submit the current rectangles of a preview; the estimate arrives as an event."""
+    session = preview_manager.get(preview_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired preview'}), 404
+    
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    rectangles = ImageMasker().parse_rectangle_data(json.dumps(body.get('rectangles') or []))
+    
+    try:
+        revision = preview_manager.update(session, rectangles)
+    except RateLimited as e:
+        response = jsonify({'error': str(e), 'retry_after': round(e.retry_after, 3)})
+        response.headers['Retry-After'] = str(max(1, int(e.retry_after + 0.999)))
+        return response, 429
+    return jsonify({'revision': revision}), 202
+
+
+def event_stream_response(stream):
+    """
+    Server-Sent Events response for ``stream``, or a 503 while this process
+    already serves EVENT_STREAM_MAX streams.
+    """
+    with _event_streams_lock:
+        if _event_streams['open'] >= app.config['EVENT_STREAM_MAX']:
+            _event_streams['rejected'] += 1
+            response = jsonify({'error': 'Too many open event streams; try again shortly'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        _event_streams['open'] += 1
+    
+    def closed():
+        with _event_streams_lock:
+            _event_streams['open'] -= 1
+    
+    response = Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Called by the server once the stream ends or the client goes away
+    response.call_on_close(closed)
+    return response
+
+
+def stream_preview_events(session, after, keepalive_seconds=15.0):
+    """Yield a preview's estimates in Server-Sent Events format until it expires."""
+    while not preview_manager.expired(session):
+        events = session.wait_for_events(after, keepalive_seconds)
+        if not events:
+            yield ': keepalive\n\n'
+        for event in events:
+            after = event['revision']
+            name = 'error' if 'error' in event else 'estimate'
+            yield f"id: {after}\nevent: {name}\ndata: {json.dumps(event)}\n\n"
+
+
+@app.route('/api/previews/<preview_id>/events')
+def preview_events(preview_id):
+    """Stream a preview's estimates, newest mask edit only, as Server-Sent Events."""
+    session = preview_manager.get(preview_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired preview'}), 404
+    
+    after = request.headers.get('Last-Event-ID', request.args.get('after', '0'))
+    try:
+        after = int(after)
+    except ValueError:
+        after = 0
+    
+    return event_stream_response(stream_preview_events(session, after))
+
+
+def get_batch_executor():
+    """Thread pool shared by archive batches, created once per process."""
+    return _batch_executor.get()
+
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """Compare the image pairs in an uploaded archive, streaming NDJSON results."""
+    # Archives are far larger than a single pair of images
+    request.max_content_length = app.config['BATCH_MAX_CONTENT_LENGTH']
+    log_user_activity('api_batch_attempt')
+    
+    archive = request.files.get('archive')
+    if archive is None or archive.filename == '':
+        log_user_activity('api_batch_failed', {'reason': 'missing_archive'})
+        return jsonify({'error': 'Please upload a zip or tar archive as "archive"'}), 400
+    
+    # The upload's own stream is closed when the view returns, before the
+    # streamed response is read, so the generator keeps its own copy
+    spool = tempfile.SpooledTemporaryFile(max_size=app.config['BATCH_SPOOL_MEMORY'],
+                                          dir=app.config['SCRATCH_FOLDER'])
+    shutil.copyfileobj(archive.stream, spool)
+    reader = None
+    try:
+        tolerance = parse_api_tolerance(request.form.get('tolerance'))
+        reader = ArchiveReader(spool, max_member_bytes=app.config['BATCH_MAX_MEMBER_BYTES'],
+                               max_expanded_bytes=app.config['BATCH_MAX_EXPANDED_BYTES'],
+                               spool_dir=app.config['SCRATCH_FOLDER'])
+        manifest = request.files.get('manifest')
+        if manifest is not None and manifest.filename:
+            pairs = read_archive_pairs(reader, manifest.read().decode('utf-8-sig'), manifest.filename)
+        else:
+            pairs = read_archive_pairs(reader)
+    except (ArchiveError, ValueError, KeyError) as e:
+        # Bad tolerance, archive or manifest (including undecodable text)
+        if reader is not None:
+            reader.close()
+        spool.close()
+        if isinstance(e, ApiInputError):
+            reason = e.reason
+        else:
+            reason = 'invalid_archive' if isinstance(e, ArchiveError) else 'invalid_manifest'
+        log_user_activity('api_batch_failed', {'reason': reason, 'error': str(e)})
+        return jsonify({'error': f'Invalid batch: {e}'}), 400
+    
+    if not pairs:
+        reader.close()
+        spool.close()
+        log_user_activity('api_batch_failed', {'reason': 'empty_manifest'})
+        return jsonify({'error': 'The manifest lists no image pairs'}), 400
+    
+    log_user_activity('api_batch_started', {'archive': archive.filename, 'pairs': len(pairs)})
+    comparator = make_comparator(tolerance)
+    workers = app.config['BATCH_WORKERS']
+    
+    def generate():
+        try:
+            records = stream_archive_batch(reader, pairs, comparator, get_batch_executor(), max_pending=2 * workers,
+                                           max_pixels=app.config['MAX_IMAGE_PIXELS'],
+                                           max_frames=app.config['MAX_IMAGE_FRAMES'])
+            for record in records:
+                yield json.dumps(record) + '\n'
+        finally:
+            reader.close()
+            spool.close()
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def get_job_queue():
+    """Job queue for the configured database, opened once per path."""
+    path = app.config['JOB_DATABASE']
+    return _job_queues.get(path, lambda: JobQueue(path))
+
+
+def start_job_workers():
+    """Start the configured number of job worker threads in this process."""
+    queue = get_job_queue()
+    threads = []
+    for index in range(app.config['JOB_WORKER_THREADS']):
+        worker = JobWorker(queue, make_comparator, lambda: ImageMasker(),
+                           worker_id=default_worker_id(f'thread-{index}'))
+        thread = threading.Thread(target=worker.run, name=f'job-worker-{index}', daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def ensure_job_workers():
+    """Start this process's job worker threads on first use."""
+    if app.config['JOB_WORKER_THREADS'] > 0:
+        _job_workers.get()
+
+
+def public_job(job):
+    """Job state as returned by the API (upload paths stay private)."""
+    return {
+        'id': job['id'],
+        'status': job['status'],
+        'result': job['result'],
+        'error': job['error'],
+        'attempts': job['attempts'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at']
+    }
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue a comparison and return its id without waiting for the result."""
+    log_user_activity('job_submit_attempt')
+    
+    error = upload_error(request.files)
+    if error:
+        reason, message, extra = error
+        log_user_activity('job_submit_failed', dict(reason=reason, **extra))
+        return jsonify({'error': message}), 400
+    
+    file1 = request.files['image1']
+    file2 = request.files['image2']
+    
+    # Job uploads go to the upload store like any other, so they are
+    # deduplicated, validated and swept by the same retention policy
+    store = get_upload_store()
+    try:
+        stored1 = store.save(file1.stream, secure_filename(file1.filename))
+        stored2 = store.save(file2.stream, secure_filename(file2.filename))
+    except ImageRejected as e:
+        log_user_activity('job_submit_failed', {'reason': 'invalid_image', 'error': str(e)})
+        return jsonify({'error': str(e)}), 400
+    
+    masker = ImageMasker()
+    rectangles = (masker.parse_rectangle_data(request.form.get('rectangles1', ''))
+                  or masker.parse_rectangle_data(request.form.get('rectangles2', '')))
+    
+    job_id = get_job_queue().submit({
+        'image1': stored1.path,
+        'image2': stored2.path,
+        'rectangles': rectangles,
+        'tolerance': app.config['COMPARE_TOLERANCE']
+    })
+    ensure_job_workers()
+    
+    log_user_activity('job_submitted', {'job_id': job_id, 'files': [file1.filename, file2.filename]})
+    
+    response = jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('job_status', job_id=job_id),
+        'events_url': url_for('job_events', job_id=job_id)
+    })
+    response.status_code = 202
+    response.headers['Location'] = url_for('job_status', job_id=job_id)
+    return response
+
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Poll a job's state, result and progress events."""
+    # Pick up jobs queued before a restart even if nothing new is submitted
+    ensure_job_workers()
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    
+    data = public_job(job)
+    data['events'] = [
+        {'stage': event['stage'], 'data': event['data']} for event in queue.events(job_id)
+    ]
+    return jsonify(data)
+
+
+def stream_job_events(queue, job_id, after, poll_seconds, keepalive_seconds=15.0):
+    """Yield a job's events in Server-Sent Events format until it finishes."""
+    last_sent = time.monotonic()
+    while True:
+        events = queue.events(job_id, after)
+        for event in events:
+            after = event['seq']
+            yield f"id: {event['seq']}\nevent: {event['stage']}\ndata: {json.dumps(event['data'])}\n\n"
+            last_sent = time.monotonic()
+        
+        if events and events[-1]['stage'] in FINISHED_STATES:
+            return
+        if not events:
+            job = queue.get(job_id)
+            if job is None or job['status'] in FINISHED_STATES:
+                return
+            if time.monotonic() - last_sent >= keepalive_seconds:
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+        time.sleep(poll_seconds)
+
+
+@app.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream a job's stage events as Server-Sent Events."""
+    queue = get_job_queue()
+    if queue.get(job_id) is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    
+    # Reconnecting clients resume after the last event they received
+    after = request.headers.get('Last-Event-ID', request.args.get('after', '0'))
+    try:
+        after = int(after)
+    except ValueError:
+        after = 0
+    
+    return event_stream_response(
+        stream_job_events(queue, job_id, after, app.config['JOB_EVENTS_POLL_SECONDS']))
+
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    """Serve uploaded files."""
+    """Serve uploaded files, by image id or (for older results) by name."""
     log_user_activity('file_access', {'filename': filename})
+    if IMAGE_ID_PATTERN.match(filename):
+        stored = get_upload_store().get(filename)
+        if stored is None:
+            abort(404)
+        # Stored images are addressed by content, so they never change
+        return send_stored_image(stored.path, None, stored.digest)
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 
+def send_stored_image(path, mimetype, etag):
+    """Send a content-addressed file that browsers may cache without revalidating."""
+    response = send_file(path, mimetype=mimetype, etag=etag,
+                         max_age=app.config['STORED_IMAGE_MAX_AGE'], conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route('/uploads/<image_id>/display')
+def display_image(image_id):
+    """Serve a display-sized WebP (or JPEG) copy of a stored image."""
+    log_user_activity('file_access', {'filename': image_id, 'variant': 'display'})
+    if not IMAGE_ID_PATTERN.match(image_id):
+        abort(404)
+    stored = get_upload_store().get(image_id)
+    if stored is None:
+        abort(404)
+    
+    def decoded():
+        # Reuse the pixels if this process still has the image decoded
+        handle = image_cache.get(image_id)
+        return handle.image if handle is not None else None
+    
+    extension = 'webp' if request.accept_mimetypes['image/webp'] else 'jpg'
+    maker = get_derivative_maker()
+    try:
+        path = maker.get(stored, extension, decoded)
+    except Exception as e:
+        app.logger.warning('Display image for %s failed, sending the original: %s', image_id, e)
+        return redirect(url_for('uploaded_file', filename=image_id))
+    
+    response = send_stored_image(path, DERIVATIVE_FORMATS[extension][1],
+                                 f'{image_id}-{maker.name}.{extension}')
+    response.vary.add('Accept')
+    return response
+
+
 @app.route('/admin/logs')
 def view_logs():
-    """View user activity logs (admin only)."""
+    """View user activity logs (admin only), newest first, a page at a time."""
     log_user_activity('admin_logs_access')
+    # Show what earlier requests logged, even if it is still queued
+    activity_log.flush(timeout=1.0)
     
+    filters = {
+        'action': request.args.get('action', '').strip(),
+        'ip_address': request.args.get('ip', '').strip()
+    }
     try:
-        log_file = os.path.join(app.config['LOG_FOLDER'], 'user_activity.log')
-        logs = []
-        
-        if os.path.exists(log_file):
-            with open(log_file, 'r') as f:
-                for line in f:
-                    if line.strip():
-                        try:
-                            # Parse the log line (timestamp - json_data)
-                            parts = line.strip().split(' - ', 1)
-                            if len(parts) == 2:
-                                timestamp_str, json_str = parts
-                                log_data = json.loads(json_str)
-                                logs.append(log_data)
-                        except json.JSONDecodeError:
-                            continue
-        
-        # Sort by timestamp descending (most recent first)
-        logs.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        
-        return render_template('logs.html', logs=logs)
+        store = get_activity_store()
+        page = store.query(
+            limit=request.args.get('limit', ACTIVITY_PAGE_SIZE, type=int),
+            cursor=request.args.get('before') or None,
+            **filters
+        )
+        return render_template('logs.html', logs=page['entries'], next_cursor=page['next'],
+                               actions=store.actions(), filters=filters)
         
+    except ValueError:
+        abort(400)
     except Exception as e:
         flash(f'Error reading logs: {str(e)}')
         return redirect(url_for('index'))
 
 
+@app.route('/admin/activity')
+def activity_summary():
+    """Comparisons per minute, error rates and results over recent minutes (admin only)."""
+    log_user_activity('admin_activity_access')
+    minutes = request.args.get('minutes', AGGREGATE_WINDOW_MINUTES, type=int)
+    if not 1 <= minutes <= AGGREGATE_MAX_AGE_SECONDS // 60:
+        abort(400)
+    # Count what earlier requests logged, even if it is still queued
+    activity_log.flush(timeout=1.0)
+    return jsonify(get_activity_aggregates().summary(minutes))
+
+
+@app.route('/admin/uploads', methods=['GET', 'POST'])
+def upload_usage():
+    """Report upload storage against the retention policy; POST sweeps now (admin only)."""
+    log_user_activity('admin_uploads_access', {'sweep': request.method == 'POST'})
+    sweeper = get_upload_sweeper()
+    if request.method == 'POST':
+        sweeper.sweep()
+    return jsonify(sweeper.usage())
+
+
+@app.route('/admin/metrics')
+def view_metrics():
+    """Report runtime metrics (admin only)."""
+    log_user_activity('admin_metrics_access')
+    return jsonify({
+        'encoding_scheduler': encoding_scheduler.metrics(),
+        'single_flight': comparison_flights.metrics(),
+        'image_cache': image_cache.metrics(),
+        'uploads': get_upload_store().metrics(),
+        'display_images': get_derivative_maker().metrics(),
+        'upload_ahead': {
+            'ready': _upload_ahead['ready'],
+            'waited': _upload_ahead['waited'],
+            'detections': face_flights.metrics()
+        },
+        'detection_cache': detection_cache.metrics(),
+        'previews': preview_manager.metrics(),
+        'event_streams': dict(_event_streams, max=app.config['EVENT_STREAM_MAX']),
+        'activity_log': activity_log.metrics(),
+        'jobs': get_job_queue().counts()
+    })
+
+
 if __name__ == '__main__':
+    # Development server; production runs gunicorn -c gunicorn.conf.py app:app
     # DO NOT CHANGE PORT 8060 - This is the permanent default port for this application
     app.run(debug=True, host='0.0.0.0', port=8060)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Production server settings: gunicorn -c gunicorn.conf.py app:app
+
+The master process imports the app and loads the face models once, then
+forks the workers, which share the loaded models copy-on-write. Workers are
+replaced after WEB_MAX_REQUESTS requests; a replacement is forked from the
+master, so it starts with the models loaded.
+
+Sizing for the 1 CPU / 2 GB container: comparisons are CPU-bound, so more
+worker processes than CPUs only add memory. Two workers let one serve pages,
+images and uploads while the other is busy comparing. Each worker has eight
+threads. An open Server-Sent Event stream (job or preview events) holds one
+of them until the client disconnects, so at most EVENT_STREAM_MAX (4) per
+worker may be open; further streams get a 503 and the other threads stay
+free for requests waiting on uploads or batching. Raise both together, keeping
+EVENT_STREAM_MAX below WEB_THREADS.
+Memory: the app with its models loaded takes about 200 MB, shared by the
+master and workers. Each worker adds up to IMAGE_CACHE_MAX_BYTES (256 MB)
+of cached images, plus the decoded images of comparisons in progress (about
+36 MB per 12 MP photo), so two busy workers stay around 1 GB.
+"""
+
+import gc
+import os
+
+# DO NOT CHANGE PORT 8060 - This is the permanent default port for this application
+bind = f"0.0.0.0:{os.environ.get('PORT', '8060')}"
+
+workers = int(os.environ.get("WEB_WORKERS", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 8))
+
+# Load the app in the master so workers are forked with it, models included
+preload_app = True
+
+# Replace workers after this many requests (staggered by up to the jitter)
+# to return memory fragmented by large image buffers
+max_requests = int(os.environ.get("WEB_MAX_REQUESTS", 500))
+max_requests_jitter = int(os.environ.get("WEB_MAX_REQUESTS_JITTER", 50))
+
+# Comparisons of large images with every detection fallback take a while on
+# one CPU
+timeout = int(os.environ.get("WEB_TIMEOUT", 120))
+graceful_timeout = 30
+
+accesslog = "-"
+
+
+def when_ready(server):
+    """Load the models in the master, before any worker is forked."""
+    from src.face_compare import preload_models
+
+    preload_models()
+    # Keep the garbage collector from writing to (and so copying) the pages
+    # of objects loaded so far in every worker
+    gc.collect()
+    gc.freeze()
+    server.log.info("Face models loaded; forking %s workers", workers)
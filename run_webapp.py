@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 """
-Simple script to run the Flask web application.
+Simple script to run the Flask web application with the development server.
+
+In production run gunicorn instead: gunicorn -c gunicorn.conf.py app:app
 """
 
 import os
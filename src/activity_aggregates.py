@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Rolling activity counters for the admin dashboard.
+
+Counts are kept per minute as events are logged: comparisons and their
+same/different results, comparison attempts and failures by reason, every
+action, and a histogram of API comparison times. Each process adds what it
+counted to a SQLite table every ``snapshot_seconds``, so a summary over the
+last hour or day reads a few thousand small rows, merges all processes and
+survives restarts, instead of re-scanning the activity log.
+"""
+
+import collections
+import math
+import sqlite3
+import threading
+import time
+
+try:
+    from .per_process import PerProcess
+    from .sqlite_db import SQLiteDatabase
+except ImportError:
+    from per_process import PerProcess
+    from sqlite_db import SQLiteDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activity_counts (
+    minute INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    count REAL NOT NULL,
+    PRIMARY KEY (minute, metric)
+) WITHOUT ROWID;
+"""
+
+AGGREGATE_WINDOW_MINUTES = 60
+AGGREGATE_SNAPSHOT_SECONDS = 60.0
+AGGREGATE_MAX_AGE_SECONDS = 7 * 24 * 60 * 60.0
+
+# Actions named <kind>_attempt, _success, _failed and _error per comparison
+COMPARISON_KINDS = ("face_comparison", "api_compare", "api_images_compare")
+
+# Upper bounds of the comparison time histogram
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+
+# Reason codes of failed comparisons; anything else is counted as "other",
+# so arbitrary text in a reason cannot add metric names
+FAILURE_REASONS = frozenset(
+    {
+        "missing_files",
+        "empty_filenames",
+        "invalid_file_types",
+        "invalid_image",
+        "image_too_large",
+        "invalid_body",
+        "invalid_tolerance",
+        "invalid_input",
+        "unknown_image1",
+        "unknown_image2",
+    }
+)
+
+
+def event_metrics(entry):
+    """The metrics an activity entry adds one (scaled) count to."""
+    action = entry.get("action", "")
+    details = entry.get("details") or {}
+    metrics = [f"action:{action}"]
+
+    kind, _, outcome = action.rpartition("_")
+    if kind not in COMPARISON_KINDS:
+        return metrics
+    if outcome == "attempt":
+        metrics.append("attempts")
+    elif outcome == "success":
+        metrics.append("comparisons")
+        if "result" in details:
+            metrics.append("result:same" if details["result"] else "result:different")
+        if "total_ms" in details:
+            bound = next(b for b in LATENCY_BUCKETS_MS if details["total_ms"] <= b)
+            metrics.append(f"latency_ms:{bound:g}")
+    elif outcome == "failed":
+        reason = details.get("reason")
+        metrics.append(f"error:{reason if reason in FAILURE_REASONS else 'other'}")
+    elif outcome == "error":
+        metrics.append(f"error:{action}")
+    return metrics
+
+
+class ActivityAggregates:
+    """
+    Per-minute activity counters, written as an ActivityLog sink.
+
+    Sampled events count ``1 / sample_rate`` times, so totals estimate what
+    happened rather than what was kept. Counts not yet snapshotted live in
+    memory; summaries add them to the snapshots of every process.
+    """
+
+    def __init__(
+        self,
+        path,
+        snapshot_seconds=AGGREGATE_SNAPSHOT_SECONDS,
+        max_age_seconds=AGGREGATE_MAX_AGE_SECONDS,
+        journal_mode="wal",
+    ):
+        """
+        Args:
+            path: SQLite database file, created if missing (may be shared
+                with an ActivityStore)
+            snapshot_seconds: How often counts are added to the database
+            max_age_seconds: Minutes older than this are deleted
+            journal_mode: SQLite journal mode (see SQLiteDatabase)
+        """
+        self.path = path
+        self.snapshot_seconds = snapshot_seconds
+        self.max_age_seconds = max_age_seconds
+        self._db = SQLiteDatabase(path, SCHEMA, journal_mode)
+        self._lock = threading.Lock()
+        # Counts copied from a parent process are the parent's to snapshot
+        self._pending = PerProcess(collections.Counter)
+        self._last_snapshot = time.time()
+        self._snapshots = 0
+        self._observed = 0
+
+    def write(self, events):
+        """Count ``(created, entry)`` events, snapshotting if one is due."""
+        with self._lock:
+            pending = self._pending.get()
+            for created, entry in events:
+                weight = 1.0 / (entry.get("sample_rate") or 1.0)
+                minute = int(created // 60)
+                for metric in event_metrics(entry):
+                    pending[minute, metric] += weight
+                self._observed += 1
+            due = time.time() - self._last_snapshot >= self.snapshot_seconds
+        if due:
+            self.snapshot()
+
+    def snapshot(self):
+        """Add the counts gathered since the last snapshot to the database."""
+        with self._lock:
+            pending = self._pending.get()
+            rows = [(m, metric, n) for (m, metric), n in pending.items()]
+            pending.clear()
+            self._last_snapshot = now = time.time()
+        if not rows:
+            return
+        try:
+            with self._db.connect() as conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "INSERT INTO activity_counts (minute, metric, count)"
+                    " VALUES (?, ?, ?) ON CONFLICT (minute, metric)"
+                    " DO UPDATE SET count = count + excluded.count",
+                    rows,
+                )
+                if self.max_age_seconds is not None:
+                    conn.execute(
+                        "DELETE FROM activity_counts WHERE minute < ?",
+                        (int((now - self.max_age_seconds) // 60),),
+                    )
+                conn.execute("COMMIT")
+        except sqlite3.Error:
+            # Keep the counts for the next snapshot rather than lose them
+            with self._lock:
+                for minute, metric, n in rows:
+                    pending[minute, metric] += n
+            raise
+        with self._lock:
+            self._snapshots += 1
+
+    def close(self):
+        """Snapshot what is left, as the activity log shuts down."""
+        self.snapshot()
+
+    def counts(self, since_minute):
+        """``{(minute, metric): count}`` from ``since_minute`` on."""
+        with self._db.connect() as conn:
+            rows = conn.execute(
+                "SELECT minute, metric, count FROM activity_counts WHERE minute >= ?",
+                (since_minute,),
+            ).fetchall()
+        totals = collections.Counter({(m, metric): n for m, metric, n in rows})
+        with self._lock:
+            for (minute, metric), n in self._pending.get().items():
+                if minute >= since_minute:
+                    totals[minute, metric] += n
+        return totals
+
+    def summary(self, minutes=AGGREGATE_WINDOW_MINUTES, now=None):
+        """
+        Dashboard figures over the last ``minutes`` minutes.
+
+        Returns:
+            Dictionary with comparisons per minute (average and series),
+            error rates by reason against comparison attempts, the
+            same/different ratio, the comparison time histogram and counts
+            by action
+        """
+        now = time.time() if now is None else now
+        current = int(now // 60)
+        first = current - minutes + 1
+        totals = collections.Counter()
+        series = collections.defaultdict(collections.Counter)
+        for (minute, metric), n in self.counts(first).items():
+            if minute > current:
+                continue
+            totals[metric] += n
+            if metric == "comparisons" or metric.startswith("error:"):
+                series[minute][metric.partition(":")[0]] += n
+
+        def prefixed(prefix):
+            return {
+                metric[len(prefix) :]: n
+                for metric, n in totals.items()
+                if metric.startswith(prefix)
+            }
+
+        attempts = totals["attempts"]
+        errors = prefixed("error:")
+        same, different = totals["result:same"], totals["result:different"]
+        decided = same + different
+        latency = prefixed("latency_ms:")
+        return {
+            "minutes": minutes,
+            "since": first * 60,
+            "comparisons": round(totals["comparisons"], 2),
+            "comparisons_per_minute": round(totals["comparisons"] / minutes, 2),
+            "per_minute": [
+                {
+                    "minute": minute * 60,
+                    "comparisons": round(series[minute]["comparisons"], 2),
+                    "errors": round(series[minute]["error"], 2),
+                }
+                for minute in range(first, current + 1)
+            ],
+            "attempts": round(attempts, 2),
+            "error_rate": (
+                round(sum(errors.values()) / attempts, 4) if attempts else None
+            ),
+            "errors": {
+                reason: {
+                    "count": round(n, 2),
+                    "rate": round(n / attempts, 4) if attempts else None,
+                }
+                for reason, n in sorted(errors.items(), key=lambda item: -item[1])
+            },
+            "results": {
+                "same": round(same, 2),
+                "different": round(different, 2),
+                "same_ratio": round(same / decided, 4) if decided else None,
+            },
+            "latency_ms": [
+                {"le": f"{bound:g}", "count": round(latency.get(f"{bound:g}", 0), 2)}
+                for bound in LATENCY_BUCKETS_MS
+            ],
+            "actions": {
+                action: round(n, 2) for action, n in sorted(prefixed("action:").items())
+            },
+        }
+
+    def metrics(self):
+        """Events counted and snapshots taken in this process."""
+        with self._lock:
+            return {
+                "path": self.path,
+                "observed": self._observed,
+                "pending": len(self._pending.get()),
+                "snapshots": self._snapshots,
+            }
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Non-blocking user activity logging.
+
+Requests only put their event on an in-memory queue. One background thread
+per process takes events off it in batches and hands each batch to the
+sinks, such as an ActivityLogFile, which writes and flushes it once, so a
+slow disk never holds up a request. High-volume actions (image fetches, page
+visits) can be sampled; kept events then carry their ``sample_rate`` so
+counts can be scaled back up.
+"""
+
+import atexit
+import datetime
+import gzip
+import json
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on POSIX
+    fcntl = None
+
+try:
+    from .per_process import PerProcess
+except ImportError:
+    from per_process import PerProcess
+
+ACTIVITY_QUEUE_SIZE = 10000
+ACTIVITY_BATCH_SIZE = 500
+ACTIVITY_FLUSH_SECONDS = 1.0
+ACTIVITY_LOG_MAX_BYTES = 50 * 1024 * 1024
+ACTIVITY_LOG_MAX_AGE_SECONDS = 24 * 60 * 60.0
+ACTIVITY_LOG_BACKUPS = 14
+
+
+def parse_sample_rates(text):
+    """
+    Parse ``"file_access=0.1,page_visit=0.5"`` into ``{action: rate}``.
+
+    Raises:
+        ValueError: If an entry is malformed or a rate is outside [0, 1]
+    """
+    rates = {}
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        action, _, rate = item.partition("=")
+        rate = float(rate)
+        if not action or not 0.0 <= rate <= 1.0:
+            raise ValueError(f"Invalid sample rate {item!r}")
+        rates[action.strip()] = rate
+    return rates
+
+
+class ActivityLogFile:
+    """
+    Activity events appended to a text file, one ``time - json`` line each.
+
+    The file is rotated once it exceeds ``max_bytes`` or was started more
+    than ``max_age_seconds`` ago; rotated files are gzipped and the oldest
+    beyond ``backup_count`` deleted. Several processes may share the file:
+    each batch is written under an exclusive lock, and a process whose file
+    was rotated by another reopens it before writing.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_bytes=ACTIVITY_LOG_MAX_BYTES,
+        max_age_seconds=ACTIVITY_LOG_MAX_AGE_SECONDS,
+        backup_count=ACTIVITY_LOG_BACKUPS,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.backup_count = backup_count
+        self._file = None
+        self._started = None
+        self._rotations = 0
+
+    @staticmethod
+    def format_line(created, entry):
+        """The line logged for an event, as logging's ``%(asctime)s`` did."""
+        stamp = datetime.datetime.fromtimestamp(created)
+        asctime = (
+            stamp.strftime("%Y-%m-%d %H:%M:%S") + f",{stamp.microsecond // 1000:03d}"
+        )
+        return f"{asctime} - {json.dumps(entry)}\n"
+
+    def _open(self):
+        """Current file, reopened if another process rotated it away."""
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            current = None
+        if self._file is not None:
+            opened = os.fstat(self._file.fileno())
+            if current is not None and (current.st_dev, current.st_ino) == (
+                opened.st_dev,
+                opened.st_ino,
+            ):
+                return self._file
+            self._file.close()
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._started = self._first_line_time()
+        return self._file
+
+    def _first_line_time(self):
+        """When the current file was started, from its first line's time."""
+        with open(self.path, "r", encoding="utf-8") as current:
+            asctime = current.read(23)
+        try:
+            started = datetime.datetime.strptime(asctime, "%Y-%m-%d %H:%M:%S,%f")
+        except ValueError:
+            return None
+        return started.timestamp()
+
+    def _should_rotate(self, size, now):
+        if self.max_bytes and size >= self.max_bytes:
+            return True
+        if self.max_age_seconds and size and self._started is not None:
+            return now - self._started >= self.max_age_seconds
+        return False
+
+    def _rotate(self, now):
+        """Move the current file aside; returns its new path."""
+        stamp = datetime.datetime.fromtimestamp(now).strftime("%Y%m%d-%H%M%S-%f")
+        rotated = f"{self.path}.{stamp}.{os.getpid()}"
+        os.replace(self.path, rotated)
+        self._file.close()
+        self._file = None
+        self._rotations += 1
+        return rotated
+
+    def _compress(self, rotated):
+        with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as out:
+            shutil.copyfileobj(src, out)
+        os.remove(rotated)
+
+        backups = self.rotated_files()
+        for old in backups[: max(0, len(backups) - self.backup_count)]:
+            os.remove(old)
+
+    def rotated_files(self):
+        """Paths of the compressed older files, oldest first."""
+        folder, name = os.path.split(self.path)
+        return sorted(
+            entry.path
+            for entry in os.scandir(folder or ".")
+            if entry.name.startswith(f"{name}.") and entry.name.endswith(".gz")
+        )
+
+    def write(self, events):
+        """Append ``(created, entry)`` events, rotating first if due."""
+        lines = "".join(self.format_line(created, entry) for created, entry in events)
+        rotated = None
+        with open(f"{self.path}.lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            out = self._open()
+            now = time.time()
+            if self._should_rotate(os.fstat(out.fileno()).st_size, now):
+                rotated = self._rotate(now)
+                out = self._open()
+            out.write(lines)
+            out.flush()
+            if self._started is None:
+                self._started = events[0][0]
+        # Compress outside the lock: no process writes to a rotated file
+        if rotated is not None:
+            self._compress(rotated)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def metrics(self):
+        return {"path": self.path, "rotations": self._rotations}
+
+
+class ActivityLog:
+    """
+    Queue of activity events written in batches by a background thread.
+
+    ``log`` never blocks: if the queue is full (the disk cannot keep up) the
+    event is dropped and counted. The writer waits up to ``flush_seconds``
+    after the first event of a batch for more, or until ``batch_size``
+    events are queued, then hands the batch to every sink at once.
+    """
+
+    def __init__(
+        self,
+        sinks,
+        sample_rates=None,
+        queue_size=ACTIVITY_QUEUE_SIZE,
+        batch_size=ACTIVITY_BATCH_SIZE,
+        flush_seconds=ACTIVITY_FLUSH_SECONDS,
+    ):
+        """
+        Args:
+            sinks: Objects with ``write(events)``, each event a tuple of
+                (created time, entry dictionary)
+            sample_rates: Fraction of events kept per action; actions not
+                listed are always kept
+            queue_size: Events queued before new ones are dropped
+            batch_size: Events that trigger an immediate write
+            flush_seconds: Longest time an event waits to be written
+        """
+        self.sinks = list(sinks)
+        self.sample_rates = dict(sample_rates or {})
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = PerProcess(self._start)
+        self._lock = threading.Lock()
+        self._closes_at_exit = False
+        self._logged = 0
+        self._sampled_out = 0
+        self._dropped = 0
+        self._written = 0
+        self._batches = 0
+        self._errors = 0
+
+    def _start(self):
+        # Forked processes inherit the exit handler
+        if not self._closes_at_exit:
+            atexit.register(self.close)
+            self._closes_at_exit = True
+        events = queue.Queue(self.queue_size)
+        threading.Thread(
+            target=self._run, args=(events,), name="activity-log", daemon=True
+        ).start()
+        return events
+
+    def log(self, entry):
+        """
+        Queue an activity entry (with an ``action`` key) to be written.
+
+        Returns:
+            True if the entry was queued, False if it was sampled out or
+            dropped because the queue is full
+        """
+        rate = self.sample_rates.get(entry.get("action"), 1.0)
+        if rate < 1.0:
+            if random.random() >= rate:
+                with self._lock:
+                    self._sampled_out += 1
+                return False
+            entry["sample_rate"] = rate
+
+        try:
+            self._queue.get().put_nowait((time.time(), entry))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            return False
+        with self._lock:
+            self._logged += 1
+        return True
+
+    def flush(self, timeout=5.0):
+        """Block until everything logged so far is written, or ``timeout``."""
+        events = self._queue.current()
+        if events is None:
+            return True
+        written = threading.Event()
+        try:
+            events.put(written, timeout=timeout)
+        except queue.Full:
+            return False
+        return written.wait(timeout)
+
+    def close(self):
+        """Write everything logged so far, then close sinks that can be."""
+        self.flush()
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                try:
+                    sink.close()
+                except Exception as e:
+                    with self._lock:
+                        self._errors += 1
+                    print(f"Activity log close failed: {e}")
+
+    def _collect(self, pending):
+        """Block for the first event, then gather more until full or late."""
+        batch = [pending.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size and not isinstance(
+            batch[-1], threading.Event
+        ):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, pending):
+        while True:
+            batch = self._collect(pending)
+            events = [item for item in batch if not isinstance(item, threading.Event)]
+            if events:
+                for sink in self.sinks:
+                    try:
+                        sink.write(events)
+                    except Exception as e:
+                        with self._lock:
+                            self._errors += 1
+                        print(f"Activity log write failed: {e}")
+                with self._lock:
+                    self._written += len(events)
+                    self._batches += 1
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def metrics(self):
+        """Events queued, written, sampled out and dropped since startup."""
+        events = self._queue.current()
+        with self._lock:
+            report = {
+                "logged": self._logged,
+                "written": self._written,
+                "queued": events.qsize() if events is not None else 0,
+                "sampled_out": self._sampled_out,
+                "dropped": self._dropped,
+                "write_errors": self._errors,
+                "batches": self._batches,
+                "mean_batch_size": round(self._written / (self._batches or 1), 2),
+                "sample_rates": self.sample_rates,
+            }
+        report["sinks"] = [
+            sink.metrics() for sink in self.sinks if hasattr(sink, "metrics")
+        ]
+        return report
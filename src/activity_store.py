@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Indexed store of user activity events for the admin log page.
+
+Events are kept in SQLite with indexes on time, action and IP address, and
+read newest first a page at a time. Pages continue from a cursor (the time
+and id of the last event shown) rather than an offset, so every page, with
+or without filters, is a short index range scan that costs the same however
+much history has been kept.
+"""
+
+import json
+import threading
+import time
+
+try:
+    from .sqlite_db import SQLiteDatabase
+except ImportError:
+    from sqlite_db import SQLiteDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activity (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    action TEXT NOT NULL,
+    ip_address TEXT,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS activity_created ON activity (created);
+CREATE INDEX IF NOT EXISTS activity_action ON activity (action, created);
+CREATE INDEX IF NOT EXISTS activity_ip ON activity (ip_address, created);
+"""
+
+ACTIVITY_PAGE_SIZE = 100
+ACTIVITY_MAX_PAGE_SIZE = 500
+ACTIVITY_MAX_AGE_SECONDS = 90 * 24 * 60 * 60.0
+
+# Old events are deleted at most this often, by the writing thread
+PRUNE_INTERVAL_SECONDS = 60 * 60.0
+
+
+def parse_cursor(cursor):
+    """
+    Split a page cursor into (created, id).
+
+    Raises:
+        ValueError: If the cursor was not returned by ActivityStore.query
+    """
+    created, _, event_id = (cursor or "").partition("_")
+    return float(created), int(event_id)
+
+
+class ActivityStore:
+    """
+    Activity events in a SQLite database, written in batches as an
+    ActivityLog sink. Several processes can write to the same file.
+    """
+
+    def __init__(
+        self, path, max_age_seconds=ACTIVITY_MAX_AGE_SECONDS, journal_mode="wal"
+    ):
+        """
+        Args:
+            path: SQLite database file, created if missing
+            max_age_seconds: Events older than this are deleted (None: keep)
+            journal_mode: SQLite journal mode (see SQLiteDatabase)
+        """
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self._db = SQLiteDatabase(path, SCHEMA, journal_mode)
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self._pruned = 0
+
+    def write(self, events):
+        """Insert ``(created, entry)`` events in one transaction."""
+        rows = [
+            (
+                created,
+                entry.get("action", ""),
+                entry.get("ip_address"),
+                json.dumps(entry),
+            )
+            for created, entry in events
+        ]
+        with self._db.connect() as conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO activity (created, action, ip_address, entry)"
+                " VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        self._prune_if_due()
+
+    def _prune_if_due(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if (
+                self.max_age_seconds is None
+                or now - self._last_prune < PRUNE_INTERVAL_SECONDS
+            ):
+                return
+            self._last_prune = now
+        self.prune(now - self.max_age_seconds)
+
+    def prune(self, before):
+        """Delete events created before ``before``; returns how many."""
+        with self._db.connect() as conn:
+            deleted = conn.execute(
+                "DELETE FROM activity WHERE created < ?", (before,)
+            ).rowcount
+        with self._lock:
+            self._pruned += deleted
+        return deleted
+
+    def query(
+        self,
+        limit=ACTIVITY_PAGE_SIZE,
+        cursor=None,
+        action=None,
+        ip_address=None,
+        since=None,
+        until=None,
+    ):
+        """
+        One page of events, newest first.
+
+        Args:
+            limit: Events per page (at most ACTIVITY_MAX_PAGE_SIZE)
+            cursor: ``next`` of the previous page, to continue after it
+            action: Only events with this action
+            ip_address: Only events from this address
+            since: Only events created at or after this time
+            until: Only events created before this time
+
+        Returns:
+            Dictionary with the ``entries`` (logged dictionaries) and the
+            ``next`` cursor, None on the last page
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        limit = max(1, min(int(limit), ACTIVITY_MAX_PAGE_SIZE))
+        clauses = []
+        params = []
+        if action:
+            clauses.append("action = ?")
+            params.append(action)
+        if ip_address:
+            clauses.append("ip_address = ?")
+            params.append(ip_address)
+        if since is not None:
+            clauses.append("created >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created < ?")
+            params.append(until)
+        if cursor:
+            created, event_id = parse_cursor(cursor)
+            clauses.append("(created < ? OR (created = ? AND id < ?))")
+            params.extend([created, created, event_id])
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._db.connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, created, entry FROM activity{where}"
+                " ORDER BY created DESC, id DESC LIMIT ?",
+                params + [limit + 1],
+            ).fetchall()
+        page = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            event_id, created, _ = page[-1]
+            next_cursor = f"{created!r}_{event_id}"
+        return {
+            "entries": [json.loads(entry) for _, _, entry in page],
+            "next": next_cursor,
+        }
+
+    def actions(self):
+        """Distinct actions logged, for filter menus."""
+        with self._db.connect() as conn:
+            # Jump through the action index one distinct value at a time
+            # rather than scanning every event
+            return [
+                row[0]
+                for row in conn.execute(
+                    "WITH RECURSIVE actions (action) AS ("
+                    " SELECT MIN(action) FROM activity"
+                    " UNION ALL SELECT (SELECT MIN(action) FROM activity"
+                    " WHERE action > actions.action)"
+                    " FROM actions WHERE action IS NOT NULL)"
+                    " SELECT action FROM actions WHERE action IS NOT NULL"
+                )
+            ]
+
+    def metrics(self):
+        """Events kept and deleted by age in this process."""
+        with self._db.connect() as conn:
+            count = conn.execute(
+                "SELECT MAX(id) - MIN(id) + 1 FROM activity"
+            ).fetchone()[0]
+        with self._lock:
+            return {
+                "path": self.path,
+                "approximate_events": count or 0,
+                "pruned": self._pruned,
+                "max_age_seconds": self.max_age_seconds,
+            }
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Batch comparison of image pairs read directly from a zip or tar archive.
+"""
+
+import concurrent.futures
+import io
+import os
+import posixpath
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+
+import numpy as np
+from PIL import Image
+
+try:
+    from .batch import PairTracker, build_pair_result, parse_manifest
+    from .image_validation import (
+        MAX_IMAGE_FRAMES,
+        MAX_IMAGE_PIXELS,
+        ImageRejected,
+        validate_image,
+    )
+except ImportError:
+    from batch import PairTracker, build_pair_result, parse_manifest
+    from image_validation import (
+        MAX_IMAGE_FRAMES,
+        MAX_IMAGE_PIXELS,
+        ImageRejected,
+        validate_image,
+    )
+
+MANIFEST_NAMES = ("pairs.csv", "pairs.jsonl", "manifest.csv", "manifest.jsonl")
+
+# Largest expanded size of one member, and of all members together. A few
+# kilobytes of zip or tar.gz can expand to gigabytes, so both are checked
+# against the sizes the archive declares before anything is decompressed.
+MAX_MEMBER_BYTES = 16 * 1024 * 1024
+MAX_EXPANDED_BYTES = 2 * 1024 * 1024 * 1024
+
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+
+class ArchiveError(ValueError):
+    """The upload is not a readable archive or lacks what the batch needs."""
+
+
+class ArchiveReader:
+    """
+    Random access to the regular files of a zip or tar archive.
+
+    Members are read from the archive's file object on demand. A compressed
+    tar is first decompressed once into a temporary file: seeking backwards
+    in a gzip, bzip2 or xz stream decompresses it again from the start, so
+    reading members out of archive order would otherwise cost a pass over
+    the archive each. Reads are serialized because neither zipfile nor
+    tarfile supports concurrent reads from one file object.
+
+    Archives whose members expand to more than ``max_expanded_bytes`` in
+    total are rejected when opened, and members over ``max_member_bytes``
+    when read, in both cases from the sizes in the archive's headers. Reads
+    stop after ``max_member_bytes`` whatever the headers claim.
+    """
+
+    def __init__(
+        self,
+        fileobj,
+        max_member_bytes=MAX_MEMBER_BYTES,
+        max_expanded_bytes=MAX_EXPANDED_BYTES,
+        spool_dir=None,
+    ):
+        """
+        Args:
+            fileobj: Seekable file object of the upload
+            max_member_bytes: Largest expanded size of one member
+            max_expanded_bytes: Largest expanded size of all members
+            spool_dir: Directory of the temporary file a compressed tar is
+                decompressed into (defaults to the system's)
+
+        Raises:
+            ArchiveError: If the upload is not a zip or tar archive or
+                expands to more than ``max_expanded_bytes``
+        """
+        self.max_member_bytes = max_member_bytes
+        self.max_expanded_bytes = max_expanded_bytes
+        self._lock = threading.Lock()
+        self._spool = None
+        # zipfile needs seekable(), which SpooledTemporaryFile only has
+        # from Python 3.11
+        if not hasattr(fileobj, "seekable"):
+            fileobj.seekable = lambda: True
+        fileobj.seek(0)
+        if zipfile.is_zipfile(fileobj):
+            fileobj.seek(0)
+            try:
+                self._zip = zipfile.ZipFile(fileobj)
+            except zipfile.BadZipFile as e:
+                raise ArchiveError(f"Unreadable zip archive: {e}")
+            self._tar = None
+            self._members = {
+                posixpath.normpath(info.filename): info
+                for info in self._zip.infolist()
+                if not info.is_dir()
+            }
+            self._check_expanded_size(
+                sum(info.file_size for info in self._members.values())
+            )
+            return
+
+        fileobj.seek(0)
+        try:
+            self._tar = tarfile.open(fileobj=fileobj, mode="r:*")
+        except tarfile.TarError:
+            raise ArchiveError("Upload is not a zip or tar archive")
+        self._zip = None
+        # Walk the headers one at a time so a compressed tar is only
+        # decompressed until it is known to be too large
+        self._members = {}
+        expanded = 0
+        try:
+            for member in self._tar:
+                expanded += member.size
+                self._check_expanded_size(expanded)
+                if member.isfile():
+                    self._members[posixpath.normpath(member.name)] = member
+            if self._tar.fileobj is not fileobj:
+                self._spool_decompressed(spool_dir)
+        except (tarfile.TarError, EOFError) as e:
+            self.close()
+            raise ArchiveError(f"Unreadable tar archive: {e}")
+
+    def _spool_decompressed(self, spool_dir):
+        """Read members of a compressed tar from a decompressed copy."""
+        source = self._tar.fileobj
+        # The walk above stopped at the end of the last member; nothing
+        # beyond it is needed
+        remaining = self._tar.offset
+        source.seek(0)
+        self._spool = tempfile.TemporaryFile(dir=spool_dir)
+        while remaining > 0:
+            chunk = source.read(min(remaining, SPOOL_CHUNK_BYTES))
+            if not chunk:
+                raise EOFError("Compressed archive ended early")
+            self._spool.write(chunk)
+            remaining -= len(chunk)
+        self._tar.close()
+        # The members' offsets are the same in the copy
+        self._spool.seek(0)
+        self._tar = tarfile.open(fileobj=self._spool, mode="r:")
+
+    def _check_expanded_size(self, expanded):
+        if expanded > self.max_expanded_bytes:
+            raise ArchiveError(
+                "Archive expands to more than " f"{self.max_expanded_bytes / 1e6:g} MB"
+            )
+
+    def close(self):
+        """Close the archive and remove its decompressed copy, if any."""
+        archive = self._zip if self._zip is not None else self._tar
+        archive.close()
+        if self._spool is not None:
+            self._spool.close()
+
+    def names(self):
+        """Normalized names of the regular files in the archive."""
+        return set(self._members)
+
+    def read(self, name, check=None):
+        """
+        Return a member's bytes.
+
+        Args:
+            name: Member name
+            check: Optional callable given the member's (seekable) stream
+                before it is read in full; it reads only what it needs, such
+                as the headers, and raises to reject the member
+
+        Raises:
+            KeyError: If the member is not in the archive
+            ArchiveError: If it expands to more than ``max_member_bytes``
+        """
+        member = self._members[posixpath.normpath(name)]
+        size = member.file_size if self._zip is not None else member.size
+        if size > self.max_member_bytes:
+            raise ArchiveError(
+                f"{name} expands to {size / 1e6:.1f} MB; "
+                f"archive members may be at most {self.max_member_bytes / 1e6:g} MB"
+            )
+        with self._lock:
+            if self._zip is not None:
+                stream = self._zip.open(member)
+            else:
+                stream = self._tar.extractfile(member)
+            with stream:
+                if check is not None:
+                    check(stream)
+                    stream.seek(0)
+                data = stream.read(self.max_member_bytes + 1)
+        if len(data) > self.max_member_bytes:
+            raise ArchiveError(
+                f"{name} expands to more than {self.max_member_bytes / 1e6:g} MB"
+            )
+        return data
+
+
+def find_manifest(names):
+    """Name of the pairs manifest inside an archive, preferring the top level."""
+    candidates = [name for name in names if posixpath.basename(name) in MANIFEST_NAMES]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda name: (name.count("/"), name))
+
+
+def manifest_format(name):
+    """Manifest format implied by a file name."""
+    ext = os.path.splitext(name)[1].lower()
+    return "jsonl" if ext in (".jsonl", ".ndjson") else "csv"
+
+
+def read_archive_pairs(reader, manifest=None, manifest_name=None):
+    """
+    Parse the image pairs for an archive batch.
+
+    Args:
+        reader: ArchiveReader for the uploaded archive
+        manifest: Manifest text sent alongside the archive, if any
+        manifest_name: File name of that manifest, used to pick CSV or JSONL
+
+    Returns:
+        Pairs as returned by parse_manifest, with archive member names as keys.
+        Names in a manifest stored inside the archive are relative to the
+        manifest's own directory.
+    """
+    base_dir = ""
+    if manifest is None:
+        manifest_name = find_manifest(reader.names())
+        if manifest_name is None:
+            raise ArchiveError(
+                "No manifest uploaded and none of "
+                f"{', '.join(MANIFEST_NAMES)} found in the archive"
+            )
+        manifest = reader.read(manifest_name).decode("utf-8-sig")
+        base_dir = posixpath.dirname(manifest_name)
+
+    pairs = parse_manifest(
+        io.StringIO(manifest), fmt=manifest_format(manifest_name or "")
+    )
+    return [
+        (
+            image1,
+            image2,
+            posixpath.normpath(posixpath.join(base_dir, path1)),
+            posixpath.normpath(posixpath.join(base_dir, path2)),
+        )
+        for image1, image2, path1, path2 in pairs
+    ]
+
+
+def encode_member(
+    reader, comparator, name, max_pixels=MAX_IMAGE_PIXELS, max_frames=MAX_IMAGE_FRAMES
+):
+    """
+    Decode one archive member in memory and return (encodings, message).
+
+    The member's headers are checked from its stream first (see
+    validate_image), so fake or oversized images are reported before the
+    member is expanded, let alone decoded.
+    """
+
+    def check(stream):
+        validate_image(stream, posixpath.basename(name), max_pixels, max_frames)
+
+    try:
+        data = reader.read(name, check)
+    except KeyError:
+        return None, f"Error: {name} is not in the archive"
+    except (ArchiveError, ImageRejected) as e:
+        return None, f"Error: {e}"
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            image = np.array(img.convert("RGB"))
+        face_data = comparator.get_face_data_from_image(image)
+    except Exception as e:
+        return None, f"Error: {e}"
+    return face_data["encodings"], face_data["message"]
+
+
+def stream_archive_batch(
+    reader,
+    pairs,
+    comparator,
+    executor,
+    max_pending=4,
+    max_pixels=MAX_IMAGE_PIXELS,
+    max_frames=MAX_IMAGE_FRAMES,
+):
+    """
+    Compare pairs of archive members, yielding each result as it is ready.
+
+    Every distinct member is decoded and encoded once on ``executor``, with
+    at most ``max_pending`` images in flight, so memory stays bounded however
+    large the archive is. A pair's record is yielded as soon as both of its
+    images are encoded; a final ``{"summary": ...}`` record follows the last
+    pair. Members over ``max_pixels`` or ``max_frames`` fail their pairs
+    without being decoded.
+    """
+    start = time.perf_counter()
+    tracker = PairTracker(pairs)
+    images = iter(tracker.images)
+    pending = {}
+    written = 0
+    matched = 0
+
+    while True:
+        for name in images:
+            future = executor.submit(
+                encode_member, reader, comparator, name, max_pixels, max_frames
+            )
+            pending[future] = name
+            if len(pending) >= max_pending:
+                break
+        if not pending:
+            break
+
+        done, _ = concurrent.futures.wait(
+            pending, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for future in done:
+            name = pending.pop(future)
+            for image1, image2, encoded1, encoded2 in tracker.add(
+                name, future.result()
+            ):
+                record = build_pair_result(
+                    comparator, image1, image2, encoded1, encoded2
+                )
+                written += 1
+                matched += 1 if record["is_same_person"] else 0
+                yield record
+
+    elapsed = time.perf_counter() - start
+    yield {
+        "summary": {
+            "pairs": written,
+            "matches": matched,
+            "images": len(tracker.images),
+            "seconds": round(elapsed, 3),
+            "pairs_per_second": round(written / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+    }
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Batch comparison of many image pairs across a pool of warm worker processes.
+"""
+
+import contextlib
+import csv
+import io
+import itertools
+import json
+import os
+import time
+from multiprocessing import Pool
+
+try:
+    from .face_compare import FaceComparator
+except ImportError:
+    from face_compare import FaceComparator
+
+# Per-process comparator, created once by the pool initializer so every task
+# after the first runs against already-loaded models.
+_worker_comparator = None
+
+
+def parse_manifest(stream, fmt="csv", base_dir=None):
+    """
+    Parse image pairs from an open CSV or JSONL manifest.
+
+    CSV manifests either have an ``image1,image2`` header or use the first two
+    columns of every row. JSONL manifests hold one ``{"image1": ..., "image2":
+    ...}`` object per line.
+
+    Args:
+        stream: Text stream to read the manifest from
+        fmt: Either "csv" or "jsonl"
+        base_dir: Directory that relative image paths are resolved against
+
+    Returns:
+        List of (image1, image2, path1, path2) tuples, where image1/image2 are
+        the names as written in the manifest and path1/path2 are resolved paths
+    """
+    if fmt == "jsonl":
+        rows = []
+        for line in stream:
+            if line.strip():
+                entry = json.loads(line)
+                rows.append((entry["image1"], entry["image2"]))
+    else:
+        rows = []
+        for row in csv.reader(stream):
+            cells = [cell.strip() for cell in row]
+            if len(cells) < 2 or not cells[0] or cells[0].startswith("#"):
+                continue
+            if [cell.lower() for cell in cells[:2]] == ["image1", "image2"]:
+                continue
+            rows.append((cells[0], cells[1]))
+
+    def resolve(name):
+        if base_dir is None or os.path.isabs(name):
+            return name
+        return os.path.join(base_dir, name)
+
+    return [
+        (image1, image2, resolve(image1), resolve(image2)) for image1, image2 in rows
+    ]
+
+
+def read_manifest(manifest_path):
+    """Read image pairs from a CSV or JSONL manifest file on disk."""
+    ext = os.path.splitext(manifest_path)[1].lower()
+    fmt = "jsonl" if ext in (".jsonl", ".ndjson") else "csv"
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    with open(manifest_path, "r", newline="") as f:
+        return parse_manifest(f, fmt=fmt, base_dir=base_dir)
+
+
+def load_completed_pairs(output_path):
+    """Return the (image1, image2) keys already present in a results file."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    with open(output_path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                completed.add((record["image1"], record["image2"]))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                # A partially written last line from an interrupted run
+                continue
+    return completed
+
+
+def build_pair_result(comparator, image1, image2, encoded1, encoded2):
+    """Build the JSON-serialisable result record for one compared pair."""
+    encodings1, message1 = encoded1
+    encodings2, message2 = encoded2
+
+    record = {
+        "image1": image1,
+        "image2": image2,
+        "faces1": len(encodings1) if encodings1 is not None else 0,
+        "faces2": len(encodings2) if encodings2 is not None else 0,
+    }
+
+    if encodings1 is None or encodings2 is None:
+        record.update(
+            {
+                "is_same_person": False,
+                "distance": None,
+                "confidence": 0.0,
+                "matches": 0,
+                "error": "Face detection failed",
+                "message1": message1,
+                "message2": message2,
+            }
+        )
+        return record
+
+    result = comparator.compare_encodings(encodings1, encodings2)
+    record.update(
+        {
+            "is_same_person": result["is_match"],
+            "distance": round(result["best_distance"], 6),
+            "confidence": round(result["confidence"], 2),
+            "matches": len(result["matches"]),
+        }
+    )
+    return record
+
+
+class PairTracker:
+    """
+    Match encoded images up with the pairs waiting on them.
+
+    Keeps each image's encodings only until every pair that uses it has been
+    compared, so memory stays bounded by the pairs still in progress.
+    """
+
+    def __init__(self, pairs):
+        """
+        Args:
+            pairs: (image1, image2, key1, key2) tuples, where the keys identify
+                the images (paths, archive member names)
+        """
+        self.pairs = pairs
+        self.waiting = {}
+        self.references = {}
+        self.encoded = {}
+        for index, (_, _, key1, key2) in enumerate(pairs):
+            for key in {key1, key2}:
+                self.waiting.setdefault(key, []).append(index)
+                self.references[key] = self.references.get(key, 0) + 1
+
+    @property
+    def images(self):
+        """Distinct image keys, in first-use order."""
+        return list(self.references)
+
+    def add(self, key, encoded):
+        """
+        Record an image's (encodings, message) and return the pairs it completes.
+
+        Returns:
+            List of (image1, image2, encoded1, encoded2) tuples ready to compare
+        """
+        self.encoded[key] = encoded
+        ready = []
+        for index in self.waiting.pop(key, []):
+            image1, image2, key1, key2 = self.pairs[index]
+            other = key2 if key == key1 else key1
+            if other not in self.encoded:
+                continue
+
+            ready.append((image1, image2, self.encoded[key1], self.encoded[key2]))
+            for used in {key1, key2}:
+                self.references[used] -= 1
+                if self.references[used] == 0:
+                    del self.encoded[used]
+        return ready
+
+
+def init_worker(tolerance):
+    """Pool initializer: load the detection and encoding models once."""
+    global _worker_comparator
+    _worker_comparator = FaceComparator(tolerance=tolerance)
+
+
+def encode_chunk(paths):
+    """
+    Face data for a chunk of images, in a process set up by init_worker.
+
+    Images that cannot be read get ``encodings`` None and the error as their
+    ``message``, without failing the rest of the chunk.
+    """
+    # The detection cascade narrates every attempt; keep workers quiet.
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            # Faces from the whole chunk share batched descriptor calls.
+            return _worker_comparator.get_face_data_batch(paths)
+        except Exception:
+            # Retry one by one so an unreadable image only fails itself.
+            return [_face_data_or_error(path) for path in paths]
+
+
+def _face_data_or_error(path):
+    try:
+        return _worker_comparator.get_face_data(path)
+    except Exception as e:
+        return {"encodings": None, "locations": [], "message": f"Error: {e}"}
+
+
+def _encode_images(paths):
+    """Pool task: encode a chunk of images, returning (path, enc, msg) tuples."""
+    return [
+        (path, face_data["encodings"], face_data["message"])
+        for path, face_data in zip(paths, encode_chunk(paths))
+    ]
+
+
+def run_batch(
+    pairs, output_path, workers=None, tolerance=0.45, chunk_size=8, log=print
+):
+    """
+    Compare many image pairs, streaming one JSON result per line.
+
+    Every distinct image is encoded exactly once, however many pairs it
+    appears in, and pairs already present in ``output_path`` are skipped so an
+    interrupted run can simply be restarted.
+
+    Args:
+        pairs: Pairs as returned by read_manifest
+        output_path: JSONL file that results are appended to
+        workers: Number of worker processes (defaults to the CPU count)
+        tolerance: Distance threshold for a match
+        chunk_size: Images per worker task; their faces are encoded together
+        log: Callable used for progress output
+
+    Returns:
+        Dictionary with throughput statistics for the run
+    """
+    start = time.perf_counter()
+    completed = load_completed_pairs(output_path)
+    pending = [pair for pair in pairs if (pair[0], pair[1]) not in completed]
+    skipped = len(pairs) - len(pending)
+
+    # Encodings are released as soon as every pair using them is written
+    tracker = PairTracker(pending)
+    images = tracker.images
+    workers = workers or os.cpu_count() or 1
+    log(
+        f"Comparing {len(pending)} pairs ({skipped} already done) "
+        f"across {len(images)} unique images with {workers} worker(s)"
+    )
+
+    comparator = FaceComparator(tolerance=tolerance)
+    written = 0
+    matched = 0
+
+    chunks = [images[i : i + chunk_size] for i in range(0, len(images), chunk_size)]
+    if workers == 1:
+        init_worker(tolerance)
+        results = map(_encode_images, chunks)
+        pool = None
+    else:
+        pool = Pool(workers, initializer=init_worker, initargs=(tolerance,))
+        results = pool.imap_unordered(_encode_images, chunks)
+
+    try:
+        with open(output_path, "a") as out:
+            for path, encodings, message in itertools.chain.from_iterable(results):
+                for image1, image2, encoded1, encoded2 in tracker.add(
+                    path, (encodings, message)
+                ):
+                    record = build_pair_result(
+                        comparator, image1, image2, encoded1, encoded2
+                    )
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                    written += 1
+                    matched += 1 if record["is_same_person"] else 0
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "pairs": written,
+        "skipped": skipped,
+        "matches": matched,
+        "images": len(images),
+        "workers": workers,
+        "seconds": round(elapsed, 3),
+        "pairs_per_second": round(written / elapsed, 2) if elapsed > 0 else 0.0,
+        "images_per_second": round(len(images) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+    log(
+        f"Done: {written} pairs ({matched} same person, {skipped} skipped) "
+        f"from {len(images)} images in {elapsed:.1f}s - "
+        f"{stats['pairs_per_second']} pairs/s, "
+        f"{stats['images_per_second']} images/s"
+    )
+    return stats
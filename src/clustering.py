@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Group every face found in a directory tree by identity.
+"""
+
+import itertools
+import json
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+try:
+    from .batch import encode_chunk, init_worker
+except ImportError:
+    from batch import encode_chunk, init_worker
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".bmp"}
+
+# Closest matches each face is linked to when clustering; bounds the graph
+# at N x MAX_NEIGHBOURS edges however large a cluster is
+MAX_NEIGHBOURS = 32
+
+
+def find_images(root):
+    """Return every image file below ``root`` in a stable order."""
+    images = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                images.append(os.path.join(dirpath, filename))
+    return images
+
+
+def _encode_faces(paths):
+    """Pool task: return (path, encodings, locations, message) per image."""
+    return [
+        (path, data["encodings"], data["locations"], data["message"])
+        for path, data in zip(paths, encode_chunk(paths))
+    ]
+
+
+def encode_directory(root, workers=None, tolerance=0.45, chunk_size=8):
+    """
+    Encode every face in every image below ``root`` in parallel.
+
+    Returns:
+        Tuple of (faces, encodings, failures) where faces is a list of
+        dictionaries describing each face, encodings is an (N, 128) array in
+        the same order and failures lists images without a usable face
+    """
+    images = find_images(root)
+    workers = workers or os.cpu_count() or 1
+    chunks = [images[i : i + chunk_size] for i in range(0, len(images), chunk_size)]
+
+    if workers == 1:
+        init_worker(tolerance)
+        results = map(_encode_faces, chunks)
+        pool = None
+    else:
+        pool = Pool(workers, initializer=init_worker, initargs=(tolerance,))
+        results = pool.imap(_encode_faces, chunks)
+    results = itertools.chain.from_iterable(results)
+
+    faces = []
+    encodings = []
+    failures = []
+    try:
+        for path, image_encodings, locations, message in results:
+            relative_path = os.path.relpath(path, root)
+            if image_encodings is None:
+                failures.append({"path": relative_path, "message": message})
+                continue
+            for index, (encoding, location) in enumerate(
+                zip(image_encodings, locations)
+            ):
+                faces.append(
+                    {
+                        "path": relative_path,
+                        "face_index": index,
+                        "location": [int(coord) for coord in location],
+                    }
+                )
+                encodings.append(encoding)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    encodings = np.array(encodings) if encodings else np.zeros((0, 128))
+    return faces, encodings, failures
+
+
+def _keep_nearest(nearest, nearest_index, nodes, distances, others):
+    """Merge a tile's distances (inf where too far) into each node's nearest."""
+    matched = np.isfinite(distances).any(axis=1)
+    if not matched.any():
+        return
+    nodes, distances = nodes[matched], distances[matched]
+    candidates = np.concatenate([nearest[nodes], distances], axis=1)
+    candidate_index = np.concatenate(
+        [nearest_index[nodes], np.broadcast_to(others, distances.shape)], axis=1
+    )
+    keep = np.argpartition(candidates, nearest.shape[1] - 1, axis=1)
+    keep = keep[:, : nearest.shape[1]]
+    nearest[nodes] = np.take_along_axis(candidates, keep, axis=1)
+    nearest_index[nodes] = np.take_along_axis(candidate_index, keep, axis=1)
+
+
+def similarity_edges(
+    encodings, tolerance, block_size=1024, max_neighbours=MAX_NEIGHBOURS
+):
+    """
+    Link every face to its closest faces within ``tolerance``.
+
+    Distances are computed one ``block_size`` x ``block_size`` tile at a time
+    over the upper triangle, and each tile's matches are merged straight into
+    every face's ``max_neighbours`` closest matches so far. Peak memory is
+    bounded by the block size and N x ``max_neighbours``, never by the
+    matching pairs, which grow with the square of each cluster's size.
+
+    Returns:
+        Tuple of (edges, comparisons) where edges is a sorted list of
+        (i, j, distance) with i < j, linking each face to its (at most)
+        ``max_neighbours`` closest matches
+    """
+    count = len(encodings)
+    squared_norms = np.einsum("ij,ij->i", encodings, encodings)
+    neighbours = max(1, min(max_neighbours, count - 1))
+    nearest = np.full((count, neighbours), np.inf, dtype=np.float32)
+    nearest_index = np.full((count, neighbours), -1, dtype=np.int32)
+    comparisons = 0
+
+    for row_start in range(0, count, block_size):
+        rows = encodings[row_start : row_start + block_size]
+        row_norms = squared_norms[row_start : row_start + block_size]
+        row_ids = np.arange(row_start, row_start + len(rows), dtype=np.int32)
+
+        for col_start in range(row_start, count, block_size):
+            cols = encodings[col_start : col_start + block_size]
+            col_norms = squared_norms[col_start : col_start + block_size]
+            col_ids = np.arange(col_start, col_start + len(cols), dtype=np.int32)
+
+            squared = row_norms[:, None] + col_norms[None, :] - 2.0 * rows @ cols.T
+            distances = np.sqrt(np.maximum(squared, 0.0))
+            distances[distances > tolerance] = np.inf
+
+            if col_start == row_start:
+                distances[np.tril_indices(len(rows))] = np.inf
+                comparisons += len(rows) * (len(rows) - 1) // 2
+            else:
+                comparisons += len(rows) * len(cols)
+
+            _keep_nearest(nearest, nearest_index, row_ids, distances, col_ids)
+            _keep_nearest(nearest, nearest_index, col_ids, distances.T, row_ids)
+
+    # A pair may be among the nearest of both its faces; keep it once
+    pairs = {}
+    nodes, slots = np.nonzero(np.isfinite(nearest))
+    for i, j, distance in zip(
+        nodes.tolist(),
+        nearest_index[nodes, slots].tolist(),
+        nearest[nodes, slots].tolist(),
+    ):
+        pairs[min(i, j), max(i, j)] = distance
+    edges = [(i, j, distance) for (i, j), distance in sorted(pairs.items())]
+
+    return edges, comparisons
+
+
+def chinese_whispers(count, edges, iterations=20, seed=0):
+    """
+    Cluster a similarity graph with the chinese whispers algorithm.
+
+    Each node starts in its own cluster and repeatedly adopts the label with
+    the greatest total edge weight among its neighbours, closer faces
+    weighing more, until labels stop changing.
+
+    Returns:
+        Array of cluster labels, one per node
+    """
+    neighbours = [[] for _ in range(count)]
+    for i, j, distance in edges:
+        weight = 1.0 - distance
+        neighbours[i].append((j, weight))
+        neighbours[j].append((i, weight))
+
+    labels = np.arange(count)
+    rng = np.random.default_rng(seed)
+
+    for _ in range(iterations):
+        changed = False
+        for node in rng.permutation(count):
+            if not neighbours[node]:
+                continue
+            totals = {}
+            for other, weight in neighbours[node]:
+                label = labels[other]
+                totals[label] = totals.get(label, 0.0) + weight
+            best = max(totals, key=lambda label: (totals[label], -label))
+            if best != labels[node]:
+                labels[node] = best
+                changed = True
+        if not changed:
+            break
+
+    return labels
+
+
+def representative_index(encodings, members):
+    """Return the member whose encoding is closest to the cluster centroid."""
+    member_encodings = encodings[members]
+    centroid = member_encodings.mean(axis=0)
+    distances = np.linalg.norm(member_encodings - centroid, axis=1)
+    return members[int(np.argmin(distances))]
+
+
+def build_clusters(faces, encodings, labels):
+    """Group faces by label, largest cluster first, with a representative."""
+    groups = {}
+    for index, label in enumerate(labels):
+        groups.setdefault(int(label), []).append(index)
+
+    clusters = []
+    for members in sorted(groups.values(), key=lambda m: (-len(m), m[0])):
+        representative = representative_index(encodings, members)
+        clusters.append(
+            {
+                "id": len(clusters),
+                "size": len(members),
+                "representative": faces[representative],
+                "members": [faces[index] for index in members],
+            }
+        )
+    return clusters
+
+
+def run_clustering(
+    root,
+    output_path,
+    workers=None,
+    tolerance=0.45,
+    block_size=1024,
+    max_neighbours=MAX_NEIGHBOURS,
+    log=print,
+):
+    """
+    Encode and cluster every face below ``root``, writing the result as JSON.
+
+    Returns:
+        Dictionary with separate encode and cluster throughput statistics
+    """
+    encode_start = time.perf_counter()
+    faces, encodings, failures = encode_directory(
+        root, workers=workers, tolerance=tolerance
+    )
+    encode_seconds = time.perf_counter() - encode_start
+    image_count = len({face["path"] for face in faces}) + len(failures)
+
+    log(
+        f"Encoded {len(faces)} faces from {image_count} images "
+        f"in {encode_seconds:.1f}s ({len(failures)} without faces)"
+    )
+
+    cluster_start = time.perf_counter()
+    edges, comparisons = similarity_edges(
+        encodings, tolerance, block_size, max_neighbours
+    )
+    labels = chinese_whispers(len(faces), edges)
+    clusters = build_clusters(faces, encodings, labels)
+    cluster_seconds = time.perf_counter() - cluster_start
+
+    def rate(amount, seconds):
+        return round(amount / seconds, 2) if seconds > 0 else 0.0
+
+    stats = {
+        "images": image_count,
+        "faces": len(faces),
+        "clusters": len(clusters),
+        "encode_seconds": round(encode_seconds, 3),
+        "encode_images_per_second": rate(image_count, encode_seconds),
+        "encode_faces_per_second": rate(len(faces), encode_seconds),
+        "cluster_seconds": round(cluster_seconds, 3),
+        "cluster_faces_per_second": rate(len(faces), cluster_seconds),
+        "cluster_comparisons_per_second": rate(comparisons, cluster_seconds),
+    }
+
+    with open(output_path, "w") as f:
+        json.dump(
+            {
+                "root": os.path.abspath(root),
+                "tolerance": tolerance,
+                "clusters": clusters,
+                "unclustered_images": failures,
+                "stats": stats,
+            },
+            f,
+            indent=2,
+        )
+
+    log(
+        f"Clustered {len(faces)} faces into {len(clusters)} identities "
+        f"in {cluster_seconds:.1f}s"
+    )
+    log(
+        f"Encode: {stats['encode_images_per_second']} images/s, "
+        f"{stats['encode_faces_per_second']} faces/s - "
+        f"Cluster: {stats['cluster_faces_per_second']} faces/s, "
+        f"{stats['cluster_comparisons_per_second']} comparisons/s"
+    )
+    return stats
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Warm comparison daemon and thin client over a Unix domain socket.
+
+The daemon keeps the face_recognition/dlib models loaded between requests so
+short CLI invocations only pay for the comparison itself. This module only
+imports the standard library at load time, so the client side stays cheap.
+"""
+
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+
+SOCKET_ENV = "FACE_COMPARE_SOCKET"
+DISABLE_ENV = "FACE_COMPARE_NO_DAEMON"
+CONNECT_TIMEOUT = 0.5
+
+
+def private_directory():
+    """Per-user socket directory below the temp directory."""
+    return os.path.join(tempfile.gettempdir(), f"face_compare-{os.getuid()}")
+
+
+def default_socket_path():
+    """
+    Socket path from $FACE_COMPARE_SOCKET, else a per-user socket in
+    $XDG_RUNTIME_DIR or, without one, in the private_directory().
+    """
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or private_directory()
+    return os.path.join(runtime_dir, f"face_compare-{os.getuid()}.sock")
+
+
+def ensure_private_directory(path):
+    """
+    Create ``path`` accessible only to this user, or check that it is.
+
+    The temp directory is shared, so another user could create the socket
+    directory first and have clients send their requests to a daemon of theirs.
+
+    Raises:
+        RuntimeError: If ``path`` is not a directory of this user's that
+            nobody else can use
+    """
+    with contextlib.suppress(FileExistsError):
+        os.mkdir(path, 0o700)
+    info = os.lstat(path)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise RuntimeError(f"{path} must be a directory only this user can access")
+
+
+def request(payload, socket_path=None):
+    """
+    Send one request to a running daemon.
+
+    Returns:
+        The decoded response dictionary, or None when no daemon is reachable
+        so callers can fall back to in-process execution
+    """
+    socket_path = socket_path or default_socket_path()
+    try:
+        # Never send requests (and image paths) to another user's daemon
+        if os.stat(socket_path).st_uid != os.getuid():
+            return None
+    except OSError:
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return None
+        # Comparisons can take a while; only the connect is time-limited.
+        sock.settimeout(None)
+        sock.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+        with sock.makefile("rb") as reader:
+            line = reader.readline()
+        return json.loads(line) if line else None
+    finally:
+        sock.close()
+
+
+def compare_via_daemon(image1_path, image2_path, tolerance=None, socket_path=None):
+    """
+    Ask a running daemon to compare two images.
+
+    Returns:
+        The daemon's response, or None if daemons are disabled via
+        $FACE_COMPARE_NO_DAEMON or none is listening
+    """
+    if os.environ.get(DISABLE_ENV):
+        return None
+
+    payload = {
+        "op": "compare",
+        "image1": os.path.abspath(image1_path),
+        "image2": os.path.abspath(image2_path),
+    }
+    if tolerance is not None:
+        payload["tolerance"] = tolerance
+    return request(payload, socket_path)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Handle one newline-delimited JSON request per connection."""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            response = self.server.dispatch(json.loads(line))
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+
+class ComparisonDaemon(socketserver.UnixStreamServer):
+    """Unix socket server that answers comparisons from a warm FaceComparator."""
+
+    def __init__(self, socket_path=None, tolerance=0.45, comparator_factory=None):
+        if comparator_factory is None:
+            try:
+                from .face_compare import FaceComparator
+            except ImportError:
+                from face_compare import FaceComparator
+            comparator_factory = FaceComparator
+
+        self.socket_path = socket_path or default_socket_path()
+        self.tolerance = tolerance
+        self.comparator_factory = comparator_factory
+        self.comparators = {tolerance: comparator_factory(tolerance=tolerance)}
+
+        if os.path.dirname(self.socket_path) == private_directory():
+            ensure_private_directory(private_directory())
+        self._remove_stale_socket()
+        # Bind with a umask that makes the socket owner-only from the start;
+        # a chmod afterwards leaves a window in which others can connect
+        umask = os.umask(0o177)
+        try:
+            super().__init__(self.socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def _remove_stale_socket(self):
+        """Remove a socket file left behind by a daemon that is gone."""
+        if not os.path.exists(self.socket_path):
+            return
+        if request({"op": "ping"}, self.socket_path) is not None:
+            raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+        os.unlink(self.socket_path)
+
+    def comparator(self, tolerance):
+        """Return a warm comparator for the given tolerance."""
+        if tolerance not in self.comparators:
+            self.comparators[tolerance] = self.comparator_factory(tolerance=tolerance)
+        return self.comparators[tolerance]
+
+    def dispatch(self, message):
+        """Execute one decoded request and return the response dictionary."""
+        op = message.get("op")
+
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid()}
+
+        if op == "shutdown":
+            # shutdown() blocks until serve_forever exits, so hand it off.
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {"ok": True}
+
+        if op == "compare":
+            comparator = self.comparator(message.get("tolerance", self.tolerance))
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                is_same_person, details = comparator.compare_faces(
+                    message["image1"], message["image2"]
+                )
+            return {
+                "ok": True,
+                "is_same_person": is_same_person,
+                "details": details,
+                "output": output.getvalue(),
+            }
+
+        return {"ok": False, "error": f"Unknown operation: {op}"}
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def serve(socket_path=None, tolerance=0.45):
+    """Run a daemon in the foreground until interrupted or told to stop."""
+    server = ComparisonDaemon(socket_path, tolerance=tolerance)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Face comparison daemon listening on {server.socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("Face comparison daemon stopped")
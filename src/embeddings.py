@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Precomputed face embedding files.
+
+An embedding file is a compressed ``.npz`` holding the face encodings and
+boxes found in one image, the detection strategy that found them and the
+encoder settings they were produced with, so a reference photo only has to
+go through the detection cascade once.
+"""
+
+import json
+import os
+
+import numpy as np
+
+FORMAT_VERSION = 1
+EMBEDDING_EXTENSION = ".npz"
+
+
+class EmbeddingMismatchError(ValueError):
+    """Raised when an embedding file was produced with incompatible settings."""
+
+
+def is_embedding_file(path):
+    """Return True if ``path`` names an embedding file rather than an image."""
+    return isinstance(path, (str, os.PathLike)) and str(path).lower().endswith(
+        EMBEDDING_EXTENSION
+    )
+
+
+def save_embeddings(path, face_data, settings, source=None):
+    """
+    Write face data from FaceComparator.get_face_data to an embedding file.
+
+    Args:
+        path: Output ``.npz`` path
+        face_data: Dictionary as returned by get_face_data
+        settings: Encoder settings the encodings were produced with
+        source: Name of the image the faces came from
+
+    Returns:
+        Path to the written file
+    """
+    encodings = face_data["encodings"] or []
+    metadata = {
+        "format_version": FORMAT_VERSION,
+        "settings": settings,
+        "strategy": face_data.get("strategy"),
+        "variation": face_data.get("variation"),
+        "image_size": list(face_data.get("image_size") or []),
+        "source": source,
+        "message": face_data.get("message"),
+    }
+
+    np.savez_compressed(
+        path,
+        encodings=np.array(encodings, dtype=np.float32).reshape(-1, 128),
+        locations=np.array(face_data["locations"], dtype=np.int32).reshape(-1, 4),
+        metadata=np.array(json.dumps(metadata, sort_keys=True)),
+    )
+    return path
+
+
+def load_embeddings(path, settings):
+    """
+    Read an embedding file, rejecting it if it was made with other settings.
+
+    Args:
+        path: ``.npz`` file written by save_embeddings
+        settings: Encoder settings of the comparator that will use the file
+
+    Returns:
+        Dictionary shaped like FaceComparator.get_face_data's result
+
+    Raises:
+        EmbeddingMismatchError: If the format version or settings differ
+    """
+    with np.load(path, allow_pickle=False) as data:
+        metadata = json.loads(str(data["metadata"]))
+        encodings = data["encodings"].astype(np.float64)
+        locations = [tuple(int(v) for v in box) for box in data["locations"]]
+
+    if metadata.get("format_version") != FORMAT_VERSION:
+        raise EmbeddingMismatchError(
+            f"{os.path.basename(path)} has embedding format version "
+            f"{metadata.get('format_version')}, expected {FORMAT_VERSION}"
+        )
+
+    if metadata.get("settings") != settings:
+        differences = sorted(
+            key
+            for key in set(settings) | set(metadata.get("settings") or {})
+            if settings.get(key) != (metadata.get("settings") or {}).get(key)
+        )
+        raise EmbeddingMismatchError(
+            f"{os.path.basename(path)} was encoded with different settings "
+            f"({', '.join(differences)}); re-run the encode command"
+        )
+
+    return {
+        "encodings": list(encodings) if len(encodings) else None,
+        "locations": locations,
+        "strategy": metadata.get("strategy"),
+        "variation": metadata.get("variation"),
+        "image_size": tuple(metadata.get("image_size") or ()) or None,
+        "source": metadata.get("source"),
+        "message": (
+            f"Loaded {len(encodings)} faces from {os.path.basename(path)} "
+            f"({metadata.get('message')})"
+            if len(encodings)
+            else f"No faces stored in {os.path.basename(path)}"
+        ),
+    }
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Dynamic micro-batching of face encoding work across concurrent requests.
+"""
+
+import queue
+import threading
+import time
+
+try:
+    from .per_process import PerProcess
+except ImportError:
+    from per_process import PerProcess
+
+
+class _EncodeRequest:
+    """One caller's face chips waiting to be encoded."""
+
+    def __init__(self, chips):
+        self.chips = chips
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.descriptors = None
+        self.error = None
+
+
+class EncodingScheduler:
+    """
+    Collect face chips from concurrent callers and encode them together.
+
+    A single background thread owns the recognition network. When work
+    arrives it waits up to ``max_wait_ms`` for more callers, or until
+    ``max_batch_size`` chips are queued, then computes all descriptors in one
+    batch and hands each caller back its own slice.
+    """
+
+    def __init__(self, compute_descriptors, max_wait_ms=5.0, max_batch_size=32):
+        """
+        Args:
+            compute_descriptors: Callable taking a list of face chips and
+                returning their descriptors in order
+            max_wait_ms: Longest time the first request in a batch waits for
+                company before the batch is run
+            max_batch_size: Number of chips that triggers an immediate run
+        """
+        self.compute_descriptors = compute_descriptors
+        self.max_wait_ms = max_wait_ms
+        self.max_batch_size = max_batch_size
+
+        self._queue = PerProcess(self._start)
+        self._lock = threading.Lock()
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self._batches = 0
+        self._requests = 0
+        self._chips = 0
+        self._queue_wait = 0.0
+        self._compute_time = 0.0
+        self._batch_sizes = {}
+
+    def _start(self):
+        requests = queue.Queue()
+        threading.Thread(
+            target=self._run, args=(requests,), name="encoding-scheduler", daemon=True
+        ).start()
+        return requests
+
+    def encode(self, chips):
+        """Encode face chips, blocking until their batch has been computed."""
+        if not chips:
+            return []
+
+        pending = _EncodeRequest(list(chips))
+        self._queue.get().put(pending)
+        pending.done.wait()
+
+        if pending.error is not None:
+            raise pending.error
+        return pending.descriptors
+
+    def _collect(self, requests):
+        """Block for the first request, then gather more until full or late."""
+        batch = [requests.get()]
+        size = len(batch[0].chips)
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                pending = requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            size += len(pending.chips)
+
+        return batch
+
+    def _run(self, requests):
+        while True:
+            batch = self._collect(requests)
+            chips = [chip for pending in batch for chip in pending.chips]
+            started = time.perf_counter()
+
+            try:
+                descriptors = self.compute_descriptors(chips)
+                offset = 0
+                for pending in batch:
+                    count = len(pending.chips)
+                    pending.descriptors = descriptors[offset : offset + count]
+                    offset += count
+            except BaseException as e:
+                # Callers re-raise whatever stopped their batch, even a
+                # SystemExit or KeyboardInterrupt, and the thread goes on
+                # serving the callers after them
+                for pending in batch:
+                    pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+            finished = time.perf_counter()
+
+            with self._lock:
+                self._batches += 1
+                self._requests += len(batch)
+                self._chips += len(chips)
+                self._queue_wait += sum(started - p.enqueued for p in batch)
+                self._compute_time += finished - started
+                self._batch_sizes[len(chips)] = self._batch_sizes.get(len(chips), 0) + 1
+
+    def metrics(self):
+        """Return batch fill and latency statistics since startup."""
+        pending = self._queue.current()
+        with self._lock:
+            batches = self._batches or 1
+            requests = self._requests or 1
+            return {
+                "max_wait_ms": self.max_wait_ms,
+                "max_batch_size": self.max_batch_size,
+                "batches": self._batches,
+                "requests": self._requests,
+                "faces": self._chips,
+                "mean_faces_per_batch": round(self._chips / batches, 2),
+                "mean_requests_per_batch": round(self._requests / batches, 2),
+                "mean_batch_fill": round(
+                    self._chips / batches / self.max_batch_size, 3
+                ),
+                "mean_queue_wait_ms": round(self._queue_wait / requests * 1000, 2),
+                "mean_compute_ms": round(self._compute_time / batches * 1000, 2),
+                "batch_size_histogram": {
+                    str(size): count
+                    for size, count in sorted(self._batch_sizes.items())
+                },
+                "queued": pending.qsize() if pending is not None else 0,
+            }
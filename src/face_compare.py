@@ -3,30 +3,180 @@
 Robust face comparison with multiple fallback detection strategies.
 """
 
+import collections
+import hashlib
 import os
+import threading
+import time
 import warnings
 
 import cv2
+import dlib
 import face_recognition
 import numpy as np
 from PIL import Image, ImageEnhance
 
+try:
+    from .embeddings import is_embedding_file, load_embeddings
+except ImportError:
+    from embeddings import is_embedding_file, load_embeddings
+
 warnings.filterwarnings(
     "ignore", category=UserWarning, module="face_recognition_models"
 )
 
+# Aligned face chip geometry used by dlib's face recognition network; these
+# match what face_recognition.face_encodings uses internally.
+FACE_CHIP_SIZE = 150
+FACE_CHIP_PADDING = 0.25
+DESCRIPTOR_BATCH_SIZE = 64
+
+# Fraction of a face box's size added on every side to cover the pixels its
+# landmarks and aligned chip are taken from. A mask outside this margin
+# leaves the face's encoding unchanged.
+FACE_MASK_MARGIN = 0.25
+
+# Variations on which a face's detection and encoding depend only on the
+# pixels around it. They come first in the cascade, so masking elsewhere
+# cannot make it settle on a different variation.
+LOCAL_VARIATIONS = ("Original", "Original resized")
+
+
+def compute_face_descriptors(chips, num_jitters=1, batch_size=DESCRIPTOR_BATCH_SIZE):
+    """
+    Run aligned face chips through dlib's face recognition network.
+
+    Chips are submitted through the batch ``compute_face_descriptor``
+    interface ``batch_size`` at a time.
+
+    Returns:
+        List of 128-d encodings, one per chip, in input order
+    """
+    encoder = face_recognition.api.face_encoder
+    descriptors = []
+    for start in range(0, len(chips), batch_size):
+        batch = encoder.compute_face_descriptor(
+            chips[start : start + batch_size], num_jitters
+        )
+        descriptors.extend(np.array(descriptor) for descriptor in batch)
+    return descriptors
+
+
+_face_cascade = None
+_face_cascade_lock = threading.Lock()
+
+
+def shared_face_cascade():
+    """
+    OpenCV's frontal face Haar cascade, loaded once per process.
+
+    Comparators share it instead of parsing the cascade file each time;
+    detection on it is serialized since OpenCV does not promise it is
+    thread-safe.
+    """
+    global _face_cascade
+    with _face_cascade_lock:
+        if _face_cascade is None:
+            _face_cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+            )
+        return _face_cascade
+
+
+def preload_models():
+    """
+    Load everything comparisons read but never change.
+
+    Importing face_recognition already loaded its dlib detectors, landmark
+    predictors and encoder; this adds the Haar cascade. A pre-forking server
+    calls it in its master process so workers share the loaded models
+    copy-on-write instead of each loading their own.
+    """
+    shared_face_cascade()
+
+
+class DetectionCache:
+    """
+    Face data of recently analyzed images, keyed by image content.
+
+    Shared by FaceComparator instances (e.g. one per web request) so an
+    image compared again, masked or not, is not detected and encoded anew.
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(image):
+        """Content key of a decoded image array."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str(image.shape).encode())
+        digest.update(np.ascontiguousarray(image).data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            face_data = self._entries.get(key)
+            if face_data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return face_data
+
+    def put(self, key, face_data):
+        with self._lock:
+            self._entries[key] = face_data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
 
 class FaceComparator:
-    def __init__(self, tolerance=0.45):
+    # Settings the face encodings depend on. Embedding files record these and
+    # are rejected if they do not match the comparator loading them.
+    ENCODING_SETTINGS = {
+        "encoder": "dlib_face_recognition_resnet_model_v1",
+        "landmarks": "shape_predictor_5_face_landmarks",
+        "num_jitters": 1,
+    }
+
+    def __init__(self, tolerance=0.45, encoder=None, detection_cache=None):
+        """
+        Args:
+            tolerance: Maximum face distance that still counts as a match
+            encoder: Optional callable taking a list of aligned face chips and
+                returning their descriptors, used instead of calling dlib
+                directly (e.g. to share batches across concurrent requests)
+            detection_cache: Optional DetectionCache consulted and filled by
+                get_face_data_from_image
+        """
         self.tolerance = tolerance
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-        )
+        self.encoder = encoder
+        self.detection_cache = detection_cache
+        self.face_cascade = shared_face_cascade()
 
     @staticmethod
     def preprocess_image_variations(image_path):
         """Create multiple variations of an image for better detection."""
         original_image = face_recognition.load_image_file(image_path)
+        return FaceComparator.image_variations(original_image)
+
+    @staticmethod
+    def image_variations(original_image):
+        """Create detection variations of an already decoded RGB image."""
         pil_image = Image.fromarray(original_image)
 
         # Convert RGBA to RGB if needed
@@ -74,6 +224,20 @@ class FaceComparator:
 
         return variations
 
+    @staticmethod
+    def primary_variation(original_image):
+        """The first of image_variations, without computing the others."""
+        if original_image.ndim == 3 and original_image.shape[2] == 4:
+            original_image = original_image[:, :, :3]
+        height, width = original_image.shape[:2]
+        if max(width, height) <= 1200:
+            return "Original", original_image
+        ratio = 1200 / max(width, height)
+        resized = Image.fromarray(original_image).resize(
+            (int(width * ratio), int(height * ratio)), Image.Resampling.LANCZOS
+        )
+        return "Original resized", np.array(resized)
+
     def detect_with_opencv_fallback(self, image_np):
         """Use OpenCV as fallback detection, but be more conservative."""
         try:
@@ -81,14 +245,15 @@ class FaceComparator:
             gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
 
             # Conservative parameters to avoid false positives
-            faces = self.face_cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.1,
-                minNeighbors=6,  # Higher requirement
-                minSize=(80, 80),  # Larger minimum
-                maxSize=(400, 400),  # Reasonable maximum
-                flags=cv2.CASCADE_SCALE_IMAGE,
-            )
+            with _face_cascade_lock:
+                faces = self.face_cascade.detectMultiScale(
+                    gray,
+                    scaleFactor=1.1,
+                    minNeighbors=6,  # Higher requirement
+                    minSize=(80, 80),  # Larger minimum
+                    maxSize=(400, 400),  # Reasonable maximum
+                    flags=cv2.CASCADE_SCALE_IMAGE,
+                )
 
             # Filter by aspect ratio more strictly
             good_faces = []
@@ -103,12 +268,21 @@ class FaceComparator:
         except Exception:
             return []
 
-    def get_face_encodings(self, image_path):
-        """Get face encodings with multiple fallback strategies."""
-        print(f"Analyzing {os.path.basename(image_path)}...")
+    def encoding_settings(self):
+        """Return the settings that encodings from this comparator depend on."""
+        return dict(self.ENCODING_SETTINGS)
+
+    def detect_faces(self, original_image):
+        """
+        Run the detection cascade on a decoded image without encoding.
 
+        Returns:
+            Dictionary with the face ``locations`` (in the coordinates of the
+            variation that found them), the ``strategy``, the ``variation``
+            name and its ``image`` array, or None if no face was found.
+        """
         # Try multiple image variations
-        variations = self.preprocess_image_variations(image_path)
+        variations = self.image_variations(original_image)
 
         for var_name, image_np in variations:
             print(f"  Trying {var_name}...")
@@ -120,13 +294,8 @@ class FaceComparator:
             )
 
             if face_locations:
-                encodings = face_recognition.face_encodings(image_np, face_locations)
-                if encodings:
-                    print(f"    ✓ HOG found {len(encodings)} faces")
-                    return (
-                        encodings,
-                        f"Found {len(encodings)} faces using HOG on {var_name}",
-                    )
+                print(f"    ✓ HOG found {len(face_locations)} faces")
+                return self._detection(face_locations, "HOG", var_name, image_np)
 
         # Strategy 2: face_recognition HOG with more upsampling
         try:
@@ -134,13 +303,8 @@ class FaceComparator:
                 image_np, model="hog", number_of_times_to_upsample=2
             )
             if face_locations:
-                encodings = face_recognition.face_encodings(image_np, face_locations)
-                if encodings:
-                    print(f"    ✓ HOG 2x found {len(encodings)} faces")
-                    return (
-                        encodings,
-                        f"Found {len(encodings)} faces using HOG 2x on {var_name}",
-                    )
+                print(f"    ✓ HOG 2x found {len(face_locations)} faces")
+                return self._detection(face_locations, "HOG 2x", var_name, image_np)
         except Exception as e:
             print(f"    HOG 2x failed: {e}")
 
@@ -148,27 +312,375 @@ class FaceComparator:
 
             face_locations = face_recognition.face_locations(image_np, model="cnn")
             if face_locations:
-                encodings = face_recognition.face_encodings(image_np, face_locations)
-                if encodings:
-                    print(f"    ✓ CNN found {len(encodings)} faces")
-                    return (
-                        encodings,
-                        f"Found {len(encodings)} faces using CNN on {var_name}",
-                    )
+                print(f"    ✓ CNN found {len(face_locations)} faces")
+                return self._detection(face_locations, "CNN", var_name, image_np)
 
         # Strategy 4: OpenCV fallback (conservative)
         opencv_faces = self.detect_with_opencv_fallback(image_np)
         if opencv_faces:
+            print(f"    ✓ OpenCV fallback found {len(opencv_faces)} faces")
+            return self._detection(opencv_faces, "OpenCV fallback", var_name, image_np)
+
+        return None
+
+    @staticmethod
+    def _detection(locations, strategy, var_name, image_np):
+        """Package a cascade hit."""
+        return {
+            "locations": [tuple(int(v) for v in location) for location in locations],
+            "strategy": strategy,
+            "variation": var_name,
+            "image": image_np,
+        }
+
+    @staticmethod
+    def _face_data(detection, encodings, image_size):
+        """Combine a detection with its encodings, boxes in original pixels."""
+        scale = image_size[0] / detection["image"].shape[1]
+        boxes = [
+            tuple(int(round(coord * scale)) for coord in location)
+            for location in detection["locations"]
+        ]
+        return {
+            "encodings": encodings,
+            "locations": boxes,
+            "strategy": detection["strategy"],
+            "variation": detection["variation"],
+            "image_size": image_size,
+            "message": (
+                f"Found {len(encodings)} faces using {detection['strategy']} "
+                f"on {detection['variation']}"
+            ),
+        }
+
+    @staticmethod
+    def _no_face_data(image_size):
+        return {
+            "encodings": None,
+            "locations": [],
+            "strategy": None,
+            "variation": None,
+            "image_size": image_size,
+            "message": "No faces detected with any method or image variation",
+        }
+
+    @staticmethod
+    def extract_face_chips(image_np, locations):
+        """Return an aligned 150x150 chip for each face box in an image."""
+        chips = []
+        for top, right, bottom, left in locations:
+            shape = face_recognition.api.pose_predictor_5_point(
+                image_np, dlib.rectangle(left, top, right, bottom)
+            )
+            chips.append(
+                dlib.get_face_chip(
+                    image_np, shape, size=FACE_CHIP_SIZE, padding=FACE_CHIP_PADDING
+                )
+            )
+        return chips
+
+    def compute_descriptors(self, chips, batch_size=DESCRIPTOR_BATCH_SIZE):
+        """Compute encodings for face chips, through ``encoder`` if one is set."""
+        if not chips:
+            return []
+        if self.encoder is not None:
+            return self.encoder(chips)
+        return compute_face_descriptors(
+            chips, self.ENCODING_SETTINGS["num_jitters"], batch_size
+        )
+
+    def encode_faces_batch(self, items, batch_size=DESCRIPTOR_BATCH_SIZE):
+        """
+        Compute face encodings for many images with batched dlib calls.
+
+        Landmarks are found per face, each face is cropped to an aligned
+        150x150 chip and the chips from all images are pushed through dlib's
+        batch ``compute_face_descriptor`` ``batch_size`` at a time, instead of
+        one network invocation per image.
+
+        Args:
+            items: Iterable of (image array, face locations) pairs, locations
+                as (top, right, bottom, left) boxes in that image's pixels
+            batch_size: Maximum number of face chips per descriptor batch
+
+        Returns:
+            List with one list of 128-d encodings per item, in input order
+        """
+        chips = []
+        owners = []
+        results = []
+
+        for index, (image_np, locations) in enumerate(items):
+            results.append([])
+            image_chips = self.extract_face_chips(image_np, locations)
+            chips.extend(image_chips)
+            owners.extend([index] * len(image_chips))
+
+        descriptors = self.compute_descriptors(chips, batch_size)
+        for owner, descriptor in zip(owners, descriptors):
+            results[owner].append(descriptor)
+
+        return results
+
+    def encode_faces(self, image_np, locations):
+        """Compute the encodings for the given faces in one image."""
+        return self.encode_faces_batch([(image_np, locations)])[0]
+
+    def get_face_data(self, image_path):
+        """
+        Run the detection cascade and return encodings with their context.
+
+        ``image_path`` may also be an embedding file written by the encode
+        command, in which case its stored faces are returned without running
+        detection.
+
+        Returns:
+            Dictionary with the face ``encodings`` (None if no face was
+            found), their ``locations`` as (top, right, bottom, left) boxes in
+            original image pixels, the ``strategy`` and image ``variation``
+            that found them, the original ``image_size`` and a ``message``.
+        """
+        return self.get_face_data_batch([image_path])[0]
+
+    def get_face_data_from_image(self, original_image, timings=None):
+        """
+        Run get_face_data on an already decoded RGB image array.
+
+        If a ``timings`` dictionary is given, the milliseconds spent in
+        ``detect`` and ``encode`` are stored in it.
+        """
+        cache_key = None
+        if self.detection_cache is not None:
+            cache_key = self.detection_cache.key(original_image)
+            face_data = self.detection_cache.get(cache_key)
+            if face_data is not None:
+                return face_data
+
+        image_size = (original_image.shape[1], original_image.shape[0])
+        started = time.perf_counter()
+        detection = self.detect_faces(original_image)
+        detected = time.perf_counter()
+        if detection is None:
+            face_data = self._no_face_data(image_size)
+        else:
+            encodings = self.encode_faces(detection["image"], detection["locations"])
+            face_data = self._face_data(detection, encodings, image_size)
+
+        if timings is not None:
+            timings["detect"] = (detected - started) * 1000
+            timings["encode"] = (time.perf_counter() - detected) * 1000
+        if cache_key is not None:
+            self.detection_cache.put(cache_key, face_data)
+        return face_data
 
-            encodings = face_recognition.face_encodings(image_np, opencv_faces)
-            if encodings:
-                print(f"    ✓ OpenCV fallback found {len(encodings)} faces")
-                return (
-                    encodings,
-                    f"Found {len(encodings)} faces using OpenCV fallback on {var_name}",
+    @staticmethod
+    def face_touches_mask(box, mask, margin=FACE_MASK_MARGIN):
+        """Whether a (top, right, bottom, left) box, plus margin, overlaps a mask."""
+        top, right, bottom, left = box
+        pad_y = int(round((bottom - top) * margin))
+        pad_x = int(round((right - left) * margin))
+        height, width = mask.shape
+        region = mask[
+            max(0, top - pad_y) : min(height, bottom + pad_y),
+            max(0, left - pad_x) : min(width, right + pad_x),
+        ]
+        return bool(region.any())
+
+    def get_masked_face_data(
+        self,
+        original_image,
+        mask,
+        timings=None,
+        unmasked=None,
+        mask_color=(0, 0, 0),
+        redetect=True,
+    ):
+        """
+        Face data for an image with ``mask`` painted over, reusing what the
+        unmasked image already gave.
+
+        When no face box of the unmasked image, widened by FACE_MASK_MARGIN,
+        touches the mask, the masked image has the same faces and encodings
+        and nothing is computed. When it touches some faces, the first
+        cascade step runs again on the masked image, but only the faces whose
+        box the mask touches (or that moved) are encoded; faces found at
+        their old box and clear of the mask keep their encodings. Everything
+        is recomputed when the mask touches every face, since the cascade may
+        then have to look further, and for faces from a variation that
+        depends on the whole image.
+
+        With ``redetect=False`` no detection runs at all: the faces the mask
+        touches are re-encoded at their unmasked boxes. That is a quick
+        estimate for live previews, as a heavily masked face might no longer
+        be detected by the full analysis.
+
+        Args:
+            original_image: Decoded RGB image array, unmasked
+            mask: Boolean array of the image's height and width, True where
+                the image is masked
+            timings: Optional dictionary receiving ``detect``/``encode`` ms
+            unmasked: Face data of the unmasked image, if known; otherwise
+                it is looked up in the detection cache, and without it the
+                masked image is analyzed from scratch
+            mask_color: RGB color painted over masked pixels
+            redetect: Whether to detect faces again when the mask touches
+                some of them
+
+        Returns:
+            Face data as returned by get_face_data_from_image, with
+            ``reused`` set to the number of encodings kept from the unmasked
+            image
+        """
+        if unmasked is None and self.detection_cache is not None:
+            unmasked = self.detection_cache.get(
+                self.detection_cache.key(original_image)
+            )
+        masked_image = original_image.copy()
+        masked_image[mask] = mask_color
+        if (
+            unmasked is None
+            or unmasked["encodings"] is None
+            or unmasked["strategy"] != "HOG"
+            or unmasked["variation"] not in LOCAL_VARIATIONS
+        ):
+            return dict(self.get_face_data_from_image(masked_image, timings), reused=0)
+
+        touched = [self.face_touches_mask(box, mask) for box in unmasked["locations"]]
+        if not any(touched):
+            return dict(unmasked, reused=len(unmasked["encodings"]))
+
+        started = time.perf_counter()
+        var_name, image_np = self.primary_variation(masked_image)
+        # Boxes are compared in variation pixels, where they were found
+        scale = image_np.shape[1] / original_image.shape[1]
+        if not redetect:
+            boxes = [
+                tuple(int(round(v * scale)) for v in box)
+                for box in unmasked["locations"]
+            ]
+            encoded = iter(
+                self.encode_faces(
+                    image_np, [box for box, hit in zip(boxes, touched) if hit]
                 )
+            )
+            encodings = [
+                next(encoded) if hit else encoding
+                for encoding, hit in zip(unmasked["encodings"], touched)
+            ]
+            if timings is not None:
+                timings["encode"] = (time.perf_counter() - started) * 1000
+            detection = self._detection(boxes, "HOG", var_name, image_np)
+            face_data = self._face_data(detection, encodings, unmasked["image_size"])
+            face_data["reused"] = touched.count(False)
+            return face_data
+
+        if all(touched):
+            # Nothing to reuse, and the cascade may have to look further
+            return dict(self.get_face_data_from_image(masked_image, timings), reused=0)
+
+        # The first step of the cascade, which found the unmasked faces
+        locations = face_recognition.face_locations(
+            image_np, model="hog", number_of_times_to_upsample=1
+        )
+        detected = time.perf_counter()
+        if not locations:
+            return dict(self.get_face_data_from_image(masked_image, timings), reused=0)
+
+        previous = {
+            tuple(int(round(v * scale)) for v in box): encoding
+            for box, encoding, hit in zip(
+                unmasked["locations"], unmasked["encodings"], touched
+            )
+            if not hit
+        }
+        locations = [tuple(int(v) for v in location) for location in locations]
+        changed = [location for location in locations if location not in previous]
+        new_encodings = dict(zip(changed, self.encode_faces(image_np, changed)))
+        encodings = [
+            previous[location] if location in previous else new_encodings[location]
+            for location in locations
+        ]
+
+        if timings is not None:
+            timings["detect"] = (detected - started) * 1000
+            timings["encode"] = (time.perf_counter() - detected) * 1000
+        detection = self._detection(locations, "HOG", var_name, image_np)
+        face_data = self._face_data(detection, encodings, unmasked["image_size"])
+        face_data["reused"] = len(locations) - len(changed)
+        return face_data
+
+    def get_face_data_batch(self, image_paths, batch_size=DESCRIPTOR_BATCH_SIZE):
+        """
+        Run get_face_data over many images, batching the encoding step.
+
+        Detection still runs image by image, but the faces found across all
+        images are encoded together through encode_faces_batch.
+        """
+        results = [None] * len(image_paths)
+        pending = []
+
+        for index, image_path in enumerate(image_paths):
+            if is_embedding_file(image_path):
+                results[index] = load_embeddings(image_path, self.encoding_settings())
+                print(results[index]["message"])
+                continue
+
+            print(f"Analyzing {os.path.basename(image_path)}...")
+            original_image = face_recognition.load_image_file(image_path)
+            image_size = (original_image.shape[1], original_image.shape[0])
+
+            detection = self.detect_faces(original_image)
+            if detection is None:
+                results[index] = self._no_face_data(image_size)
+            else:
+                pending.append((index, detection, image_size))
+
+        encodings = self.encode_faces_batch(
+            [
+                (detection["image"], detection["locations"])
+                for _, detection, _ in pending
+            ],
+            batch_size=batch_size,
+        )
+        for (index, detection, image_size), face_encodings in zip(pending, encodings):
+            results[index] = self._face_data(detection, face_encodings, image_size)
+
+        return results
+
+    def get_face_encodings(self, image_path):
+        """Get face encodings with multiple fallback strategies."""
+        face_data = self.get_face_data(image_path)
+        return face_data["encodings"], face_data["message"]
+
+    def compare_encodings(self, encodings1, encodings2):
+        """Compare two sets of face encodings without any console output."""
+        best_distance = float("inf")
+        matches = []
+
+        distance_matrix = []
+
+        for i, enc1 in enumerate(encodings1):
+            distances = face_recognition.face_distance(encodings2, enc1)
+            distance_matrix.append([float(distance) for distance in distances])
+            for j, distance in enumerate(distances):
+                if distance <= self.tolerance:
+                    matches.append((i + 1, j + 1, float(distance)))
+                if distance < best_distance:
+                    best_distance = float(distance)
 
-        return None, "No faces detected with any method or image variation"
+        confidence = (
+            max(0, (self.tolerance - best_distance) / self.tolerance * 100)
+            if best_distance != float("inf")
+            else 0
+        )
+
+        return {
+            "is_match": len(matches) > 0,
+            "best_distance": best_distance,
+            "confidence": confidence,
+            "matches": matches,
+            "distances": distance_matrix,
+        }
 
     def compare_faces(self, image1_path, image2_path):
         """Compare faces between two images with robust detection."""
@@ -199,24 +711,11 @@ class FaceComparator:
 
         print(f"Comparing {len(encodings1)} faces vs {len(encodings2)} faces...")
 
-        # Compare all face combinations
-        best_distance = float("inf")
-        matches = []
-
-        for i, enc1 in enumerate(encodings1):
-            for j, enc2 in enumerate(encodings2):
-                distance = face_recognition.face_distance([enc1], enc2)[0]
-                if distance <= self.tolerance:
-                    matches.append((i + 1, j + 1, distance))
-                if distance < best_distance:
-                    best_distance = distance
-
-        is_match = len(matches) > 0
-        confidence = (
-            max(0, (self.tolerance - best_distance) / self.tolerance * 100)
-            if best_distance != float("inf")
-            else 0
-        )
+        result = self.compare_encodings(encodings1, encodings2)
+        is_match = result["is_match"]
+        best_distance = result["best_distance"]
+        confidence = result["confidence"]
+        matches = result["matches"]
 
         print("\n" + "=" * 60)
         print("FINAL RESULT:")
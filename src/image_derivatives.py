@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Display-sized copies of uploaded images for the result page.
+
+The originals are often multi-megabyte phone photos shown in a box a few
+hundred pixels wide. Each image gets a small WebP (or JPEG, for browsers
+without WebP) rendered once and kept next to it in the upload store. When the
+image is still decoded in memory the derivative starts from those pixels;
+otherwise JPEGs are decoded at a reduced scale, so the full-size pixels are
+never produced just to be thrown away.
+"""
+
+import contextlib
+import math
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+try:
+    from .single_flight import SingleFlight
+except ImportError:
+    from single_flight import SingleFlight
+
+DISPLAY_MAX_SIZE = 800
+DERIVATIVE_QUALITY = 80
+
+# Derivative extensions, by preference, with their Pillow format and MIME type
+DERIVATIVE_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpg": ("JPEG", "image/jpeg"),
+}
+
+# How to turn each EXIF orientation upright, as browsers do for the original
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+EXIF_ORIENTATION = 0x0112
+
+
+def decode_reduced(path, max_size):
+    """
+    Decode an image file to an RGB array at least ``max_size`` on its long
+    edge, letting the JPEG decoder skip detail that would be scaled away.
+
+    Returns:
+        Tuple of (RGB array, EXIF orientation)
+    """
+    with Image.open(path) as img:
+        orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+        # draft keeps both sides at least as large as asked, so ask for the
+        # size the image will have once it fits max_size
+        ratio = min(1.0, max_size / max(img.size))
+        img.draft("RGB", (math.ceil(img.width * ratio), math.ceil(img.height * ratio)))
+        return np.array(img.convert("RGB")), orientation
+
+
+def render_derivative(image, max_size, orientation=1):
+    """
+    Downscale a decoded RGB image to fit ``max_size`` and turn it upright.
+
+    Args:
+        image: RGB array of the image, at any size
+        max_size: Longest edge of the result in pixels
+        orientation: EXIF orientation of the original file
+
+    Returns:
+        PIL Image of the derivative
+    """
+    # One resize, whatever the input's size: thumbnail reduces large images
+    # in cheap integer steps before the final LANCZOS pass
+    derivative = Image.fromarray(image)
+    derivative.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    if orientation in ORIENTATION_TRANSPOSE:
+        derivative = derivative.transpose(ORIENTATION_TRANSPOSE[orientation])
+    return derivative
+
+
+class DerivativeMaker:
+    """
+    Display derivatives of the images in an UploadStore, each rendered once.
+
+    Concurrent requests for a derivative that is not on disk yet share one
+    rendering. Files are written under a temporary name and renamed into
+    place, so several processes may render the same one without readers
+    ever seeing a partial file.
+    """
+
+    def __init__(self, store, max_size=DISPLAY_MAX_SIZE, quality=DERIVATIVE_QUALITY):
+        """
+        Args:
+            store: UploadStore holding the originals and their derivatives
+            max_size: Longest edge of the derivatives in pixels
+            quality: WebP and JPEG encoder quality
+        """
+        self.store = store
+        self.max_size = max_size
+        self.quality = quality
+        self.name = f"display{max_size}"
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._rendered = 0
+        self._hits = 0
+        self._original_bytes = 0
+        self._derivative_bytes = 0
+
+    def _render(self, stored, extension, path, decoded):
+        image = decoded() if decoded is not None else None
+        if image is None:
+            image, orientation = decode_reduced(stored.path, self.max_size)
+        else:
+            with Image.open(stored.path) as original:
+                orientation = original.getexif().get(EXIF_ORIENTATION, 1)
+        derivative = render_derivative(image, self.max_size, orientation)
+
+        partial = self.store.partial_path()
+        try:
+            derivative.save(
+                partial, DERIVATIVE_FORMATS[extension][0], quality=self.quality
+            )
+            os.replace(partial, path)
+        except Exception:
+            # Saving may have failed before the file was created
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(partial)
+            raise
+        with self._lock:
+            self._rendered += 1
+            self._original_bytes += stored.size
+            self._derivative_bytes += os.path.getsize(path)
+        return path
+
+    def get(self, stored, extension, decoded=None):
+        """
+        Path of a stored image's derivative, rendering it if needed.
+
+        Args:
+            stored: StoredUpload of the original
+            extension: Key of DERIVATIVE_FORMATS
+            decoded: Callable returning the original already decoded to an
+                RGB array, or None if it is not at hand; called only when the
+                derivative has to be rendered
+
+        Returns:
+            Path of the derivative file
+        """
+        path = self.store.derivative_path(stored.digest, self.name, extension)
+        if os.path.exists(path):
+            with self._lock:
+                self._hits += 1
+            return path
+        path, _ = self._flights.do(path, self._render, stored, extension, path, decoded)
+        return path
+
+    def metrics(self):
+        """Derivatives rendered and reused, and their size against the originals."""
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "rendered": self._rendered,
+                "hits": self._hits,
+                "original_bytes": self._original_bytes,
+                "derivative_bytes": self._derivative_bytes,
+            }
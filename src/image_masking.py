@@ -77,7 +77,22 @@ class ImageMasker:
         """
         # Load image to get dimensions
         with Image.open(image_path) as img:
-            width, height = img.size
+            return self.create_mask_for_size(img.size, rectangles)
+
+    def create_mask_for_size(
+        self, size: Tuple[int, int], rectangles: List[Dict[str, float]]
+    ) -> np.ndarray:
+        """
+        Create a binary mask from rectangle data for an image of a given size.
+
+        Args:
+            size: Image (width, height) in pixels
+            rectangles: List of rectangle dictionaries with normalized coordinates
+
+        Returns:
+            Binary mask as numpy array (True for masked areas, False for unmasked)
+        """
+        width, height = size
 
         # Create mask (False = unmasked, True = masked)
         mask = np.zeros((height, width), dtype=bool)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Uploaded images kept decoded in memory so they can be compared many times.
+
+Interactive masking compares the same two images over and over with
+different rectangles. Uploading them once and referring to them by id saves
+sending, saving and decoding both images on every round, and the faces found
+on the unmasked images are kept alongside, so comparing without masks again
+costs only the distance computation.
+"""
+
+import collections
+import threading
+import time
+
+try:
+    from .jobs import detect_images, face_summary, finish_comparison
+except ImportError:
+    from jobs import detect_images, face_summary, finish_comparison
+
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+IMAGE_CACHE_TTL_SECONDS = 30 * 60.0
+
+
+class ImageHandle:
+    """One uploaded image, decoded, with its unmasked face data once known."""
+
+    def __init__(self, image_id, filename, path, image):
+        self.id = image_id
+        self.filename = filename
+        self.path = path
+        # Shared by concurrent comparisons, which must work on copies
+        image.setflags(write=False)
+        self.image = image
+        self.face_data = None
+        self.last_used = time.monotonic()
+
+    @property
+    def size(self):
+        """Image (width, height) in pixels."""
+        return self.image.shape[1], self.image.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.image.nbytes
+
+    def describe(self):
+        """Serializable summary returned to the client."""
+        width, height = self.size
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "width": width,
+            "height": height,
+        }
+
+
+class ImageCache:
+    """
+    Least recently used cache of ImageHandles bounded by memory and idle time.
+
+    Handles that have not been used for ``ttl_seconds`` are dropped, as are
+    the least recently used ones once the decoded images together would take
+    more than ``max_bytes``.
+    """
+
+    def __init__(
+        self, max_bytes=IMAGE_CACHE_MAX_BYTES, ttl_seconds=IMAGE_CACHE_TTL_SECONDS
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._handles = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _evict(self, image_id):
+        handle = self._handles.pop(image_id)
+        self._bytes -= handle.nbytes
+        self._evictions += 1
+
+    def _expire(self, now):
+        while self._handles:
+            image_id, handle = next(iter(self._handles.items()))
+            if now - handle.last_used < self.ttl_seconds:
+                break
+            self._evict(image_id)
+
+    def put(self, image_id, filename, path, image):
+        """
+        Cache a decoded image under ``image_id``, replacing any earlier one.
+
+        Raises:
+            ValueError: If the image alone is larger than the cache
+        """
+        handle = ImageHandle(image_id, filename, path, image)
+        if handle.nbytes > self.max_bytes:
+            raise ValueError(
+                f"Decoded image needs {handle.nbytes} bytes, more than the "
+                f"{self.max_bytes} byte image cache"
+            )
+        with self._lock:
+            if image_id in self._handles:
+                self._bytes -= self._handles.pop(image_id).nbytes
+            self._expire(handle.last_used)
+            while self._bytes + handle.nbytes > self.max_bytes:
+                self._evict(next(iter(self._handles)))
+            self._handles[image_id] = handle
+            self._bytes += handle.nbytes
+        return handle
+
+    def get(self, image_id):
+        """Return the cached handle for an id, or None if it is not cached."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            handle = self._handles.get(image_id)
+            if handle is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            handle.last_used = now
+            self._handles.move_to_end(image_id)
+            return handle
+
+    def metrics(self):
+        """Snapshot of cache occupancy and hit counts."""
+        with self._lock:
+            return {
+                "images": len(self._handles),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+
+def unmasked_face_data(handle, comparator, flights):
+    """
+    Faces on a handle's unmasked image, found once however many ask at once.
+
+    Upload-ahead encoding and the comparison that follows it may ask for the
+    same image concurrently; the later caller waits for the running
+    detection instead of starting its own.
+
+    Args:
+        handle: ImageHandle whose ``face_data`` is filled in
+        comparator: FaceComparator used if the faces are not known yet
+        flights: SingleFlight shared by everything preparing handles
+
+    Returns:
+        The handle's face data
+    """
+    if handle.face_data is None:
+
+        def find():
+            if handle.face_data is None:
+                handle.face_data = comparator.get_face_data_from_image(handle.image)
+            return handle.face_data
+
+        flights.do(handle.id, find)
+    return handle.face_data
+
+
+def compare_handles(handles, rectangles, tolerance, comparator, masker, emit):
+    """
+    Compare two cached images, masking the same rectangles on both.
+
+    Masks are applied to copies of the decoded arrays in memory. The faces
+    found on each unmasked image are kept on its handle: rounds without
+    rectangles reuse them as they are, and masked rounds keep the encodings
+    of the faces the masks leave clear.
+
+    Args:
+        handles: The two ImageHandles to compare
+        rectangles: Parsed rectangles (see ImageMasker.parse_rectangle_data)
+        tolerance: Tolerance recorded in the result
+        comparator: FaceComparator configured with that tolerance
+        masker: ImageMasker used to build and apply the masks
+        emit: Callable ``emit(stage, data)`` invoked after each stage
+
+    Returns:
+        Result dictionary in the same format as run_comparison_job
+    """
+    started = time.perf_counter()
+    timings = {}
+
+    images = [handle.image for handle in handles]
+    mask_stats = None
+    masks = None
+    if rectangles:
+        masks = [
+            masker.create_mask_for_size(handle.size, rectangles) for handle in handles
+        ]
+        mask_stats = masker.get_mask_statistics(masks[0])
+        timings["mask"] = (time.perf_counter() - started) * 1000
+
+    emit(
+        "decoded",
+        {
+            f"image{i + 1}": {"width": image.shape[1], "height": image.shape[0]}
+            for i, image in enumerate(images)
+        },
+    )
+    if rectangles:
+        # Later rounds with other masks reuse the unmasked faces, so find
+        # them first if this is the image's first round
+        for i, handle in enumerate(handles):
+            if handle.face_data is None:
+                unmasked_timings = {}
+                handle.face_data = comparator.get_face_data_from_image(
+                    handle.image, unmasked_timings
+                )
+                for stage, ms in unmasked_timings.items():
+                    timings[f"unmasked_{stage}_image{i + 1}"] = ms
+    known = [handle.face_data for handle in handles]
+    face_data = detect_images(images, comparator, emit, timings, known, masks)
+    if not rectangles:
+        for handle, data in zip(handles, face_data):
+            handle.face_data = data
+
+    result = {
+        "tolerance": tolerance,
+        "images": [handle.id for handle in handles],
+        "faces": [face_summary(data) for data in face_data],
+        "mask_applied": bool(rectangles),
+        "mask_stats": mask_stats,
+    }
+    return finish_comparison(result, face_data, comparator, emit, timings, started)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Fast checks of uploaded images before they are decoded.
+
+Only the headers are read: the format from the leading magic bytes and the
+dimensions from the PNG IHDR chunk, the JPEG start-of-frame segment, the GIF
+screen descriptor or the BMP info header. Animated GIFs have their frames
+counted by walking the block structure without decompressing anything, and
+APNGs report theirs in the acTL chunk. Fake, corrupt, misnamed and oversized
+images are rejected before decoding spends any CPU or memory on them.
+"""
+
+import os
+import struct
+
+MAX_IMAGE_PIXELS = 50 * 1000 * 1000
+MAX_IMAGE_FRAMES = 50
+
+# Formats accepted, by the extensions an upload of that format may carry
+FORMAT_NAMES = {
+    "png": "PNG",
+    "jpg": "JPEG",
+    "jpeg": "JPEG",
+    "gif": "GIF",
+    "bmp": "BMP",
+}
+
+# JPEG start-of-frame markers (all but DHT, JPG and DAC of 0xC0-0xCF)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+class ImageRejected(ValueError):
+    """An upload is not an image we accept; the message is shown to the client."""
+
+
+class ImageInfo:
+    """Format, dimensions and frame count read from an image's headers."""
+
+    def __init__(self, image_format, width, height, frames=1):
+        self.format = image_format
+        self.width = width
+        self.height = height
+        self.frames = frames
+
+    @property
+    def pixels(self):
+        return self.width * self.height
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ImageRejected("Image file is truncated")
+    return data
+
+
+def _png_info(stream, max_frames):
+    stream.seek(8)
+    length, chunk = struct.unpack(">I4s", _read_exact(stream, 8))
+    if chunk != b"IHDR" or length != 13:
+        raise ImageRejected("PNG image has no IHDR header")
+    width, height = struct.unpack(">II", _read_exact(stream, 8))
+    stream.seek(length - 8 + 4, os.SEEK_CUR)
+
+    # An animated PNG declares its frame count in acTL, before the image data
+    frames = 1
+    while True:
+        header = stream.read(8)
+        if len(header) < 8:
+            break
+        length, chunk = struct.unpack(">I4s", header)
+        if chunk == b"acTL":
+            frames = struct.unpack(">I", _read_exact(stream, 4))[0]
+            break
+        if chunk in (b"IDAT", b"IEND"):
+            break
+        stream.seek(length + 4, os.SEEK_CUR)
+    return ImageInfo("PNG", width, height, frames)
+
+
+def _jpeg_info(stream, max_frames):
+    stream.seek(2)
+    while True:
+        byte = _read_exact(stream, 1)
+        if byte != b"\xff":
+            raise ImageRejected("JPEG image is corrupt")
+        marker = _read_exact(stream, 1)[0]
+        while marker == 0xFF:
+            marker = _read_exact(stream, 1)[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            continue
+        if marker in (0xD9, 0xDA):
+            raise ImageRejected("JPEG image has no frame header")
+        length = struct.unpack(">H", _read_exact(stream, 2))[0]
+        if length < 2:
+            raise ImageRejected("JPEG image is corrupt")
+        if marker in JPEG_SOF_MARKERS:
+            _, height, width = struct.unpack(">BHH", _read_exact(stream, 5))
+            return ImageInfo("JPEG", width, height)
+        stream.seek(length - 2, os.SEEK_CUR)
+
+
+def _skip_gif_sub_blocks(stream):
+    while True:
+        size = _read_exact(stream, 1)[0]
+        if size == 0:
+            return
+        stream.seek(size, os.SEEK_CUR)
+
+
+def _gif_info(stream, max_frames):
+    stream.seek(6)
+    width, height, flags = struct.unpack("<HHB", _read_exact(stream, 5))
+    stream.seek(2, os.SEEK_CUR)
+    if flags & 0x80:
+        stream.seek(3 << ((flags & 0x07) + 1), os.SEEK_CUR)
+
+    frames = 0
+    while frames <= max_frames:
+        block = stream.read(1)
+        if block in (b"", b"\x3b"):
+            break
+        if block == b"\x2c":
+            frames += 1
+            descriptor = _read_exact(stream, 9)
+            frame_width, frame_height = struct.unpack("<HH", descriptor[4:8])
+            width, height = max(width, frame_width), max(height, frame_height)
+            if descriptor[8] & 0x80:
+                stream.seek(3 << ((descriptor[8] & 0x07) + 1), os.SEEK_CUR)
+            stream.seek(1, os.SEEK_CUR)
+            _skip_gif_sub_blocks(stream)
+        elif block == b"\x21":
+            stream.seek(1, os.SEEK_CUR)
+            _skip_gif_sub_blocks(stream)
+        else:
+            raise ImageRejected("GIF image is corrupt")
+    if frames == 0:
+        raise ImageRejected("GIF image has no frames")
+    return ImageInfo("GIF", width, height, frames)
+
+
+def _bmp_info(stream, max_frames):
+    stream.seek(14)
+    header_size = struct.unpack("<I", _read_exact(stream, 4))[0]
+    if header_size == 12:
+        width, height = struct.unpack("<HH", _read_exact(stream, 4))
+    elif header_size >= 40:
+        width, height = struct.unpack("<ii", _read_exact(stream, 8))
+    else:
+        raise ImageRejected("BMP image has an unknown header")
+    # Negative heights mark top-down bitmaps
+    return ImageInfo("BMP", abs(width), abs(height))
+
+
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", _png_info),
+    (b"\xff\xd8", _jpeg_info),
+    (b"GIF87a", _gif_info),
+    (b"GIF89a", _gif_info),
+    (b"BM", _bmp_info),
+)
+
+
+def inspect_image(stream, max_frames=MAX_IMAGE_FRAMES):
+    """
+    Read an image's format, dimensions and frame count from its headers.
+
+    Args:
+        stream: Seekable binary stream positioned anywhere; it is left at an
+            unspecified position
+        max_frames: GIF frames are counted only up to one past this
+
+    Returns:
+        ImageInfo
+
+    Raises:
+        ImageRejected: If the content is not a PNG, JPEG, GIF or BMP image or
+            its headers are corrupt
+    """
+    stream.seek(0)
+    magic = stream.read(8)
+    for signature, reader in SIGNATURES:
+        if magic.startswith(signature):
+            return reader(stream, max_frames)
+    raise ImageRejected("File is not a PNG, JPEG, GIF or BMP image")
+
+
+def validate_image(
+    stream, filename=None, max_pixels=MAX_IMAGE_PIXELS, max_frames=MAX_IMAGE_FRAMES
+):
+    """
+    Check an upload's headers against what we are willing to decode.
+
+    Args:
+        stream: Seekable binary stream of the upload
+        filename: Name it was uploaded as; its extension must match the
+            format of the content (None skips that check)
+        max_pixels: Largest width * height accepted
+        max_frames: Most frames accepted in an animated image
+
+    Returns:
+        ImageInfo of the accepted image
+
+    Raises:
+        ImageRejected: With a message for the client if the upload is not an
+            accepted image, its extension names another format, or it is
+            too large or has too many frames
+    """
+    name = filename or "Upload"
+    try:
+        info = inspect_image(stream, max_frames)
+    except ImageRejected as e:
+        raise ImageRejected(f"{name}: {e}")
+
+    if filename and "." in filename:
+        claimed = FORMAT_NAMES.get(filename.rsplit(".", 1)[1].lower())
+        if claimed != info.format:
+            raise ImageRejected(
+                f"{name} is a {info.format} image, not {claimed or 'an accepted format'}"
+            )
+    if info.width == 0 or info.height == 0:
+        raise ImageRejected(f"{name} has no pixels")
+    if info.pixels > max_pixels:
+        raise ImageRejected(
+            f"{name} is {info.width}x{info.height} ({info.pixels / 1e6:.1f} MP); "
+            f"images may have at most {max_pixels / 1e6:g} MP"
+        )
+    if info.frames > max_frames:
+        raise ImageRejected(
+            f"{name} has more than {max_frames} frames; "
+            f"animations may have at most {max_frames}"
+        )
+    return info
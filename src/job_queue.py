@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Persistent comparison job queue backed by SQLite.
+
+Jobs and their progress events live in a single database file, so queued and
+interrupted work survives a restart of the process that runs it. Any number
+of worker processes can share the file: a claimed job is leased to one
+worker, which extends the lease with heartbeats while it runs. Jobs whose
+lease runs out (the worker died or hung) go back to the queue.
+"""
+
+import json
+import sqlite3
+import time
+import uuid
+
+try:
+    from .sqlite_db import SQLiteDatabase
+except ImportError:
+    from sqlite_db import SQLiteDatabase
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATES = (DONE, FAILED)
+
+LEASE_SECONDS = 30.0
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    lease_expires REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_lease ON jobs (status, lease_expires);
+CREATE TABLE IF NOT EXISTS job_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, seq);
+"""
+
+
+class JobQueue:
+    """
+    FIFO queue of comparison jobs with a per-job event log, in a
+    SQLiteDatabase file that workers in several processes can share.
+    """
+
+    def __init__(self, path, journal_mode="wal", max_attempts=MAX_ATTEMPTS):
+        """
+        Args:
+            path: SQLite database file, created if missing
+            journal_mode: SQLite journal mode (see SQLiteDatabase)
+            max_attempts: Claims after which a job whose lease keeps expiring
+                is marked failed instead of being queued again
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self._db = SQLiteDatabase(path, SCHEMA, journal_mode, row_factory=sqlite3.Row)
+
+    def submit(self, payload):
+        """Queue a job and return its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._db.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload), now, now),
+            )
+            self._insert_event(conn, job_id, QUEUED, {})
+            conn.execute("COMMIT")
+        return job_id
+
+    def claim(self, worker_id=None, lease_seconds=LEASE_SECONDS):
+        """
+        Lease the oldest queued job to a worker and mark it running.
+
+        Jobs whose lease has expired are put back in the queue first.
+
+        Returns:
+            Tuple of (job_id, payload), or None when the queue is empty
+        """
+        now = time.time()
+        with self._db.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._requeue_expired(conn, now)
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE status = ? "
+                "ORDER BY created_at LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, worker_id = ?, "
+                "lease_expires = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, worker_id, now + lease_seconds, now, row["id"]),
+            )
+            self._insert_event(conn, row["id"], RUNNING, {"worker": worker_id})
+            conn.execute("COMMIT")
+        return row["id"], json.loads(row["payload"])
+
+    def _requeue_expired(self, conn, now):
+        expired = conn.execute(
+            "SELECT id, attempts, worker_id FROM jobs "
+            "WHERE status = ? AND lease_expires < ?",
+            (RUNNING, now),
+        ).fetchall()
+        for row in expired:
+            if row["attempts"] >= self.max_attempts:
+                status = FAILED
+                error = f"Lease expired after {row['attempts']} attempts"
+            else:
+                status = QUEUED
+                error = None
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, worker_id = NULL, "
+                "lease_expires = NULL, updated_at = ? WHERE id = ?",
+                (status, error, now, row["id"]),
+            )
+            self._insert_event(
+                conn,
+                row["id"],
+                status if status == FAILED else "requeued",
+                {"error": error} if error else {"lost_worker": row["worker_id"]},
+            )
+        return len(expired)
+
+    def requeue_expired(self):
+        """
+        Put jobs whose lease ran out back in the queue.
+
+        Claiming does this too; calling it directly is only needed to report
+        or react to lost workers without taking on new work.
+
+        Returns:
+            Number of expired jobs found
+        """
+        with self._db.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            count = self._requeue_expired(conn, time.time())
+            conn.execute("COMMIT")
+        return count
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=LEASE_SECONDS):
+        """
+        Extend a worker's lease on a running job.
+
+        Returns:
+            False if the job is no longer leased to this worker
+        """
+        now = time.time()
+        with self._db.connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ?",
+                (now + lease_seconds, now, job_id, worker_id, RUNNING),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, result, worker_id=None):
+        """
+        Store a job's result and mark it done.
+
+        Returns:
+            False if ``worker_id`` is given and no longer holds the job's
+            lease, in which case nothing is recorded
+        """
+        return self._finish(job_id, DONE, worker_id, result=json.dumps(result))
+
+    def fail(self, job_id, error, worker_id=None):
+        """Record why a job failed; see complete() for the return value."""
+        return self._finish(job_id, FAILED, worker_id, error=str(error))
+
+    def _finish(self, job_id, status, worker_id, result=None, error=None):
+        with self._db.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, "
+                "lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND (? IS NULL OR worker_id = ?)",
+                (status, result, error, time.time(), job_id, worker_id, worker_id),
+            )
+            finished = cursor.rowcount == 1
+            if finished:
+                self._insert_event(
+                    conn, job_id, status, {"error": error} if error else {}
+                )
+            conn.execute("COMMIT")
+        return finished
+
+    @staticmethod
+    def _insert_event(conn, job_id, stage, data):
+        conn.execute(
+            "INSERT INTO job_events (job_id, stage, data, created_at) "
+            "VALUES (?, ?, ?, ?)",
+            (job_id, stage, json.dumps(data), time.time()),
+        )
+
+    def add_event(self, job_id, stage, data):
+        """Append a progress event to a job's log."""
+        with self._db.connect() as conn:
+            self._insert_event(conn, job_id, stage, data)
+
+    def events(self, job_id, after=0):
+        """Return a job's events with a sequence number above ``after``."""
+        with self._db.connect() as conn:
+            rows = conn.execute(
+                "SELECT seq, stage, data, created_at FROM job_events "
+                "WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return [
+            {
+                "seq": row["seq"],
+                "stage": row["stage"],
+                "data": json.loads(row["data"]),
+                "created_at": row["created_at"],
+            }
+            for row in rows
+        ]
+
+    def get(self, job_id):
+        """Return a job's state, or None if the id is unknown."""
+        with self._db.connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "payload": json.loads(row["payload"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "worker_id": row["worker_id"],
+            "lease_expires": row["lease_expires"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def counts(self):
+        """Return the number of jobs in each state."""
+        with self._db.connect() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"
+            ).fetchall()
+        return {row["status"]: row["n"] for row in rows}
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Staged comparison pipeline and the workers that run queued comparison jobs.
+"""
+
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+
+import numpy as np
+from PIL import Image
+
+try:
+    from .job_queue import LEASE_SECONDS, JobQueue
+except ImportError:
+    from job_queue import LEASE_SECONDS, JobQueue
+
+
+def load_rgb(image_path):
+    """Decode an image file to an RGB array, as face_recognition expects."""
+    with Image.open(image_path) as img:
+        return np.array(img.convert("RGB"))
+
+
+def face_summary(face_data):
+    """Serializable description of one image's detection result."""
+    encodings = face_data["encodings"]
+    return {
+        "faces": len(encodings) if encodings is not None else 0,
+        "strategy": face_data.get("strategy"),
+        "variation": face_data.get("variation"),
+        "boxes": [
+            {"top": top, "right": right, "bottom": bottom, "left": left}
+            for top, right, bottom, left in face_data.get("locations") or []
+        ],
+        "image_size": face_data.get("image_size"),
+        "reused": face_data.get("reused", 0),
+        "message": face_data["message"],
+    }
+
+
+def confidence_label(distance):
+    """Coarse confidence shown on the result page for a best distance."""
+    return "High" if distance is not None and round(distance, 3) < 1.0 else "Medium"
+
+
+def run_comparison_job(payload, comparator, masker, emit):
+    """
+    Mask, decode, detect and compare two images, reporting each stage.
+
+    Args:
+        payload: Job payload with ``image1``/``image2`` paths, the
+            ``rectangles`` to mask on both and the ``tolerance``
+        comparator: FaceComparator configured with the job's tolerance
+        masker: ImageMasker used when rectangles are given
+        emit: Callable ``emit(stage, data)`` invoked after each stage
+
+    Returns:
+        Result dictionary with the verdict, a ``details`` string in the same
+        format as FaceComparator.compare_faces, the full face ``distances``
+        matrix, per-image face summaries and per-stage ``timings_ms``
+    """
+    started = time.perf_counter()
+    timings = {}
+    image1_path = payload["image1"]
+    image2_path = payload["image2"]
+    rectangles = payload.get("rectangles") or []
+    paths = [image1_path, image2_path]
+    stage_started = time.perf_counter()
+    images = [load_rgb(path) for path in paths]
+    timings["decode"] = (time.perf_counter() - stage_started) * 1000
+
+    mask_stats = None
+    masks = None
+    if rectangles:
+        stage_started = time.perf_counter()
+        # Masks are applied in memory; no masked copies are written next to
+        # the uploads. Faces are found on the decoded originals so that the
+        # ones the masks leave clear can keep their cached encodings
+        masks = [
+            masker.create_mask_for_size((image.shape[1], image.shape[0]), rectangles)
+            for image in images
+        ]
+        mask_stats = masker.get_mask_statistics(masks[0])
+        timings["mask"] = (time.perf_counter() - stage_started) * 1000
+    emit(
+        "decoded",
+        {
+            f"image{i + 1}": {"width": image.shape[1], "height": image.shape[0]}
+            for i, image in enumerate(images)
+        },
+    )
+
+    face_data = detect_images(images, comparator, emit, timings, masks=masks)
+    result = {
+        "tolerance": payload.get("tolerance"),
+        "faces": [face_summary(data) for data in face_data],
+        "mask_applied": bool(rectangles),
+        "mask_stats": mask_stats,
+    }
+    return finish_comparison(result, face_data, comparator, emit, timings, started)
+
+
+def detect_images(images, comparator, emit, timings, known=None, masks=None):
+    """
+    Find and encode the faces in each decoded image, reporting each one.
+
+    Args:
+        images: Decoded RGB image arrays, unmasked
+        comparator: FaceComparator used for detection and encoding
+        emit: Callable ``emit(stage, data)``
+        timings: Dictionary receiving ``detect_imageN``/``encode_imageN`` ms
+        known: Optional list with, per image, face data already computed for
+            exactly that unmasked image (or None)
+        masks: Optional list with a boolean mask per image; faces are then
+            found on the masked images, reusing what the unmasked ones gave
+            (see FaceComparator.get_masked_face_data)
+
+    Returns:
+        List of face data dictionaries as returned by get_face_data_from_image
+    """
+    face_data = []
+    for i, image in enumerate(images):
+        unmasked = known[i] if known else None
+        image_timings = {}
+        if masks is not None:
+            face_data.append(
+                comparator.get_masked_face_data(
+                    image, masks[i], image_timings, unmasked=unmasked
+                )
+            )
+        elif unmasked is not None:
+            face_data.append(unmasked)
+        else:
+            face_data.append(comparator.get_face_data_from_image(image, image_timings))
+        for stage, ms in image_timings.items():
+            timings[f"{stage}_image{i + 1}"] = ms
+        emit(f"faces_image{i + 1}", face_summary(face_data[-1]))
+    return face_data
+
+
+def finish_comparison(result, face_data, comparator, emit, timings, started):
+    """
+    Compare the faces of two images and complete a comparison result.
+
+    Adds the verdict, distances and matches to ``result``, records the
+    ``compare`` and ``total`` timings (``total`` measured from ``started``)
+    and emits the ``compared`` stage.
+    """
+    stage_started = time.perf_counter()
+    encodings1 = face_data[0]["encodings"]
+    encodings2 = face_data[1]["encodings"]
+    if encodings1 is None or encodings2 is None:
+        result.update(
+            is_same_person=False,
+            details="Face detection failed",
+            distance=None,
+            confidence=0,
+            distances=[],
+            matches=[],
+        )
+    else:
+        comparison = comparator.compare_encodings(encodings1, encodings2)
+        best_distance = comparison["best_distance"]
+        confidence = comparison["confidence"]
+        result.update(
+            is_same_person=comparison["is_match"],
+            details=f"Distance: {best_distance:.3f}, Confidence: {confidence:.1f}%",
+            distance=best_distance if best_distance != float("inf") else None,
+            confidence=confidence,
+            distances=comparison.get("distances", []),
+            matches=[
+                {"face1": face1, "face2": face2, "distance": distance}
+                for face1, face2, distance in comparison["matches"]
+            ],
+        )
+    result["confidence_label"] = confidence_label(result["distance"])
+
+    finished = time.perf_counter()
+    timings["compare"] = (finished - stage_started) * 1000
+    timings["total"] = (finished - started) * 1000
+    result["timings_ms"] = {stage: round(ms, 2) for stage, ms in timings.items()}
+
+    emit(
+        "compared",
+        {
+            "is_same_person": result["is_same_person"],
+            "distance": result["distance"],
+            "confidence": result["confidence"],
+        },
+    )
+    return result
+
+
+def default_worker_id(suffix=None):
+    """Identify a worker by host and process so lost leases can be traced."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    return f"{worker_id}:{suffix}" if suffix is not None else worker_id
+
+
+class JobWorker:
+    """Claim jobs from a JobQueue and run them one at a time."""
+
+    def __init__(
+        self,
+        queue,
+        comparator_factory=None,
+        masker_factory=None,
+        poll_interval=0.5,
+        worker_id=None,
+        lease_seconds=LEASE_SECONDS,
+    ):
+        """
+        Args:
+            queue: JobQueue to claim work from
+            comparator_factory: Callable taking a tolerance and returning a
+                FaceComparator (default: FaceComparators sharing one
+                DetectionCache)
+            masker_factory: Callable returning an ImageMasker
+                (default: ImageMasker)
+            poll_interval: Seconds to sleep when the queue is empty
+            worker_id: Name recorded on claimed jobs (default: host:pid)
+            lease_seconds: How long a claim lasts without a heartbeat; the
+                lease is renewed every third of this while a job runs
+        """
+        if comparator_factory is None:
+            try:
+                from .face_compare import DetectionCache, FaceComparator
+            except ImportError:
+                from face_compare import DetectionCache, FaceComparator
+            detection_cache = DetectionCache()
+
+            def comparator_factory(tolerance):
+                return FaceComparator(tolerance, detection_cache=detection_cache)
+
+        if masker_factory is None:
+            try:
+                from .image_masking import ImageMasker
+            except ImportError:
+                from image_masking import ImageMasker
+            masker_factory = ImageMasker
+
+        self.queue = queue
+        self.comparator_factory = comparator_factory
+        self.masker_factory = masker_factory
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.comparators = {}
+
+    def comparator(self, tolerance):
+        """Comparator for a tolerance, kept warm across jobs."""
+        if tolerance not in self.comparators:
+            self.comparators[tolerance] = self.comparator_factory(tolerance)
+        return self.comparators[tolerance]
+
+    def _heartbeat(self, job_id, stop):
+        while not stop.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(job_id, self.worker_id, self.lease_seconds):
+                print(f"Lost lease on job {job_id}")
+                return
+
+    def run_once(self):
+        """
+        Run the next queued job, if any.
+
+        Returns:
+            The id of the job that ran, or None if the queue was empty
+        """
+        claimed = self.queue.claim(self.worker_id, self.lease_seconds)
+        if claimed is None:
+            return None
+        job_id, payload = claimed
+
+        def emit(stage, data):
+            self.queue.add_event(job_id, stage, data)
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(job_id, stop), daemon=True
+        )
+        heartbeat.start()
+        try:
+            result = run_comparison_job(
+                payload,
+                self.comparator(payload["tolerance"]),
+                self.masker_factory(),
+                emit,
+            )
+        except Exception as e:
+            traceback.print_exc()
+            self.queue.fail(job_id, e, self.worker_id)
+        else:
+            self.queue.complete(job_id, result, self.worker_id)
+        finally:
+            stop.set()
+            heartbeat.join()
+        return job_id
+
+    def run(self, stop_event=None):
+        """Process jobs until ``stop_event`` is set (forever if None)."""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            if self.run_once() is None:
+                stop_event.wait(self.poll_interval)
+
+
+def _worker_process(database, journal_mode, comparator_factory, options, ready):
+    # SIGTERM lets the current job finish; Ctrl+C is handled by the parent.
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    queue = JobQueue(database, journal_mode=journal_mode)
+    worker = JobWorker(queue, comparator_factory=comparator_factory, **options)
+    ready.release()
+    worker.run(stop)
+
+
+def start_workers(
+    database,
+    processes,
+    comparator_factory=None,
+    poll_interval=0.5,
+    lease_seconds=LEASE_SECONDS,
+    journal_mode="wal",
+):
+    """
+    Start worker processes that pull jobs from the queue in ``database``.
+
+    Each process loads its own models and runs one job at a time, so
+    throughput grows with the number of processes until the CPUs are busy.
+
+    Returns once every process has loaded its models.
+
+    Returns:
+        The started processes, which exit after their current job when sent
+        SIGTERM
+    """
+    # Create the schema once rather than racing to do it in every worker
+    JobQueue(database, journal_mode=journal_mode)
+    options = {"poll_interval": poll_interval, "lease_seconds": lease_seconds}
+    ready = multiprocessing.Semaphore(0)
+    workers = []
+    for _ in range(processes):
+        process = multiprocessing.Process(
+            target=_worker_process,
+            args=(database, journal_mode, comparator_factory, options, ready),
+            daemon=True,
+        )
+        process.start()
+        workers.append(process)
+    for _ in workers:
+        ready.acquire()
+    return workers
+
+
+def stop_workers(workers, timeout=None):
+    """Ask worker processes to finish their current job and exit."""
+    for process in workers:
+        if process.is_alive():
+            process.terminate()
+    for process in workers:
+        process.join(timeout)
+
+
+def run_workers(database, processes, **options):
+    """Run a fleet of worker processes in the foreground until interrupted."""
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+
+    workers = start_workers(database, processes, **options)
+    print(f"{len(workers)} comparison workers processing jobs from {database}")
+    try:
+        while not stopping.is_set() and any(p.is_alive() for p in workers):
+            stopping.wait(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_workers(workers)
+        print("Comparison workers stopped")
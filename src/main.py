@@ -3,29 +3,293 @@
 Face Comparison Application
 """
 
+import argparse
 import os
 import sys
 
 # Add current directory to path for imports
 sys.path.append(os.path.dirname(__file__))
 
-from face_compare import FaceComparator  # noqa: E402
+# face_compare pulls in face_recognition, dlib and OpenCV, so it is imported
+# only when a comparison actually runs in this process; handing the work to
+# a warm daemon avoids that startup cost entirely.
+from daemon import compare_via_daemon  # noqa: E402
 
 
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: python main.py <image1_path> <image2_path>")
-        print("\nCompares two images to determine if they contain the same person.")
-        sys.exit(1)
+def batch_command(argv):
+    """Compare every pair listed in a CSV/JSONL manifest."""
+    from batch import read_manifest, run_batch
 
-    image1_path = sys.argv[1]
-    image2_path = sys.argv[2]
+    parser = argparse.ArgumentParser(
+        prog="main.py batch",
+        description="Compare many image pairs using a pool of worker processes.",
+    )
+    parser.add_argument("manifest", help="CSV or JSONL file listing image pairs")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="results.jsonl",
+        help="JSONL file to append results to (default: results.jsonl)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=0.45,
+        help="distance threshold for a match (default: 0.45)",
+    )
+    args = parser.parse_args(argv)
+
+    pairs = read_manifest(args.manifest)
+    run_batch(pairs, args.output, workers=args.workers, tolerance=args.tolerance)
+    return 0
+
+
+def cluster_command(argv):
+    """Group every face found below a directory by identity."""
+    from clustering import MAX_NEIGHBOURS, run_clustering
+
+    parser = argparse.ArgumentParser(
+        prog="main.py cluster",
+        description="Encode every face in a directory tree and group by identity.",
+    )
+    parser.add_argument("directory", help="directory to scan for images")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="clusters.json",
+        help="JSON file to write cluster assignments to (default: clusters.json)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of encoding processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=0.45,
+        help="distance threshold for two faces to be linked (default: 0.45)",
+    )
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        default=1024,
+        help="faces per distance block, bounding peak memory (default: 1024)",
+    )
+    parser.add_argument(
+        "--max-neighbours",
+        type=int,
+        default=MAX_NEIGHBOURS,
+        help="closest matches each face is linked to (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    run_clustering(
+        args.directory,
+        args.output,
+        workers=args.workers,
+        tolerance=args.tolerance,
+        block_size=args.block_size,
+        max_neighbours=args.max_neighbours,
+    )
+    return 0
 
-    print(f"Comparing {image1_path} vs {image2_path}")
+
+def daemon_command(argv):
+    """Run a warm comparison daemon, or stop a running one."""
+    from daemon import default_socket_path, request, serve
+
+    parser = argparse.ArgumentParser(
+        prog="main.py daemon",
+        description="Keep the face models loaded and serve comparisons over a "
+        "Unix socket; plain 'main.py <image1> <image2>' calls use it "
+        "automatically.",
+    )
+    parser.add_argument(
+        "-s",
+        "--socket",
+        default=None,
+        help=f"socket path (default: {default_socket_path()})",
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=0.45,
+        help="default distance threshold for a match (default: 0.45)",
+    )
+    parser.add_argument(
+        "--stop", action="store_true", help="stop the daemon on this socket"
+    )
+    args = parser.parse_args(argv)
+
+    if args.stop:
+        if request({"op": "shutdown"}, args.socket) is None:
+            print("No daemon is running")
+            return 1
+        print("Daemon stopped")
+        return 0
+
+    serve(args.socket, tolerance=args.tolerance)
+    return 0
+
+
+def encode_command(argv):
+    """Write the face encodings of one or more images to embedding files."""
+    from embeddings import save_embeddings
+    from face_compare import FaceComparator
+
+    parser = argparse.ArgumentParser(
+        prog="main.py encode",
+        description="Detect and encode faces once, saving them to .npz files "
+        "that compare/batch accept in place of the image.",
+    )
+    parser.add_argument("images", nargs="+", help="images to encode")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="output file when encoding a single image (default: <image>.npz)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.output and len(args.images) > 1:
+        parser.error("--output can only be used with a single image")
 
     comparator = FaceComparator()
-    is_same_person, details = comparator.compare_faces(image1_path, image2_path)
+    failed = 0
+    for image_path in args.images:
+        face_data = comparator.get_face_data(image_path)
+        if face_data["encodings"] is None:
+            print(f"❌ {image_path}: {face_data['message']}")
+            failed += 1
+            continue
+
+        output_path = args.output or f"{image_path}.npz"
+        save_embeddings(
+            output_path,
+            face_data,
+            comparator.encoding_settings(),
+            source=os.path.basename(image_path),
+        )
+        print(
+            f"✅ {image_path}: {len(face_data['encodings'])} faces "
+            f"({face_data['strategy']} on {face_data['variation']}) -> {output_path}"
+        )
+
+    return 1 if failed else 0
+
+
+def compare_command(argv):
+    """Compare two images or embedding files."""
+    parser = argparse.ArgumentParser(
+        prog="main.py compare",
+        description="Compare two images, or .npz files written by the encode "
+        "command, to determine if they contain the same person.",
+    )
+    parser.add_argument("image1", help="first image or embedding file")
+    parser.add_argument("image2", help="second image or embedding file")
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=None,
+        help="distance threshold for a match (default: 0.45)",
+    )
+    args = parser.parse_args(argv)
+
+    print(f"Comparing {args.image1} vs {args.image2}")
+    is_same_person, details = compare(args.image1, args.image2, args.tolerance)
+    print_result(is_same_person, details)
+    return 0
 
+
+def worker_command(argv):
+    """Run comparison job workers for the web service's job queue."""
+    from jobs import run_workers
+
+    parser = argparse.ArgumentParser(
+        prog="main.py worker",
+        description="Run worker processes that claim comparison jobs submitted "
+        "to the web service's /api/jobs endpoint.",
+    )
+    parser.add_argument(
+        "-d",
+        "--database",
+        default=os.environ.get("JOB_DATABASE", os.path.join("data", "jobs.sqlite3")),
+        help="job queue database shared with the web service "
+        "(default: $JOB_DATABASE or data/jobs.sqlite3)",
+    )
+    parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--lease",
+        type=float,
+        default=30.0,
+        help="seconds without a heartbeat before a job is handed to another "
+        "worker (default: 30)",
+    )
+    parser.add_argument(
+        "--journal-mode",
+        default="wal",
+        help="SQLite journal mode; use 'delete' when workers on several hosts "
+        "share the database over a network filesystem (default: wal)",
+    )
+    args = parser.parse_args(argv)
+
+    run_workers(
+        args.database,
+        args.processes,
+        lease_seconds=args.lease,
+        journal_mode=args.journal_mode,
+    )
+    return 0
+
+
+COMMANDS = {
+    "batch": batch_command,
+    "cluster": cluster_command,
+    "compare": compare_command,
+    "daemon": daemon_command,
+    "encode": encode_command,
+    "worker": worker_command,
+}
+
+
+def compare(image1_path, image2_path, tolerance=None):
+    """Compare two images, through the daemon when one is running."""
+    response = compare_via_daemon(image1_path, image2_path, tolerance)
+    if response is not None:
+        print(response.get("output", ""), end="")
+        if not response.get("ok"):
+            print(f"Error: {response.get('error')}")
+            sys.exit(1)
+        return response["is_same_person"], response["details"]
+
+    from face_compare import FaceComparator
+
+    comparator = FaceComparator() if tolerance is None else FaceComparator(tolerance)
+    return comparator.compare_faces(image1_path, image2_path)
+
+
+def print_result(is_same_person, details):
+    """Print the one-line verdict for a comparison."""
     if is_same_person:
         if isinstance(details, dict):
             confidence = details.get("confidence", 0)
@@ -40,5 +304,29 @@ def main():
             print(f"❌ DIFFERENT PEOPLE - {details}")
 
 
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        sys.exit(COMMANDS[sys.argv[1]](sys.argv[2:]))
+
+    if len(sys.argv) != 3:
+        print("Usage: python main.py <image1_path> <image2_path>")
+        print("       python main.py compare <image1|file.npz> <image2|file.npz>")
+        print("       python main.py encode <image> [<image> ...]")
+        print("       python main.py batch <manifest> [--output results.jsonl]")
+        print("       python main.py cluster <directory> [--output clusters.json]")
+        print("       python main.py daemon [--socket PATH] [--stop]")
+        print("       python main.py worker [--database PATH] [--processes N]")
+        print("\nCompares two images to determine if they contain the same person.")
+        sys.exit(1)
+
+    image1_path = sys.argv[1]
+    image2_path = sys.argv[2]
+
+    print(f"Comparing {image1_path} vs {image2_path}")
+
+    is_same_person, details = compare(image1_path, image2_path)
+    print_result(is_same_person, details)
+
+
 if __name__ == "__main__":
     main()
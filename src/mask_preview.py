@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Live match estimates while masks are being edited.
+
+A preview session ties two uploaded images together. The drawing UI posts
+every mask change; the latest one is computed once edits pause for a short
+debounce interval, and edits that are overtaken before or while they run are
+dropped. Estimates start from the cached unmasked faces and only re-encode
+the faces a mask touches, without detecting again, so each one costs a few
+tens of milliseconds.
+"""
+
+import collections
+import concurrent.futures
+import threading
+import time
+import uuid
+
+try:
+    from .per_process import PerProcess
+except ImportError:
+    from per_process import PerProcess
+
+PREVIEW_DEBOUNCE_SECONDS = 0.05
+PREVIEW_MAX_UPDATES_PER_SECOND = 20
+PREVIEW_IDLE_SECONDS = 10 * 60.0
+PREVIEW_WORKERS = 2
+
+
+class RateLimited(Exception):
+    """A preview session received mask updates faster than allowed."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many mask updates; retry in {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+
+class Superseded(Exception):
+    """A newer mask update arrived while an estimate was being computed."""
+
+
+def estimate_masked_match(handles, rectangles, comparator, masker, cancelled):
+    """
+    Quick verdict for two cached images with the same rectangles masked.
+
+    Args:
+        handles: The two ImageHandles, whose unmasked face data is computed
+            and kept on first use
+        rectangles: Parsed rectangles (see ImageMasker.parse_rectangle_data)
+        comparator: FaceComparator configured with the session's tolerance
+        masker: ImageMasker used to build the masks
+        cancelled: Callable returning True once the estimate is no longer
+            wanted; checked between the expensive steps
+
+    Returns:
+        Dictionary with ``is_same_person``, ``distance``, ``confidence``,
+        per-image face and ``reused`` counts and ``elapsed_ms``
+
+    Raises:
+        Superseded: If ``cancelled`` became true before the estimate finished
+    """
+    started = time.perf_counter()
+    face_data = []
+    for handle in handles:
+        if cancelled():
+            raise Superseded()
+        if handle.face_data is None:
+            handle.face_data = comparator.get_face_data_from_image(handle.image)
+        if rectangles:
+            mask = masker.create_mask_for_size(handle.size, rectangles)
+            face_data.append(
+                comparator.get_masked_face_data(
+                    handle.image, mask, unmasked=handle.face_data, redetect=False
+                )
+            )
+        else:
+            face_data.append(
+                dict(handle.face_data, reused=len(handle.face_data["locations"]))
+            )
+    if cancelled():
+        raise Superseded()
+
+    encodings1 = face_data[0]["encodings"]
+    encodings2 = face_data[1]["encodings"]
+    if encodings1 is None or encodings2 is None:
+        estimate = {"is_same_person": False, "distance": None, "confidence": 0}
+    else:
+        comparison = comparator.compare_encodings(encodings1, encodings2)
+        best_distance = comparison["best_distance"]
+        estimate = {
+            "is_same_person": comparison["is_match"],
+            "distance": best_distance if best_distance != float("inf") else None,
+            "confidence": comparison["confidence"],
+        }
+    estimate["faces"] = [
+        len(data["encodings"]) if data["encodings"] is not None else 0
+        for data in face_data
+    ]
+    estimate["reused"] = [data.get("reused", 0) for data in face_data]
+    estimate["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return estimate
+
+
+class PreviewSession:
+    """The mask edits and published estimates of one pair of images."""
+
+    def __init__(self, session_id, handles, tolerance):
+        self.id = session_id
+        self.handles = handles
+        self.tolerance = tolerance
+        self.revision = 0
+        self.pending = None
+        self.scheduled = False
+        self.events = collections.deque(maxlen=32)
+        self.last_used = time.monotonic()
+        self.updates = collections.deque()
+        self.condition = threading.Condition()
+
+    def events_after(self, revision):
+        """Published events newer than ``revision``, oldest first."""
+        with self.condition:
+            return [event for event in self.events if event["revision"] > revision]
+
+    def wait_for_events(self, revision, timeout):
+        """Block until an event newer than ``revision`` exists or ``timeout``."""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.events and self.events[-1]["revision"] > revision,
+                timeout,
+            )
+        return self.events_after(revision)
+
+
+class PreviewManager:
+    """
+    Preview sessions of this process and the threads computing their estimates.
+
+    Estimates run on a small shared thread pool, at most one per session at a
+    time, so a burst of edits in one session never queues more than the
+    latest of them.
+    """
+
+    def __init__(
+        self,
+        estimate,
+        debounce_seconds=PREVIEW_DEBOUNCE_SECONDS,
+        max_updates_per_second=PREVIEW_MAX_UPDATES_PER_SECOND,
+        idle_seconds=PREVIEW_IDLE_SECONDS,
+        workers=PREVIEW_WORKERS,
+    ):
+        """
+        Args:
+            estimate: Callable ``estimate(session, rectangles, cancelled)``
+                returning the estimate dictionary, or raising Superseded
+            debounce_seconds: Quiet time after an edit before it is computed
+            max_updates_per_second: Mask updates accepted per session within
+                any one second; more are rejected with RateLimited
+            idle_seconds: Sessions unused for this long are discarded
+            workers: Threads computing estimates for all sessions
+        """
+        self.estimate = estimate
+        self.debounce_seconds = debounce_seconds
+        self.max_updates_per_second = max_updates_per_second
+        self.idle_seconds = idle_seconds
+        self.workers = workers
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._executor = PerProcess(
+            lambda: concurrent.futures.ThreadPoolExecutor(
+                self.workers, thread_name_prefix="mask-preview"
+            )
+        )
+        self._computed = 0
+        self._superseded = 0
+        self._rate_limited = 0
+
+    def _submit(self, session):
+        self._executor.get().submit(self._run, session)
+
+    def create(self, handles, tolerance):
+        """Start a preview session for two image handles."""
+        session = PreviewSession(uuid.uuid4().hex, handles, tolerance)
+        with self._lock:
+            for session_id, idle in list(self._sessions.items()):
+                if self.expired(idle):
+                    del self._sessions[session_id]
+            self._sessions[session.id] = session
+        return session
+
+    def expired(self, session):
+        """Whether a session has gone unused for longer than idle_seconds."""
+        return time.monotonic() - session.last_used > self.idle_seconds
+
+    def get(self, session_id):
+        """Return a live session, or None if it is unknown or expired."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and self.expired(session):
+                del self._sessions[session_id]
+                session = None
+        if session is not None:
+            session.last_used = time.monotonic()
+        return session
+
+    def update(self, session, rectangles):
+        """
+        Record a mask edit and schedule its estimate.
+
+        Returns:
+            The edit's revision number, echoed in the estimate event
+
+        Raises:
+            RateLimited: If the session already had max_updates_per_second
+                edits in the last second
+        """
+        now = time.monotonic()
+        with session.condition:
+            while session.updates and now - session.updates[0] >= 1.0:
+                session.updates.popleft()
+            if len(session.updates) >= self.max_updates_per_second:
+                with self._lock:
+                    self._rate_limited += 1
+                raise RateLimited(1.0 - (now - session.updates[0]))
+            session.updates.append(now)
+
+            session.revision += 1
+            session.pending = (session.revision, rectangles, now)
+            session.last_used = now
+            schedule = not session.scheduled
+            session.scheduled = True
+        if schedule:
+            self._submit(session)
+        return session.revision
+
+    def _run(self, session):
+        while True:
+            with session.condition:
+                if session.pending is None:
+                    session.scheduled = False
+                    return
+                revision, rectangles, edited = session.pending
+                # Wait until the edits pause for the debounce interval
+                quiet = time.monotonic() - edited
+                if quiet < self.debounce_seconds:
+                    session.condition.wait(self.debounce_seconds - quiet)
+                    continue
+                session.pending = None
+
+            def cancelled():
+                return session.revision != revision
+
+            try:
+                event = dict(
+                    self.estimate(session, rectangles, cancelled), revision=revision
+                )
+            except Superseded:
+                with self._lock:
+                    self._superseded += 1
+                continue
+            except Exception as e:
+                event = {"revision": revision, "error": str(e)}
+
+            with session.condition:
+                if cancelled():
+                    with self._lock:
+                        self._superseded += 1
+                    continue
+                session.events.append(event)
+                session.condition.notify_all()
+            with self._lock:
+                self._computed += 1
+
+    def metrics(self):
+        """Counts of sessions, computed and dropped estimates."""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "computed": self._computed,
+                "superseded": self._superseded,
+                "rate_limited": self._rate_limited,
+            }
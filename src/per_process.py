@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Resources created lazily, once in each process.
+"""
+
+import os
+import threading
+
+
+class PerProcess:
+    """
+    A value made by ``create()`` on first use in each process.
+
+    Threads do not survive fork(): the workers of a pre-forking server
+    inherit the master's objects but none of its threads. Thread pools,
+    background threads and the queues they read are therefore created again
+    the first time each process asks for them, instead of once per object.
+    """
+
+    def __init__(self, create):
+        """
+        Args:
+            create: Callable returning the value; called at most once per
+                process, under a lock
+        """
+        self.create = create
+        self._lock = threading.Lock()
+        self._pid = None
+        self._value = None
+
+    def get(self):
+        """This process's value, created now if it has none yet."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._value = self.create()
+                self._pid = os.getpid()
+            return self._value
+
+    def current(self):
+        """This process's value, or None if it has not been created yet."""
+        if self._pid != os.getpid():
+            return None
+        return self._value
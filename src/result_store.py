@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Persistent store of finished comparison results, addressed by id.
+
+Results never change once saved, so the pages rendered from them can be
+cached by browsers and shared by link without running the comparison again.
+They are deleted once older than the uploads they show are kept for.
+"""
+
+import json
+import threading
+import time
+import uuid
+
+try:
+    from .sqlite_db import SQLiteDatabase
+except ImportError:
+    from sqlite_db import SQLiteDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_created ON results (created_at);
+"""
+
+# Old results are deleted at most this often, by the thread saving one
+PRUNE_INTERVAL_SECONDS = 60 * 60.0
+
+
+class ResultStore:
+    """
+    Comparison results kept in a SQLite database file.
+    """
+
+    def __init__(self, path, max_age_seconds=None, journal_mode="wal"):
+        """
+        Args:
+            path: SQLite database file, created if missing
+            max_age_seconds: Results older than this are deleted (None: keep)
+            journal_mode: SQLite journal mode (see SQLiteDatabase)
+        """
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self._db = SQLiteDatabase(path, SCHEMA, journal_mode)
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+    def save(self, data):
+        """Store a JSON-serializable result and return its new id."""
+        result_id = uuid.uuid4().hex
+        with self._db.connect() as conn:
+            conn.execute(
+                "INSERT INTO results (id, data, created_at) VALUES (?, ?, ?)",
+                (result_id, json.dumps(data), time.time()),
+            )
+        self._prune_if_due()
+        return result_id
+
+    def _prune_if_due(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            if (
+                self.max_age_seconds is None
+                or now - self._last_prune < PRUNE_INTERVAL_SECONDS
+            ):
+                return
+            self._last_prune = now
+        self.prune(now - self.max_age_seconds)
+
+    def prune(self, before):
+        """Delete results saved before ``before``; returns how many."""
+        with self._db.connect() as conn:
+            return conn.execute(
+                "DELETE FROM results WHERE created_at < ?", (before,)
+            ).rowcount
+
+    def get(self, result_id):
+        """Return a stored result, or None if the id is unknown."""
+        with self._db.connect() as conn:
+            row = conn.execute(
+                "SELECT data FROM results WHERE id = ?", (result_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
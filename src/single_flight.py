@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Single-flight coalescing of identical in-flight work.
+"""
+
+import threading
+
+
+class _Call:
+    """One in-flight execution and the callers waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run each distinct piece of work at most once at a time.
+
+    While a call for a key is running, further calls with the same key wait
+    for it and receive its result (or exception) instead of starting their
+    own. Once it finishes the key is released, so results are never cached
+    beyond the lifetime of the running call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executed = 0
+        self._shared = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` unless a call for ``key`` is in flight.
+
+        Returns:
+            Tuple of (result, shared) where shared is True if the result came
+            from another caller's execution
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            # Followers must not mistake an interrupted call (SystemExit,
+            # KeyboardInterrupt) for one that returned None
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, False
+
+    def metrics(self):
+        """Return how many calls ran and how many were served by another."""
+        with self._lock:
+            return {
+                "executed": self._executed,
+                "coalesced": self._shared,
+                "in_flight": len(self._calls),
+            }
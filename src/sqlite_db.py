@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+SQLite database files shared between threads and processes.
+"""
+
+import contextlib
+import sqlite3
+
+
+class SQLiteDatabase:
+    """
+    A SQLite database file, opened with a short-lived connection per use.
+
+    No connection outlives the block using it, so one instance can be shared
+    between request threads and background workers, and separate processes
+    can open the same file.
+    """
+
+    def __init__(self, path, schema, journal_mode="wal", row_factory=None):
+        """
+        Args:
+            path: SQLite database file, created if missing
+            schema: SQL script creating the tables (IF NOT EXISTS)
+            journal_mode: SQLite journal mode; WAL lets readers and the single
+                writer proceed concurrently but needs every process on the
+                same host, so use "delete" when processes on several nodes
+                share the file over a network filesystem
+            row_factory: Row factory of the connections, e.g. sqlite3.Row
+        """
+        self.path = path
+        self.row_factory = row_factory
+        with self.connect() as conn:
+            conn.execute(f"PRAGMA journal_mode={journal_mode}")
+            conn.executescript(schema)
+
+    @contextlib.contextmanager
+    def connect(self):
+        """A connection in autocommit mode (transactions begin explicitly)."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if self.row_factory is not None:
+            conn.row_factory = self.row_factory
+        try:
+            yield conn
+        finally:
+            conn.close()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Retention for uploaded images, enforced by a low-priority background sweeper.
+
+The upload store is swept by age and size quota, least recently used first.
+Files saved under their own names by older versions, outside the store, are
+removed once they are older than the maximum age.
+"""
+
+import os
+import threading
+import time
+
+try:
+    from .per_process import PerProcess
+except ImportError:
+    from per_process import PerProcess
+
+UPLOAD_MAX_AGE_SECONDS = 7 * 24 * 60 * 60.0
+UPLOAD_MAX_BYTES = 2 * 1024 * 1024 * 1024
+UPLOAD_SWEEP_INTERVAL_SECONDS = 10 * 60.0
+UPLOAD_SWEEP_GRACE_SECONDS = 5 * 60.0
+
+# Uploads outside the store: image files saved under their own names at the
+# top of the upload folder
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".bmp"}
+
+
+class UploadSweeper:
+    """
+    Apply the retention policy to an UploadStore and older uploads.
+
+    ``start`` runs ``sweep`` every ``interval_seconds`` on a daemon thread at
+    the lowest CPU priority, so sweeping a large directory never competes
+    with comparisons.
+    """
+
+    def __init__(
+        self,
+        store,
+        legacy_folder=None,
+        max_age_seconds=UPLOAD_MAX_AGE_SECONDS,
+        max_bytes=UPLOAD_MAX_BYTES,
+        interval_seconds=UPLOAD_SWEEP_INTERVAL_SECONDS,
+        grace_seconds=UPLOAD_SWEEP_GRACE_SECONDS,
+    ):
+        """
+        Args:
+            store: UploadStore to sweep
+            legacy_folder: Upload folder whose uploads outside the store
+                are removed by age alone (see IMAGE_EXTENSIONS); None to
+                leave them
+            max_age_seconds: Remove uploads unused for this long
+            max_bytes: Size quota of the store
+            interval_seconds: Time between background sweeps
+            grace_seconds: Uploads used this recently are never removed
+        """
+        self.store = store
+        self.legacy_folder = legacy_folder
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.interval_seconds = interval_seconds
+        self.grace_seconds = grace_seconds
+        self._lock = threading.Lock()
+        self._thread = PerProcess(self._start_thread)
+        self._stop = threading.Event()
+        self._sweeps = 0
+        self._removed = 0
+        self._reclaimed = 0
+        self._last_sweep = None
+
+    def _expired_legacy_entries(self, now):
+        """Uploads outside the store older than the maximum age."""
+        for entry in os.scandir(self.legacy_folder):
+            if not (
+                entry.is_file(follow_symlinks=False)
+                and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+            ):
+                continue
+            try:
+                if (
+                    now - entry.stat(follow_symlinks=False).st_mtime
+                    > self.max_age_seconds
+                ):
+                    yield entry
+            except FileNotFoundError:
+                continue
+
+    def _sweep_legacy(self, now):
+        removed = 0
+        reclaimed = 0
+        for entry in self._expired_legacy_entries(now):
+            try:
+                size = entry.stat(follow_symlinks=False).st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            reclaimed += size
+        return removed, reclaimed
+
+    def sweep(self, now=None):
+        """
+        Apply the retention policy once.
+
+        Returns:
+            Report with the ``removed`` count, ``reclaimed_bytes`` and
+            ``duration_ms`` of this sweep
+        """
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        report = self.store.sweep(
+            self.max_age_seconds, self.max_bytes, self.grace_seconds, now
+        )
+        if self.legacy_folder is not None and self.max_age_seconds is not None:
+            removed, reclaimed = self._sweep_legacy(now)
+            report["removed"] += removed
+            report["reclaimed_bytes"] += reclaimed
+        report["finished_at"] = time.time()
+        report["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        with self._lock:
+            self._sweeps += 1
+            self._removed += report["removed"]
+            self._reclaimed += report["reclaimed_bytes"]
+            self._last_sweep = report
+        return report
+
+    def _run(self):
+        # Threads are scheduled as tasks of their own on Linux, so only the
+        # sweeper drops to the lowest priority
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Upload sweep failed: {e}")
+
+    def _start_thread(self):
+        thread = threading.Thread(target=self._run, name="upload-sweeper", daemon=True)
+        thread.start()
+        return thread
+
+    def start(self):
+        """Start this process's background sweeper, once (no-op if disabled)."""
+        if self.interval_seconds:
+            self._thread.get()
+
+    def stop(self):
+        """Stop the background sweeper after its current sweep."""
+        self._stop.set()
+
+    def usage(self):
+        """Store usage against the policy and what sweeping has reclaimed."""
+        with self._lock:
+            report = {
+                "store": self.store.metrics(),
+                "policy": {
+                    "max_age_seconds": self.max_age_seconds,
+                    "max_bytes": self.max_bytes,
+                    "interval_seconds": self.interval_seconds,
+                    "grace_seconds": self.grace_seconds,
+                },
+                "sweeps": self._sweeps,
+                "removed": self._removed,
+                "reclaimed_bytes": self._reclaimed,
+                "last_sweep": self._last_sweep,
+            }
+        return report
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Uploaded images stored once per content, addressed by their SHA-256.
+
+Files are hashed while they stream to disk and kept under their digest in a
+two-level sharded directory, so uploads with the same name never overwrite
+each other and the same photo uploaded under different names is stored (and
+can be cached) once. A small SQLite index remembers the name each digest was
+last uploaded as, for display, and when it was last used, for retention.
+"""
+
+import contextlib
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+try:
+    from .image_validation import MAX_IMAGE_FRAMES, MAX_IMAGE_PIXELS, validate_image
+    from .sqlite_db import SQLiteDatabase
+except ImportError:
+    from image_validation import MAX_IMAGE_FRAMES, MAX_IMAGE_PIXELS, validate_image
+    from sqlite_db import SQLiteDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    digest TEXT PRIMARY KEY,
+    extension TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS uploads_last_seen ON uploads (last_seen);
+"""
+
+# Partial files older than this were left by a crashed upload
+PARTIAL_MAX_AGE_SECONDS = 60 * 60.0
+
+# Extension each stored image gets, from the format its content is in, so
+# identical bytes always map to the same path whatever they were named
+FORMAT_EXTENSIONS = {"PNG": "png", "JPEG": "jpg", "GIF": "gif", "BMP": "bmp"}
+
+
+class StoredUpload:
+    """One image in the store, as returned by UploadStore.save."""
+
+    def __init__(self, digest, path, filename, size, deduplicated):
+        self.digest = digest
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.deduplicated = deduplicated
+
+
+class UploadStore:
+    """
+    Content-addressed image files below ``root``, which several processes
+    can use at once.
+    """
+
+    def __init__(
+        self,
+        root,
+        journal_mode="wal",
+        max_pixels=MAX_IMAGE_PIXELS,
+        max_frames=MAX_IMAGE_FRAMES,
+    ):
+        """
+        Args:
+            root: Directory holding the shards, created if missing
+            journal_mode: SQLite journal mode of the filename index (see
+                SQLiteDatabase)
+            max_pixels: Largest image accepted (see validate_image)
+            max_frames: Most frames accepted in an animated image
+        """
+        self.root = root
+        self.max_pixels = max_pixels
+        self.max_frames = max_frames
+        self._partial_folder = os.path.join(root, "tmp")
+        os.makedirs(self._partial_folder, exist_ok=True)
+        self.index_path = os.path.join(root, "index.sqlite3")
+        self._db = SQLiteDatabase(self.index_path, SCHEMA, journal_mode)
+        self._lock = threading.Lock()
+        self._saved = 0
+        self._deduplicated = 0
+
+    def object_path(self, digest, extension):
+        """Sharded path of a digest: ``root/ab/cd/abcd....ext``."""
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.{extension}")
+
+    def derivative_path(self, digest, name, extension):
+        """
+        Path of a file derived from a stored image, next to it in its shard.
+
+        Derivatives are removed with their image when it is swept.
+        """
+        return self.object_path(digest, f"{name}.{extension}")
+
+    def partial_path(self):
+        """New path in the store's partial folder, to write and then os.replace."""
+        return os.path.join(self._partial_folder, f"{uuid.uuid4().hex}.part")
+
+    def _remove_files(self, digest):
+        """Delete a digest's image and derivatives; returns the bytes freed."""
+        folder = os.path.join(self.root, digest[:2], digest[2:4])
+        freed = 0
+        with contextlib.suppress(FileNotFoundError):
+            for entry in os.scandir(folder):
+                if entry.name.startswith(f"{digest}."):
+                    with contextlib.suppress(FileNotFoundError):
+                        size = entry.stat().st_size
+                        os.remove(entry.path)
+                        freed += size
+        return freed
+
+    def save(self, stream, filename, chunk_size=64 * 1024):
+        """
+        Stream an upload into the store, hashing it on the way to disk.
+
+        Args:
+            stream: Readable binary stream of the upload
+            filename: Name it was uploaded as, kept for display
+            chunk_size: Bytes read and hashed at a time
+
+        Returns:
+            StoredUpload; ``deduplicated`` is True if the same content was
+            already stored
+
+        Raises:
+            ImageRejected: If the headers show the content is not an image
+                we accept (see validate_image); nothing is stored
+        """
+        digest = hashlib.sha256()
+        size = 0
+        partial = self.partial_path()
+        try:
+            with open(partial, "wb") as out:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+            with open(partial, "rb") as written:
+                info = validate_image(
+                    written, filename, self.max_pixels, self.max_frames
+                )
+            extension = FORMAT_EXTENSIONS[info.format]
+        except Exception:
+            os.remove(partial)
+            raise
+
+        digest = digest.hexdigest()
+        path = self.object_path(digest, extension)
+        deduplicated = os.path.exists(path)
+        if deduplicated:
+            os.remove(partial)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(partial, path)
+
+        now = time.time()
+        with self._db.connect() as conn:
+            conn.execute(
+                "INSERT INTO uploads"
+                " (digest, extension, size, filename, created_at, last_seen)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (digest) DO UPDATE SET"
+                " filename = excluded.filename, last_seen = excluded.last_seen",
+                (digest, extension, size, filename, now, now),
+            )
+        with self._lock:
+            self._saved += 1
+            self._deduplicated += deduplicated
+        return StoredUpload(digest, path, filename, size, deduplicated)
+
+    def get(self, digest, touch=True):
+        """
+        Look up a stored image by digest.
+
+        Args:
+            digest: SHA-256 hex digest of the image
+            touch: Record the lookup as a use, which keeps the image from
+                being swept as least recently used
+
+        Returns:
+            StoredUpload, or None if the digest is unknown or its file is gone
+        """
+        with self._db.connect() as conn:
+            row = conn.execute(
+                "SELECT extension, size, filename FROM uploads WHERE digest = ?",
+                (digest,),
+            ).fetchone()
+            if row is not None and touch:
+                conn.execute(
+                    "UPDATE uploads SET last_seen = ? WHERE digest = ?",
+                    (time.time(), digest),
+                )
+        if row is None:
+            return None
+        extension, size, filename = row
+        path = self.object_path(digest, extension)
+        if not os.path.exists(path):
+            return None
+        return StoredUpload(digest, path, filename, size, True)
+
+    def sweep(self, max_age_seconds=None, max_bytes=None, grace_seconds=0.0, now=None):
+        """
+        Delete images unused for too long, then least recently used ones
+        while the store is over its size quota.
+
+        Args:
+            max_age_seconds: Remove images not used for this long (None: keep)
+            max_bytes: Remove least recently used images until the store
+                holds at most this many bytes (None: no quota)
+            grace_seconds: Images used this recently are kept even over quota,
+                as a comparison may be about to read them
+            now: Current time (default: time.time())
+
+        Returns:
+            Dictionary with the ``removed`` image count and ``reclaimed_bytes``
+        """
+        now = time.time() if now is None else now
+        with self._db.connect() as conn:
+            rows = conn.execute(
+                "SELECT digest, size, last_seen FROM uploads" " ORDER BY last_seen"
+            ).fetchall()
+        total = sum(row[1] for row in rows)
+        removed = 0
+        reclaimed = 0
+        for digest, size, last_seen in rows:
+            if now - last_seen < grace_seconds:
+                break
+            expired = max_age_seconds is not None and now - last_seen > max_age_seconds
+            over_quota = max_bytes is not None and total > max_bytes
+            if not (expired or over_quota):
+                break
+            with self._db.connect() as conn:
+                # Skip images used (or uploaded again) since they were listed
+                deleted = conn.execute(
+                    "DELETE FROM uploads WHERE digest = ? AND last_seen = ?",
+                    (digest, last_seen),
+                ).rowcount
+            if not deleted:
+                continue
+            reclaimed += self._remove_files(digest)
+            total -= size
+            removed += 1
+
+        for entry in os.scandir(self._partial_folder):
+            if now - entry.stat().st_mtime > PARTIAL_MAX_AGE_SECONDS:
+                with contextlib.suppress(FileNotFoundError):
+                    reclaimed += entry.stat().st_size
+                    os.remove(entry.path)
+        return {"removed": removed, "reclaimed_bytes": reclaimed}
+
+    def metrics(self):
+        """Stored images and bytes, and how many saves this process deduplicated."""
+        with self._db.connect() as conn:
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM uploads"
+            ).fetchone()
+        with self._lock:
+            return {
+                "images": count,
+                "bytes": total,
+                "saved": self._saved,
+                "deduplicated": self._deduplicated,
+            }
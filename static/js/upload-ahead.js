@@ -0,0 +1,65 @@
+/*
+ * Upload each image of the comparison form as soon as it is chosen.
+ *
+ * The file goes to the form's data-upload-ahead-url, so faces are found
+ * while the other image is picked. The returned id fills the hidden
+ * imageN_id input. When both ids are set, the form posts the ids and the
+ * files are left out, so they are not uploaded a second time. Until then
+ * (an upload still running or failed), the form posts the files as usual.
+ */
+(function () {
+    'use strict';
+
+    function setup(form) {
+        const url = form.dataset.uploadAheadUrl;
+        const slots = [1, 2].map(function (n) {
+            return {
+                file: form.querySelector('#image' + n),
+                id: form.querySelector('#image' + n + '_id'),
+                upload: 0,
+            };
+        });
+        if (!url || slots.some(function (s) { return !s.file || !s.id; })) {
+            return;
+        }
+
+        slots.forEach(function (slot) {
+            slot.file.addEventListener('change', function () {
+                // An id belongs to the file it was uploaded for
+                slot.id.value = '';
+                const upload = ++slot.upload;
+                const file = slot.file.files[0];
+                if (!file) {
+                    return;
+                }
+                const body = new FormData();
+                body.append('image', file);
+                fetch(url, { method: 'POST', body: body })
+                    .then(function (response) {
+                        return response.ok ? response.json() : null;
+                    })
+                    .then(function (data) {
+                        if (upload === slot.upload && data && data.image) {
+                            slot.id.value = data.image.id;
+                        }
+                    })
+                    .catch(function () {
+                        // The files are posted with the form instead
+                    });
+            });
+        });
+
+        // Runs for every submission, including form.submit() from scripts
+        form.addEventListener('formdata', function (event) {
+            if (slots.every(function (s) { return s.id.value; })) {
+                slots.forEach(function (s) { event.formData.delete(s.file.name); });
+            } else {
+                slots.forEach(function (s) { event.formData.delete(s.id.name); });
+            }
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('form[data-upload-ahead-url]').forEach(setup);
+    });
+})();
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Tests for the rolling activity counters behind the admin dashboard.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from activity_aggregates import ActivityAggregates, event_metrics  # noqa: E402
+
+
+def event(created, action, **details):
+    """An ``(created, entry)`` event as the activity log queues it."""
+    return created, {"action": action, "details": details}
+
+
+class TestActivityAggregates(unittest.TestCase):
+    """Test counting, snapshots and summaries of activity events."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "activity.sqlite3")
+        self.aggregates = ActivityAggregates(self.path, snapshot_seconds=3600)
+        self.now = 60 * (time.time() // 60) + 30
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_event_metrics(self):
+        self.assertEqual(
+            event_metrics(
+                {
+                    "action": "api_compare_success",
+                    "details": {"result": False, "total_ms": 300},
+                }
+            ),
+            [
+                "action:api_compare_success",
+                "comparisons",
+                "result:different",
+                "latency_ms:500",
+            ],
+        )
+        self.assertIn(
+            "error:missing_files",
+            event_metrics(
+                {
+                    "action": "face_comparison_failed",
+                    "details": {"reason": "missing_files"},
+                }
+            ),
+        )
+        # Reasons that are not known codes do not become metric names
+        self.assertIn(
+            "error:other",
+            event_metrics(
+                {
+                    "action": "api_compare_failed",
+                    "details": {"reason": "image1 is not valid base64"},
+                }
+            ),
+        )
+        self.assertIn(
+            "error:face_comparison_error",
+            event_metrics({"action": "face_comparison_error", "details": {}}),
+        )
+        self.assertEqual(event_metrics({"action": "page_visit"}), ["action:page_visit"])
+
+    def test_summary(self):
+        self.aggregates.write(
+            [
+                event(self.now - 60, "face_comparison_attempt"),
+                event(self.now - 60, "face_comparison_success", result=True),
+                event(self.now, "face_comparison_attempt"),
+                event(self.now, "face_comparison_success", result=False),
+                event(self.now, "api_compare_attempt"),
+                event(self.now, "api_compare_success", result=True, total_ms=80),
+                event(self.now, "face_comparison_attempt"),
+                event(self.now, "face_comparison_failed", reason="missing_files"),
+            ]
+        )
+
+        summary = self.aggregates.summary(minutes=2, now=self.now)
+
+        self.assertEqual(summary["comparisons"], 3)
+        self.assertEqual(summary["comparisons_per_minute"], 1.5)
+        self.assertEqual([m["comparisons"] for m in summary["per_minute"]], [1, 2])
+        self.assertEqual(summary["errors"]["missing_files"], {"count": 1, "rate": 0.25})
+        self.assertEqual(summary["error_rate"], 0.25)
+        self.assertEqual(summary["results"]["same_ratio"], round(2 / 3, 4))
+        self.assertEqual(summary["latency_ms"][0], {"le": "100", "count": 1})
+
+        # Older minutes fall out of a shorter window
+        self.assertEqual(
+            self.aggregates.summary(minutes=1, now=self.now)["comparisons"], 2
+        )
+
+    def test_sampled_events_scaled_up(self):
+        self.aggregates.write(
+            [(self.now, {"action": "file_access", "sample_rate": 0.1})]
+        )
+
+        actions = self.aggregates.summary(now=self.now)["actions"]
+        self.assertEqual(actions, {"file_access": 10})
+
+    def test_snapshots_merge_processes_and_survive_restarts(self):
+        self.aggregates.write([event(self.now, "face_comparison_success")])
+        self.aggregates.snapshot()
+        self.assertEqual(self.aggregates.metrics()["pending"], 0)
+
+        # Another process (or this one after a restart) adds its own counts
+        other = ActivityAggregates(self.path)
+        other.write([event(self.now, "face_comparison_success")])
+        other.close()
+
+        restarted = ActivityAggregates(self.path)
+        self.assertEqual(restarted.summary(now=self.now)["comparisons"], 2)
+
+    def test_snapshot_due_after_interval(self):
+        aggregates = ActivityAggregates(self.path, snapshot_seconds=0)
+        aggregates.write([event(self.now, "page_visit")])
+
+        metrics = aggregates.metrics()
+        self.assertEqual((metrics["pending"], metrics["snapshots"]), (0, 1))
+
+    def test_old_minutes_deleted(self):
+        aggregates = ActivityAggregates(self.path, max_age_seconds=3600)
+        aggregates.write([event(time.time() - 7200, "page_visit")])
+        aggregates.write([event(time.time(), "page_visit")])
+        aggregates.snapshot()
+
+        with aggregates._db.connect() as conn:
+            rows = conn.execute("SELECT COUNT(*) FROM activity_counts").fetchone()[0]
+        self.assertEqual(rows, 1)
+
+
+def run_tests():
+    """Run all activity aggregate tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestActivityAggregates))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running activity aggregate tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All activity aggregate tests passed!")
+    else:
+        print("\n❌ Some activity aggregate tests failed!")
+        exit(1)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Tests for batched, sampled activity logging and its rotating log file.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from activity_log import (  # noqa: E402
+    ActivityLog,
+    ActivityLogFile,
+    parse_sample_rates,
+)
+
+
+class RecordingSink:
+    """Sink stand-in keeping the batches it was handed."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def write(self, events):
+        time.sleep(self.delay)
+        self.batches.append([entry for _, entry in events])
+
+
+class TestActivityLog(unittest.TestCase):
+    """Test queueing, batching and sampling of activity events."""
+
+    def test_events_written_in_batches(self):
+        sink = RecordingSink()
+        log = ActivityLog([sink], flush_seconds=0.2)
+
+        for i in range(5):
+            self.assertTrue(log.log({"action": "page_visit", "n": i}))
+        self.assertTrue(log.flush())
+
+        self.assertEqual(
+            sink.batches, [[{"action": "page_visit", "n": i} for i in range(5)]]
+        )
+        metrics = log.metrics()
+        self.assertEqual((metrics["written"], metrics["batches"]), (5, 1))
+
+    def test_batch_size_triggers_write(self):
+        sink = RecordingSink()
+        log = ActivityLog([sink], batch_size=2, flush_seconds=10)
+
+        for i in range(4):
+            log.log({"action": "a"})
+        self.assertTrue(log.flush(timeout=1.0))
+
+        self.assertEqual([len(batch) for batch in sink.batches], [2, 2])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        sink = RecordingSink(delay=0.3)
+        log = ActivityLog([sink], queue_size=2, batch_size=1, flush_seconds=0)
+
+        started = time.monotonic()
+        results = [log.log({"action": "a"}) for _ in range(10)]
+
+        self.assertLess(time.monotonic() - started, 0.2)
+        self.assertIn(False, results)
+        self.assertEqual(log.metrics()["dropped"], results.count(False))
+
+    def test_sampled_actions_carry_their_rate(self):
+        sink = RecordingSink()
+        log = ActivityLog([sink], sample_rates={"file_access": 0.2, "never": 0.0})
+
+        kept = sum(log.log({"action": "file_access"}) for _ in range(1000))
+        self.assertFalse(log.log({"action": "never"}))
+        self.assertTrue(log.log({"action": "face_comparison_success"}))
+        log.flush()
+
+        self.assertTrue(100 < kept < 300)
+        entries = [entry for batch in sink.batches for entry in batch]
+        self.assertTrue(
+            all(
+                e["sample_rate"] == 0.2 for e in entries if e["action"] == "file_access"
+            )
+        )
+        self.assertNotIn("sample_rate", entries[-1])
+        self.assertEqual(log.metrics()["sampled_out"], 1000 - kept + 1)
+
+    def test_sink_errors_counted(self):
+        sink = RecordingSink()
+        sink.write = lambda events: 1 / 0
+        log = ActivityLog([sink])
+
+        log.log({"action": "a"})
+        log.flush()
+
+        self.assertEqual(log.metrics()["write_errors"], 1)
+
+    def test_close_flushes_then_closes_sinks(self):
+        sink = RecordingSink()
+        sink.close = lambda: sink.batches.append("closed")
+        log = ActivityLog([sink], flush_seconds=10)
+
+        log.log({"action": "a"})
+        log.close()
+
+        self.assertEqual(sink.batches, [[{"action": "a"}], "closed"])
+
+    def test_parse_sample_rates(self):
+        self.assertEqual(
+            parse_sample_rates(" file_access=0.1, page_visit=1 "),
+            {"file_access": 0.1, "page_visit": 1.0},
+        )
+        self.assertEqual(parse_sample_rates(""), {})
+        with self.assertRaises(ValueError):
+            parse_sample_rates("file_access=2")
+
+
+class TestActivityLogFile(unittest.TestCase):
+    """Test the log file format, rotation and compression."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "user_activity.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def read_lines(self):
+        with open(self.path) as f:
+            return f.read().splitlines()
+
+    def test_lines_keep_asctime_json_format(self):
+        log_file = ActivityLogFile(self.path)
+        log_file.write([(time.time(), {"action": "page_visit"})])
+        log_file.close()
+
+        timestamp, entry = self.read_lines()[0].split(" - ", 1)
+        time.strptime(timestamp, "%Y-%m-%d %H:%M:%S,%f")
+        self.assertEqual(json.loads(entry), {"action": "page_visit"})
+
+    def test_rotated_by_size_and_compressed(self):
+        log_file = ActivityLogFile(self.path, max_bytes=100, backup_count=2)
+        for i in range(8):
+            log_file.write([(time.time() + i, {"action": "a", "pad": "x" * 100})])
+
+        backups = log_file.rotated_files()
+        self.assertEqual(len(backups), 2)
+        with gzip.open(backups[-1], "rt") as f:
+            self.assertIn('"action": "a"', f.read())
+        self.assertEqual(len(self.read_lines()), 1)
+        self.assertEqual(log_file.metrics()["rotations"], 7)
+
+    def test_rotated_by_age(self):
+        log_file = ActivityLogFile(self.path, max_age_seconds=60)
+        log_file.write([(time.time() - 120, {"action": "old"})])
+        log_file.close()
+
+        # A new process finds the file's start time in its first line
+        log_file = ActivityLogFile(self.path, max_age_seconds=60)
+        log_file.write([(time.time(), {"action": "new"})])
+
+        self.assertEqual(len(log_file.rotated_files()), 1)
+        self.assertIn('"new"', self.read_lines()[0])
+
+    def test_writer_follows_rotation_by_another_process(self):
+        first = ActivityLogFile(self.path, max_bytes=10)
+        second = ActivityLogFile(self.path, max_bytes=10)
+        first.write([(time.time(), {"action": "one"})])
+        second.write([(time.time(), {"action": "two"})])
+        first.write([(time.time(), {"action": "three"})])
+
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn('"three"', lines[0])
+        self.assertEqual(len(first.rotated_files()), 2)
+
+
+def run_tests():
+    """Run all activity log tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestActivityLog))
+    suite.addTests(loader.loadTestsFromTestCase(TestActivityLogFile))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running activity log tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All activity log tests passed!")
+    else:
+        print("\n❌ Some activity log tests failed!")
+        exit(1)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Tests for the indexed, paginated activity store.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from activity_store import ActivityStore  # noqa: E402
+
+
+def event(created, action="page_visit", ip_address="10.0.0.1", **extra):
+    """An ``(created, entry)`` event as the activity log queues it."""
+    return created, dict(action=action, ip_address=ip_address, **extra)
+
+
+class TestActivityStore(unittest.TestCase):
+    """Test writing, paging and filtering activity events."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = ActivityStore(os.path.join(self.folder, "activity.sqlite3"))
+        self.now = time.time()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_pages_newest_first_until_exhausted(self):
+        self.store.write([event(self.now + i, n=i) for i in range(7)])
+
+        seen = []
+        cursor = None
+        while True:
+            page = self.store.query(limit=3, cursor=cursor)
+            seen.extend(entry["n"] for entry in page["entries"])
+            cursor = page["next"]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, [6, 5, 4, 3, 2, 1, 0])
+
+    def test_events_at_the_same_time_not_skipped_between_pages(self):
+        self.store.write([event(self.now, n=i) for i in range(4)])
+
+        first = self.store.query(limit=2)
+        second = self.store.query(limit=2, cursor=first["next"])
+
+        numbers = [e["n"] for e in first["entries"] + second["entries"]]
+        self.assertEqual(sorted(numbers), [0, 1, 2, 3])
+        self.assertIsNone(second["next"])
+
+    def test_filters(self):
+        self.store.write(
+            [
+                event(self.now, "page_visit", "10.0.0.1"),
+                event(self.now + 1, "face_comparison_success", "10.0.0.2"),
+                event(self.now + 2, "face_comparison_success", "10.0.0.1"),
+            ]
+        )
+
+        by_action = self.store.query(action="face_comparison_success")["entries"]
+        by_ip = self.store.query(ip_address="10.0.0.1")["entries"]
+        recent = self.store.query(since=self.now + 1, until=self.now + 2)["entries"]
+
+        self.assertEqual([e["ip_address"] for e in by_action], ["10.0.0.1", "10.0.0.2"])
+        self.assertEqual([e["action"] for e in by_ip][-1], "page_visit")
+        self.assertEqual(len(recent), 1)
+        self.assertEqual(
+            self.store.actions(), ["face_comparison_success", "page_visit"]
+        )
+
+    def test_filtered_pages_use_indexes(self):
+        with self.store._db.connect() as conn:
+            plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM activity WHERE action = ?"
+                " ORDER BY created DESC, id DESC LIMIT 10",
+                ("page_visit",),
+            ).fetchall()
+        detail = " ".join(row[-1] for row in plan)
+        self.assertIn("activity_action", detail)
+        self.assertNotIn("TEMP B-TREE", detail)
+
+    def test_malformed_cursor_rejected(self):
+        with self.assertRaises(ValueError):
+            self.store.query(cursor="yesterday")
+
+    def test_old_events_pruned(self):
+        self.store.write([event(self.now - 100, n=0), event(self.now, n=1)])
+
+        self.assertEqual(self.store.prune(self.now - 50), 1)
+        self.assertEqual([e["n"] for e in self.store.query()["entries"]], [1])
+        self.assertEqual(self.store.metrics()["pruned"], 1)
+
+
+def run_tests():
+    """Run all activity store tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestActivityStore))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running activity store tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All activity store tests passed!")
+    else:
+        print("\n❌ Some activity store tests failed!")
+        exit(1)
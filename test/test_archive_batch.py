@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Tests for batch comparison of pairs read from zip and tar archives.
+"""
+
+import concurrent.futures
+import io
+import os
+import struct
+import sys
+import tarfile
+import threading
+import unittest
+import zipfile
+from unittest.mock import MagicMock
+
+import numpy as np
+from PIL import Image
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from archive_batch import (  # noqa: E402
+    ArchiveError,
+    ArchiveReader,
+    find_manifest,
+    read_archive_pairs,
+    stream_archive_batch,
+)
+
+
+def png_bytes(color="white", size=(8, 8)):
+    """Encode a small solid-colour PNG."""
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def make_zip(members, compression=zipfile.ZIP_STORED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def make_tar(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+
+class RecordingComparator:
+    """Comparator stand-in that counts encodings and tracks concurrency."""
+
+    def __init__(self):
+        self.encoded = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def get_face_data_from_image(self, image):
+        with self.lock:
+            self.encoded += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if image[0, 0, 0] == 0:
+                return {"encodings": None, "message": "No faces detected"}
+            return {"encodings": [np.zeros(128)], "message": "Found 1 faces"}
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def compare_encodings(self, encodings1, encodings2):
+        return {
+            "is_match": True,
+            "best_distance": 0.1,
+            "confidence": 77.8,
+            "matches": [(1, 1, 0.1)],
+        }
+
+
+class TestArchiveReader(unittest.TestCase):
+    """Test reading members and manifests from archives."""
+
+    def test_zip_and_tar_members(self):
+        members = {"photos/a.png": png_bytes(), "pairs.csv": b"photos/a.png,b.png\n"}
+        for archive in (make_zip(members), make_tar(members)):
+            reader = ArchiveReader(archive)
+            self.assertEqual(reader.names(), {"photos/a.png", "pairs.csv"})
+            self.assertEqual(reader.read("./photos/a.png"), members["photos/a.png"])
+            with self.assertRaises(KeyError):
+                reader.read("missing.png")
+
+    def test_compressed_tar_decompressed_once(self):
+        class CountingBytesIO(io.BytesIO):
+            read_bytes = 0
+
+            def read(self, size=-1):
+                data = super().read(size)
+                self.read_bytes += len(data)
+                return data
+
+        # Incompressible members, read last to first
+        members = {f"{i}.bin": os.urandom(50_000) for i in range(20)}
+        upload = CountingBytesIO(make_tar(members).getvalue())
+        reader = ArchiveReader(upload)
+        for name in sorted(members, reverse=True):
+            self.assertEqual(reader.read(name), members[name])
+        reader.close()
+
+        # Headers are walked once and the copy is made once, instead of a
+        # pass per backwards read
+        self.assertLess(upload.read_bytes, 3 * len(upload.getvalue()))
+
+    def test_rejects_non_archives(self):
+        with self.assertRaises(ArchiveError):
+            ArchiveReader(io.BytesIO(b"not an archive at all"))
+
+    def test_members_expanding_past_limit_not_read(self):
+        # A few kilobytes of deflated zeros that expand to 5 MB
+        archive = make_zip({"bomb.png": bytes(5_000_000)}, zipfile.ZIP_DEFLATED)
+        self.assertLess(len(archive.getvalue()), 50_000)
+        reader = ArchiveReader(archive, max_member_bytes=1_000_000)
+
+        with self.assertRaisesRegex(ArchiveError, "expands to 5.0 MB"):
+            reader.read("bomb.png")
+
+    def test_archives_expanding_past_limit_rejected(self):
+        members = {f"{i}.png": bytes(400_000) for i in range(3)}
+        for archive in (make_zip(members, zipfile.ZIP_DEFLATED), make_tar(members)):
+            with self.assertRaisesRegex(ArchiveError, "more than 1 MB"):
+                ArchiveReader(archive, max_expanded_bytes=1_000_000)
+
+    def test_manifest_inside_archive_is_relative_to_its_directory(self):
+        reader = ArchiveReader(
+            make_zip(
+                {
+                    "batch/pairs.jsonl": b'{"image1": "a.png", "image2": "sub/b.png"}\n',
+                    "batch/nested/pairs.csv": b"x,y\n",
+                }
+            )
+        )
+
+        self.assertEqual(find_manifest(reader.names()), "batch/pairs.jsonl")
+        self.assertEqual(
+            read_archive_pairs(reader),
+            [("a.png", "sub/b.png", "batch/a.png", "batch/sub/b.png")],
+        )
+
+    def test_uploaded_manifest_takes_precedence(self):
+        reader = ArchiveReader(make_zip({"pairs.csv": b"x.png,y.png\n"}))
+        pairs = read_archive_pairs(reader, "image1,image2\na.png,b.png\n", "list.csv")
+
+        self.assertEqual(pairs, [("a.png", "b.png", "a.png", "b.png")])
+
+    def test_missing_manifest(self):
+        with self.assertRaises(ArchiveError):
+            read_archive_pairs(ArchiveReader(make_zip({"a.png": png_bytes()})))
+
+
+class TestStreamArchiveBatch(unittest.TestCase):
+    """Test streaming comparison of archive members."""
+
+    def run_batch(self, members, pairs, max_pending=2):
+        comparator = RecordingComparator()
+        reader = ArchiveReader(make_zip(members))
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            records = list(
+                stream_archive_batch(
+                    reader, pairs, comparator, executor, max_pending=max_pending
+                )
+            )
+        return comparator, records
+
+    def test_each_member_encoded_once_with_bounded_concurrency(self):
+        names = [f"{i}.png" for i in range(6)]
+        members = {name: png_bytes() for name in names}
+        pairs = [(a, b, a, b) for a in names for b in names if a < b]
+
+        comparator, records = self.run_batch(members, pairs)
+
+        self.assertEqual(comparator.encoded, 6)
+        self.assertLessEqual(comparator.max_active, 2)
+        self.assertEqual(len(records), len(pairs) + 1)
+        self.assertEqual(
+            {(r["image1"], r["image2"]) for r in records[:-1]},
+            {(a, b) for a, b, _, _ in pairs},
+        )
+        self.assertEqual(records[-1]["summary"]["pairs"], len(pairs))
+        self.assertEqual(records[-1]["summary"]["images"], 6)
+
+    def test_failures_reported_per_pair(self):
+        members = {"a.png": png_bytes(), "dark.png": png_bytes("black")}
+        pairs = [
+            ("a.png", "dark.png", "a.png", "dark.png"),
+            ("a.png", "gone.png", "a.png", "gone.png"),
+        ]
+
+        _, records = self.run_batch(members, pairs)
+        by_pair = {(r["image1"], r["image2"]): r for r in records[:-1]}
+
+        self.assertEqual(
+            by_pair[("a.png", "dark.png")]["error"], "Face detection failed"
+        )
+        self.assertIn("not in the archive", by_pair[("a.png", "gone.png")]["message2"])
+        self.assertEqual(records[-1]["summary"]["matches"], 0)
+
+    def test_oversized_members_rejected_without_decoding(self):
+        members = {"a.png": png_bytes(), "big.png": png_bytes(size=(20, 20))}
+        comparator = RecordingComparator()
+        reader = ArchiveReader(make_zip(members))
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            records = list(
+                stream_archive_batch(
+                    reader,
+                    [("a.png", "big.png", "a.png", "big.png")],
+                    comparator,
+                    executor,
+                    max_pixels=100,
+                )
+            )
+
+        self.assertEqual(comparator.encoded, 1)
+        self.assertIn("at most 0.0001 MP", records[0]["message2"])
+
+    def test_members_too_large_to_expand_fail_their_pairs(self):
+        archive = make_zip(
+            {"a.png": png_bytes(), "bomb.png": bytes(5_000_000)}, zipfile.ZIP_DEFLATED
+        )
+        comparator = RecordingComparator()
+        reader = ArchiveReader(archive, max_member_bytes=1_000_000)
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            records = list(
+                stream_archive_batch(
+                    reader,
+                    [("a.png", "bomb.png", "a.png", "bomb.png")],
+                    comparator,
+                    executor,
+                )
+            )
+
+        self.assertEqual(comparator.encoded, 1)
+        self.assertIn("archive members may be at most 1 MB", records[0]["message2"])
+        self.assertEqual(records[-1]["summary"]["pairs"], 1)
+
+    def test_rejected_members_not_read_in_full(self):
+        class CountingFile(io.BytesIO):
+            read_bytes = 0
+
+            def read(self, size=-1):
+                data = super().read(size)
+                self.read_bytes += len(data)
+                return data
+
+        # A 4 MB member whose headers claim far more pixels than allowed
+        header = png_bytes(size=(2000, 2000))[:33]
+        data = header + struct.pack(">I", 4_000_000) + b"IDAT" + bytes(4_000_000)
+        archive = CountingFile(make_zip({"big.png": data}).read())
+        reader = ArchiveReader(archive)
+        archive.read_bytes = 0
+        comparator = RecordingComparator()
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            records = list(
+                stream_archive_batch(
+                    reader,
+                    [("big.png", "big.png", "big.png", "big.png")],
+                    comparator,
+                    executor,
+                    max_pixels=1_000_000,
+                )
+            )
+
+        self.assertIn("at most 1 MP", records[0]["message1"])
+        self.assertEqual(comparator.encoded, 0)
+        self.assertLess(archive.read_bytes, 100_000)
+
+    def test_comparator_errors_do_not_stop_the_batch(self):
+        comparator = MagicMock()
+        comparator.get_face_data_from_image.side_effect = RuntimeError("boom")
+        reader = ArchiveReader(make_zip({"a.png": png_bytes(), "b.png": png_bytes()}))
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            records = list(
+                stream_archive_batch(
+                    reader, [("a.png", "b.png", "a.png", "b.png")], comparator, executor
+                )
+            )
+
+        self.assertEqual(records[0]["message1"], "Error: boom")
+
+
+def run_tests():
+    """Run all archive batch tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestArchiveReader))
+    suite.addTests(loader.loadTestsFromTestCase(TestStreamArchiveBatch))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running archive batch tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All archive batch tests passed!")
+    else:
+        print("\n❌ Some archive batch tests failed!")
+        exit(1)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Tests for batch pair comparison.
+"""
+
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+import batch  # noqa: E402
+
+
+def fake_comparator_class():
+    """Build a FaceComparator stand-in that records which images it encodes."""
+
+    def face_data(path):
+        if "noface" in path:
+            return {
+                "encodings": None,
+                "message": "No faces detected with any method or image variation",
+            }
+        return {"encodings": [np.zeros(128)], "message": "Found 1 faces"}
+
+    comparator = MagicMock()
+    comparator.get_face_data_batch.side_effect = lambda paths: [
+        face_data(path) for path in paths
+    ]
+    comparator.compare_encodings.return_value = {
+        "is_match": True,
+        "best_distance": 0.25,
+        "confidence": 44.4,
+        "matches": [(1, 1, 0.25)],
+    }
+    return MagicMock(return_value=comparator), comparator
+
+
+def encoded_paths(comparator):
+    """All image paths passed to get_face_data_batch, in call order."""
+    return [
+        path
+        for call in comparator.get_face_data_batch.call_args_list
+        for path in call.args[0]
+    ]
+
+
+class TestManifest(unittest.TestCase):
+    """Test manifest parsing."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_csv_with_header(self):
+        stream = io.StringIO("image1,image2\na.jpg,b.jpg\nc.jpg,/abs/d.jpg\n")
+        pairs = batch.parse_manifest(stream, fmt="csv", base_dir="/data")
+
+        self.assertEqual(
+            pairs,
+            [
+                ("a.jpg", "b.jpg", "/data/a.jpg", "/data/b.jpg"),
+                ("c.jpg", "/abs/d.jpg", "/data/c.jpg", "/abs/d.jpg"),
+            ],
+        )
+
+    def test_csv_without_header_skips_blank_and_comment_rows(self):
+        stream = io.StringIO("# pairs\na.jpg, b.jpg\n\nsingle\n")
+        pairs = batch.parse_manifest(stream, fmt="csv")
+
+        self.assertEqual(pairs, [("a.jpg", "b.jpg", "a.jpg", "b.jpg")])
+
+    def test_jsonl_manifest_file(self):
+        manifest = os.path.join(self.test_dir, "pairs.jsonl")
+        with open(manifest, "w") as f:
+            f.write(json.dumps({"image1": "a.jpg", "image2": "b.jpg"}) + "\n\n")
+
+        pairs = batch.read_manifest(manifest)
+
+        self.assertEqual(len(pairs), 1)
+        self.assertEqual(pairs[0][2], os.path.join(self.test_dir, "a.jpg"))
+
+    def test_load_completed_pairs_ignores_truncated_lines(self):
+        output = os.path.join(self.test_dir, "results.jsonl")
+        with open(output, "w") as f:
+            f.write(json.dumps({"image1": "a.jpg", "image2": "b.jpg"}) + "\n")
+            f.write('{"image1": "c.jpg", "ima')
+
+        self.assertEqual(batch.load_completed_pairs(output), {("a.jpg", "b.jpg")})
+
+
+class TestRunBatch(unittest.TestCase):
+    """Test the batch runner with a stubbed comparator."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.test_dir, "results.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def read_results(self):
+        with open(self.output) as f:
+            return [json.loads(line) for line in f]
+
+    def test_each_image_encoded_once(self):
+        pairs = batch.parse_manifest(
+            io.StringIO("a.jpg,b.jpg\na.jpg,c.jpg\nb.jpg,c.jpg\n"), fmt="csv"
+        )
+        comparator_class, comparator = fake_comparator_class()
+
+        with patch("batch.FaceComparator", comparator_class):
+            stats = batch.run_batch(pairs, self.output, workers=1, log=lambda m: None)
+
+        self.assertEqual(sorted(encoded_paths(comparator)), ["a.jpg", "b.jpg", "c.jpg"])
+        self.assertEqual(stats["pairs"], 3)
+        self.assertEqual(stats["images"], 3)
+        self.assertEqual(len(self.read_results()), 3)
+
+    def test_resume_skips_completed_pairs(self):
+        pairs = batch.parse_manifest(
+            io.StringIO("a.jpg,b.jpg\nc.jpg,d.jpg\n"), fmt="csv"
+        )
+        with open(self.output, "w") as f:
+            f.write(json.dumps({"image1": "a.jpg", "image2": "b.jpg"}) + "\n")
+        comparator_class, comparator = fake_comparator_class()
+
+        with patch("batch.FaceComparator", comparator_class):
+            stats = batch.run_batch(pairs, self.output, workers=1, log=lambda m: None)
+
+        self.assertEqual(sorted(encoded_paths(comparator)), ["c.jpg", "d.jpg"])
+        self.assertEqual(stats["skipped"], 1)
+        self.assertEqual(len(self.read_results()), 2)
+
+    def test_images_encoded_in_chunks(self):
+        pairs = batch.parse_manifest(
+            io.StringIO("a.jpg,b.jpg\nc.jpg,d.jpg\ne.jpg,a.jpg\n"), fmt="csv"
+        )
+        comparator_class, comparator = fake_comparator_class()
+
+        with patch("batch.FaceComparator", comparator_class):
+            stats = batch.run_batch(
+                pairs, self.output, workers=1, chunk_size=2, log=lambda m: None
+            )
+
+        chunk_sizes = [
+            len(call.args[0]) for call in comparator.get_face_data_batch.call_args_list
+        ]
+        self.assertEqual(chunk_sizes, [2, 2, 1])
+        self.assertEqual(stats["pairs"], 3)
+
+    def test_detection_failure_is_recorded(self):
+        pairs = batch.parse_manifest(io.StringIO("a.jpg,noface.jpg\n"), fmt="csv")
+        comparator_class, _ = fake_comparator_class()
+
+        with patch("batch.FaceComparator", comparator_class):
+            batch.run_batch(pairs, self.output, workers=1, log=lambda m: None)
+
+        record = self.read_results()[0]
+        self.assertFalse(record["is_same_person"])
+        self.assertIsNone(record["distance"])
+        self.assertEqual(record["faces2"], 0)
+        self.assertIn("error", record)
+
+
+def run_tests():
+    """Run all batch tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestManifest))
+    suite.addTests(loader.loadTestsFromTestCase(TestRunBatch))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running batch comparison tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All batch tests passed!")
+    else:
+        print("\n❌ Some batch tests failed!")
+        exit(1)
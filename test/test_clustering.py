@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Tests for photo-library face clustering.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+import clustering  # noqa: E402
+
+
+def make_identities(per_identity=5, identities=3, seed=1):
+    """Create tight, well separated groups of fake 128-d encodings."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(identities, 128))
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    encodings = []
+    expected = []
+    for identity, centre in enumerate(centres):
+        for _ in range(per_identity):
+            encodings.append(centre + rng.normal(scale=0.01, size=128))
+            expected.append(identity)
+    return np.array(encodings), expected
+
+
+class TestSimilarityEdges(unittest.TestCase):
+    """Test blocked distance computation."""
+
+    def test_blocked_matches_full_matrix(self):
+        encodings, _ = make_identities()
+        full = np.linalg.norm(encodings[:, None] - encodings[None, :], axis=2)
+        expected = {
+            (i, j)
+            for i in range(len(encodings))
+            for j in range(i + 1, len(encodings))
+            if full[i, j] <= 0.45
+        }
+
+        for block_size in (1, 4, 7, 1024):
+            edges, comparisons = clustering.similarity_edges(
+                encodings, 0.45, block_size=block_size
+            )
+            self.assertEqual({(i, j) for i, j, _ in edges}, expected)
+            self.assertEqual(comparisons, len(encodings) * (len(encodings) - 1) // 2)
+
+    def test_edges_capped_at_nearest_neighbours(self):
+        encodings, _ = make_identities(per_identity=20, identities=2)
+        full = np.linalg.norm(encodings[:, None] - encodings[None, :], axis=2)
+        np.fill_diagonal(full, np.inf)
+
+        for block_size in (3, 1024):
+            edges, _ = clustering.similarity_edges(
+                encodings, 0.45, block_size=block_size, max_neighbours=3
+            )
+            linked = {(i, j) for i, j, _ in edges}
+
+            # Every face keeps its three closest matches, and no more than
+            # its own three plus those of faces that chose it
+            self.assertLessEqual(len(edges), 3 * len(encodings))
+            self.assertLess(len(edges), 2 * 20 * 19 // 2)
+            for i in range(len(encodings)):
+                for j in np.argsort(full[i])[:3]:
+                    self.assertIn((min(i, j), max(i, j)), linked)
+            for i, j, distance in edges:
+                self.assertAlmostEqual(distance, full[i, j], places=5)
+
+    def test_capped_graph_recovers_identities(self):
+        encodings, expected = make_identities(per_identity=20, identities=3)
+        edges, _ = clustering.similarity_edges(encodings, 0.45, max_neighbours=8)
+        labels = clustering.chinese_whispers(len(encodings), edges)
+
+        for i in range(len(encodings)):
+            for j in range(len(encodings)):
+                self.assertEqual(
+                    labels[i] == labels[j], expected[i] == expected[j], (i, j)
+                )
+
+    def test_empty_input(self):
+        edges, comparisons = clustering.similarity_edges(np.zeros((0, 128)), 0.45)
+        self.assertEqual(edges, [])
+        self.assertEqual(comparisons, 0)
+
+
+class TestChineseWhispers(unittest.TestCase):
+    """Test graph clustering."""
+
+    def test_recovers_identities(self):
+        encodings, expected = make_identities()
+        edges, _ = clustering.similarity_edges(encodings, 0.45, block_size=4)
+        labels = clustering.chinese_whispers(len(encodings), edges)
+
+        for i in range(len(encodings)):
+            for j in range(len(encodings)):
+                self.assertEqual(
+                    labels[i] == labels[j], expected[i] == expected[j], (i, j)
+                )
+
+    def test_isolated_faces_stay_alone(self):
+        labels = clustering.chinese_whispers(3, [])
+        self.assertEqual(len(set(labels)), 3)
+
+    def test_build_clusters_orders_by_size(self):
+        faces = [{"path": f"{i}.jpg", "face_index": 0} for i in range(4)]
+        encodings = np.array([[0.0], [0.1], [0.2], [5.0]])
+        clusters = clustering.build_clusters(faces, encodings, [0, 0, 0, 3])
+
+        self.assertEqual([c["size"] for c in clusters], [3, 1])
+        self.assertEqual(clusters[0]["representative"]["path"], "1.jpg")
+
+
+class TestRunClustering(unittest.TestCase):
+    """Test the end-to-end command with a stubbed comparator."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_writes_cluster_assignments(self):
+        encodings, _ = make_identities(per_identity=2, identities=2)
+        photos = os.path.join(self.test_dir, "photos", "nested")
+        os.makedirs(photos)
+        names = ["a.jpg", "b.png", "c.jpg", "d.jpeg", "notes.txt", "empty.jpg"]
+        for name in names:
+            open(os.path.join(photos, name), "w").close()
+
+        by_name = dict(zip(["a.jpg", "b.png", "c.jpg", "d.jpeg"], encodings))
+
+        def get_face_data(path):
+            name = os.path.basename(path)
+            if name not in by_name:
+                return {"encodings": None, "locations": [], "message": "No faces"}
+            return {
+                "encodings": [by_name[name]],
+                "locations": [(1, 2, 3, 4)],
+                "message": "Found 1 faces",
+            }
+
+        comparator = MagicMock()
+        comparator.get_face_data_batch.side_effect = lambda paths: [
+            get_face_data(path) for path in paths
+        ]
+        output = os.path.join(self.test_dir, "clusters.json")
+
+        with patch("batch.FaceComparator", MagicMock(return_value=comparator)):
+            stats = clustering.run_clustering(
+                os.path.join(self.test_dir, "photos"),
+                output,
+                workers=1,
+                log=lambda m: None,
+            )
+
+        with open(output) as f:
+            result = json.load(f)
+
+        self.assertEqual(stats["faces"], 4)
+        self.assertEqual(stats["images"], 5)
+        self.assertEqual([c["size"] for c in result["clusters"]], [2, 2])
+        self.assertEqual(
+            result["unclustered_images"][0]["path"],
+            os.path.join("nested", "empty.jpg"),
+        )
+        self.assertIn("encode_faces_per_second", result["stats"])
+        self.assertIn("cluster_faces_per_second", result["stats"])
+
+
+def run_tests():
+    """Run all clustering tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestSimilarityEdges))
+    suite.addTests(loader.loadTestsFromTestCase(TestChineseWhispers))
+    suite.addTests(loader.loadTestsFromTestCase(TestRunClustering))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running clustering tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All clustering tests passed!")
+    else:
+        print("\n❌ Some clustering tests failed!")
+        exit(1)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Tests for the warm comparison daemon and its client.
+"""
+
+import os
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+import daemon  # noqa: E402
+
+
+class TestDaemon(unittest.TestCase):
+    """Run a daemon on a temporary socket with a stubbed comparator."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.test_dir, "daemon.sock")
+
+        self.comparator = MagicMock()
+
+        def compare_faces(image1, image2):
+            print("FINAL RESULT:")
+            return True, "Distance: 0.200, Confidence: 55.6%"
+
+        self.comparator.compare_faces.side_effect = compare_faces
+        self.factory = MagicMock(return_value=self.comparator)
+
+        self.server = daemon.ComparisonDaemon(
+            self.socket_path, comparator_factory=self.factory
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.test_dir)
+
+    def test_ping(self):
+        response = daemon.request({"op": "ping"}, self.socket_path)
+        self.assertEqual(response, {"ok": True, "pid": os.getpid()})
+
+    def test_compare_returns_result_and_output(self):
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop(daemon.DISABLE_ENV, None)
+            response = daemon.compare_via_daemon(
+                "a.png", "b.png", socket_path=self.socket_path
+            )
+
+        self.assertTrue(response["ok"])
+        self.assertTrue(response["is_same_person"])
+        self.assertIn("FINAL RESULT:", response["output"])
+        self.comparator.compare_faces.assert_called_once_with(
+            os.path.abspath("a.png"), os.path.abspath("b.png")
+        )
+
+    def test_comparator_reused_across_requests(self):
+        for _ in range(3):
+            daemon.request(
+                {"op": "compare", "image1": "/a.png", "image2": "/b.png"},
+                self.socket_path,
+            )
+
+        self.assertEqual(self.factory.call_count, 1)
+        self.assertEqual(self.comparator.compare_faces.call_count, 3)
+
+    def test_errors_are_reported(self):
+        self.comparator.compare_faces.side_effect = FileNotFoundError("missing.png")
+        response = daemon.request(
+            {"op": "compare", "image1": "/a.png", "image2": "/missing.png"},
+            self.socket_path,
+        )
+
+        self.assertFalse(response["ok"])
+        self.assertIn("missing.png", response["error"])
+
+    def test_other_users_socket_not_used(self):
+        with patch("daemon.os.getuid", return_value=os.getuid() + 1):
+            self.assertIsNone(daemon.request({"op": "ping"}, self.socket_path))
+        self.comparator.compare_faces.assert_not_called()
+
+    def test_second_daemon_refused(self):
+        with self.assertRaises(RuntimeError):
+            daemon.ComparisonDaemon(self.socket_path, comparator_factory=self.factory)
+
+
+class TestClientFallback(unittest.TestCase):
+    """Test the client when no daemon is available."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_no_daemon_returns_none(self):
+        missing = os.path.join(self.test_dir, "missing.sock")
+        self.assertIsNone(daemon.request({"op": "ping"}, missing))
+
+    def test_disabled_by_environment(self):
+        with patch.dict(os.environ, {daemon.DISABLE_ENV: "1"}):
+            self.assertIsNone(daemon.compare_via_daemon("a.png", "b.png"))
+
+    def test_default_socket_in_private_directory(self):
+        environ = {
+            k: v
+            for k, v in os.environ.items()
+            if k not in (daemon.SOCKET_ENV, "XDG_RUNTIME_DIR")
+        }
+        with patch.dict(os.environ, environ, clear=True), patch(
+            "daemon.tempfile.gettempdir", return_value=self.test_dir
+        ):
+            socket_path = daemon.default_socket_path()
+            self.assertEqual(os.path.dirname(socket_path), daemon.private_directory())
+            self.assertTrue(socket_path.startswith(self.test_dir + os.sep))
+
+            server = daemon.ComparisonDaemon(comparator_factory=MagicMock())
+            try:
+                mode = os.stat(os.path.dirname(socket_path)).st_mode
+                self.assertEqual(stat.S_IMODE(mode), 0o700)
+                self.assertEqual(server.socket_path, socket_path)
+            finally:
+                server.server_close()
+
+    def test_shared_socket_directory_refused(self):
+        shared = os.path.join(self.test_dir, "shared")
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        with self.assertRaises(RuntimeError):
+            daemon.ensure_private_directory(shared)
+
+        private = os.path.join(self.test_dir, "private")
+        daemon.ensure_private_directory(private)
+        daemon.ensure_private_directory(private)
+        self.assertEqual(stat.S_IMODE(os.stat(private).st_mode), 0o700)
+
+    def test_socket_created_private(self):
+        socket_path = os.path.join(self.test_dir, "private.sock")
+        umask = os.umask(0o022)
+        try:
+            with patch("daemon.os.chmod") as chmod:
+                server = daemon.ComparisonDaemon(
+                    socket_path, comparator_factory=MagicMock()
+                )
+            restored = os.umask(umask)
+        finally:
+            os.umask(umask)
+        try:
+            mode = stat.S_IMODE(os.stat(socket_path).st_mode)
+        finally:
+            server.server_close()
+
+        # Owner-only when bound, not chmodded afterwards
+        self.assertEqual(mode, 0o600)
+        chmod.assert_not_called()
+        self.assertEqual(restored, 0o022)
+
+    def test_stale_socket_is_replaced(self):
+        socket_path = os.path.join(self.test_dir, "stale.sock")
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(socket_path)
+        stale.close()
+
+        server = daemon.ComparisonDaemon(socket_path, comparator_factory=MagicMock())
+        server.server_close()
+
+        self.assertFalse(os.path.exists(socket_path))
+
+
+def run_tests():
+    """Run all daemon tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestDaemon))
+    suite.addTests(loader.loadTestsFromTestCase(TestClientFallback))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running daemon tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All daemon tests passed!")
+    else:
+        print("\n❌ Some daemon tests failed!")
+        exit(1)
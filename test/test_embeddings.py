@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for precomputed embedding files.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from embeddings import (  # noqa: E402
+    EmbeddingMismatchError,
+    is_embedding_file,
+    load_embeddings,
+    save_embeddings,
+)
+from face_compare import FaceComparator  # noqa: E402
+
+SETTINGS = FaceComparator.ENCODING_SETTINGS
+
+
+def sample_face_data(count=2):
+    """Face data shaped like FaceComparator.get_face_data's result."""
+    rng = np.random.default_rng(0)
+    return {
+        "encodings": [rng.normal(scale=0.1, size=128) for _ in range(count)],
+        "locations": [(10 * i, 50 + 10 * i, 60 + 10 * i, 5 * i) for i in range(count)],
+        "strategy": "HOG",
+        "variation": "Original",
+        "image_size": (640, 480),
+        "message": f"Found {count} faces using HOG on Original",
+    }
+
+
+class TestEmbeddingFiles(unittest.TestCase):
+    """Test saving and loading embedding files."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, "reference.jpg.npz")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_round_trip(self):
+        face_data = sample_face_data()
+        save_embeddings(self.path, face_data, SETTINGS, source="reference.jpg")
+
+        loaded = load_embeddings(self.path, SETTINGS)
+
+        self.assertEqual(len(loaded["encodings"]), 2)
+        np.testing.assert_allclose(
+            loaded["encodings"][1], face_data["encodings"][1], atol=1e-6
+        )
+        self.assertEqual(loaded["locations"], face_data["locations"])
+        self.assertEqual(loaded["strategy"], "HOG")
+        self.assertEqual(loaded["image_size"], (640, 480))
+        self.assertEqual(loaded["source"], "reference.jpg")
+
+    def test_mismatched_settings_rejected(self):
+        save_embeddings(self.path, sample_face_data(), SETTINGS)
+        other_settings = dict(SETTINGS, num_jitters=10)
+
+        with self.assertRaises(EmbeddingMismatchError) as ctx:
+            load_embeddings(self.path, other_settings)
+        self.assertIn("num_jitters", str(ctx.exception))
+
+    def test_is_embedding_file(self):
+        self.assertTrue(is_embedding_file("a.jpg.npz"))
+        self.assertTrue(is_embedding_file("A.NPZ"))
+        self.assertFalse(is_embedding_file("a.jpg"))
+
+    def test_comparator_accepts_embedding_files(self):
+        face_data = sample_face_data(count=1)
+        save_embeddings(self.path, face_data, SETTINGS)
+        comparator = FaceComparator()
+
+        encodings, message = comparator.get_face_encodings(self.path)
+        self.assertEqual(len(encodings), 1)
+        self.assertIn("Loaded 1 faces", message)
+
+        is_same, details = comparator.compare_faces(self.path, self.path)
+        self.assertTrue(is_same)
+        self.assertIn("Distance: 0.000", details)
+
+
+def run_tests():
+    """Run all embedding file tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestEmbeddingFiles))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running embedding file tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All embedding file tests passed!")
+    else:
+        print("\n❌ Some embedding file tests failed!")
+        exit(1)
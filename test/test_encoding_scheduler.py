@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Tests for cross-request micro-batching of face encoding.
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from encoding_scheduler import EncodingScheduler  # noqa: E402
+
+
+class RecordingEncoder:
+    """Descriptor stand-in: doubles each chip and records batch sizes."""
+
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, chips):
+        with self.lock:
+            self.batches.append(len(chips))
+        return [chip * 2 for chip in chips]
+
+
+class TestEncodingScheduler(unittest.TestCase):
+    """Test batching, result routing and metrics."""
+
+    def run_concurrently(self, scheduler, inputs):
+        """Call scheduler.encode from one thread per input, all at once."""
+        results = [None] * len(inputs)
+        barrier = threading.Barrier(len(inputs))
+
+        def worker(index):
+            barrier.wait()
+            results[index] = scheduler.encode(inputs[index])
+
+        threads = [
+            threading.Thread(target=worker, args=(i,)) for i in range(len(inputs))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_requests_share_batches(self):
+        encoder = RecordingEncoder()
+        scheduler = EncodingScheduler(encoder, max_wait_ms=200, max_batch_size=64)
+        inputs = [[i, i + 100] for i in range(8)]
+
+        results = self.run_concurrently(scheduler, inputs)
+
+        self.assertEqual(results, [[i * 2, (i + 100) * 2] for i in range(8)])
+        self.assertEqual(sum(encoder.batches), 16)
+        self.assertLess(len(encoder.batches), 8)
+
+    def test_batch_size_cap_triggers_run(self):
+        encoder = RecordingEncoder()
+        scheduler = EncodingScheduler(encoder, max_wait_ms=5000, max_batch_size=2)
+
+        # Would wait five seconds for company if the cap did not apply.
+        self.assertEqual(scheduler.encode([1, 2]), [2, 4])
+        self.assertEqual(encoder.batches, [2])
+
+    def test_empty_input_skips_queue(self):
+        encoder = RecordingEncoder()
+        scheduler = EncodingScheduler(encoder)
+
+        self.assertEqual(scheduler.encode([]), [])
+        self.assertEqual(encoder.batches, [])
+
+    def test_errors_reach_every_caller(self):
+        def failing(chips):
+            raise RuntimeError("model failure")
+
+        scheduler = EncodingScheduler(failing, max_wait_ms=1)
+
+        with self.assertRaises(RuntimeError):
+            scheduler.encode([1])
+
+    def test_base_exceptions_reach_callers_and_thread_survives(self):
+        calls = []
+
+        def interrupted_once(chips):
+            calls.append(chips)
+            if len(calls) == 1:
+                raise KeyboardInterrupt
+            return [chip * 2 for chip in chips]
+
+        scheduler = EncodingScheduler(interrupted_once, max_wait_ms=1)
+        outcome = []
+
+        def encode():
+            try:
+                scheduler.encode([1])
+            except KeyboardInterrupt:
+                outcome.append("interrupted")
+
+        # The caller is told instead of waiting forever
+        thread = threading.Thread(target=encode)
+        thread.start()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(outcome, ["interrupted"])
+
+        # and later callers are still served
+        self.assertEqual(scheduler.encode([3]), [6])
+
+    def test_metrics(self):
+        encoder = RecordingEncoder()
+        scheduler = EncodingScheduler(encoder, max_wait_ms=1, max_batch_size=4)
+        scheduler.encode([1, 2])
+        scheduler.encode([3])
+
+        metrics = scheduler.metrics()
+
+        self.assertEqual(metrics["batches"], 2)
+        self.assertEqual(metrics["requests"], 2)
+        self.assertEqual(metrics["faces"], 3)
+        self.assertEqual(metrics["batch_size_histogram"], {"1": 1, "2": 1})
+        self.assertAlmostEqual(metrics["mean_batch_fill"], 0.375)
+
+
+def run_tests():
+    """Run all encoding scheduler tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestEncodingScheduler))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running encoding scheduler tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All encoding scheduler tests passed!")
+    else:
+        print("\n❌ Some encoding scheduler tests failed!")
+        exit(1)
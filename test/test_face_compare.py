@@ -8,6 +8,7 @@ import shutil
 import sys
 import tempfile
 import unittest
+from unittest.mock import MagicMock, patch
 
 import numpy as np
 from PIL import Image, ImageDraw
@@ -16,7 +17,7 @@ from PIL import Image, ImageDraw
 sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
 
 # Import after path modification  # noqa: E402
-from face_compare import FaceComparator  # noqa: E402
+from face_compare import DetectionCache, FaceComparator  # noqa: E402
 
 
 class TestFaceComparator(unittest.TestCase):
@@ -185,6 +186,187 @@ class TestFaceComparator(unittest.TestCase):
         for face in faces:
             self.assertEqual(len(face), 4)
 
+    def test_comparators_share_one_cascade(self):
+        """The Haar cascade is loaded once, not by every comparator."""
+        self.assertIs(FaceComparator().face_cascade, self.comparator.face_cascade)
+        self.assertFalse(self.comparator.face_cascade.empty())
+
+
+class TestBatchEncoding(unittest.TestCase):
+    """Test batched descriptor computation with stubbed dlib models."""
+
+    def setUp(self):
+        self.comparator = FaceComparator()
+        self.encoder = MagicMock()
+        # One distinct descriptor per chip, numbered in submission order.
+        self.submitted = []
+
+        def compute_face_descriptor(chips, num_jitters):
+            start = len(self.submitted)
+            self.submitted.extend(chips)
+            return [[float(start + i)] * 128 for i in range(len(chips))]
+
+        self.encoder.compute_face_descriptor.side_effect = compute_face_descriptor
+
+    def encode(self, items, batch_size):
+        with patch("face_compare.face_recognition.api") as api, patch(
+            "face_compare.dlib"
+        ) as dlib:
+            api.face_encoder = self.encoder
+            dlib.get_face_chip.side_effect = lambda image, shape, **kwargs: image
+            return self.comparator.encode_faces_batch(items, batch_size=batch_size)
+
+    def test_faces_from_many_images_share_batches(self):
+        image = np.zeros((10, 10, 3), dtype=np.uint8)
+        items = [
+            (image, [(0, 5, 5, 0), (1, 6, 6, 1)]),
+            (image, []),
+            (image, [(2, 7, 7, 2)]),
+        ]
+
+        results = self.encode(items, batch_size=64)
+
+        self.assertEqual(self.encoder.compute_face_descriptor.call_count, 1)
+        self.assertEqual([len(r) for r in results], [2, 0, 1])
+        self.assertEqual(results[0][1][0], 1.0)
+        self.assertEqual(results[2][0][0], 2.0)
+
+    def test_batch_size_limits_chips_per_call(self):
+        image = np.zeros((10, 10, 3), dtype=np.uint8)
+        items = [(image, [(0, 5, 5, 0)] * 3), (image, [(0, 5, 5, 0)] * 2)]
+
+        results = self.encode(items, batch_size=2)
+
+        batch_sizes = [
+            len(call.args[0])
+            for call in self.encoder.compute_face_descriptor.call_args_list
+        ]
+        self.assertEqual(batch_sizes, [2, 2, 1])
+        self.assertEqual([r[0] for r in results[1]], [3.0, 4.0])
+
+
+class TestMaskedReuse(unittest.TestCase):
+    """Test reuse of unmasked faces when masks are applied."""
+
+    FACES = [(10, 50, 50, 10), (10, 150, 50, 110)]
+
+    def setUp(self):
+        self.comparator = FaceComparator(detection_cache=DetectionCache())
+        self.image = np.full((100, 200, 3), 255, dtype=np.uint8)
+        self.unmasked = {
+            "encodings": [np.full(128, 1.0), np.full(128, 2.0)],
+            "locations": list(self.FACES),
+            "strategy": "HOG",
+            "variation": "Original",
+            "image_size": (200, 100),
+            "message": "Found 2 faces using HOG on Original",
+        }
+        self.comparator.encode_faces = MagicMock(
+            side_effect=lambda image, locations: [np.full(128, 9.0)] * len(locations)
+        )
+
+    def mask(self, top, bottom, left, right):
+        mask = np.zeros((100, 200), dtype=bool)
+        mask[top:bottom, left:right] = True
+        return mask
+
+    def masked_face_data(self, mask, found=(), unmasked=None):
+        with patch("face_compare.face_recognition.face_locations") as locate:
+            locate.return_value = list(found)
+            face_data = self.comparator.get_masked_face_data(
+                self.image, mask, unmasked=unmasked or self.unmasked
+            )
+        return face_data, locate
+
+    def test_mask_clear_of_faces_reuses_everything(self):
+        # Just outside the second face's box plus its 25% margin
+        face_data, locate = self.masked_face_data(self.mask(0, 100, 180, 200))
+
+        locate.assert_not_called()
+        self.comparator.encode_faces.assert_not_called()
+        self.assertEqual(face_data["reused"], 2)
+        self.assertEqual(face_data["encodings"][1][0], 2.0)
+
+    def test_only_occluded_faces_reencoded(self):
+        moved = (20, 150, 60, 110)
+        face_data, locate = self.masked_face_data(
+            self.mask(0, 30, 100, 200), found=[self.FACES[0], moved]
+        )
+
+        self.assertEqual(locate.call_count, 1)
+        # The first cascade step runs on the masked pixels
+        self.assertTrue(np.all(locate.call_args[0][0][0, 150] == 0))
+        self.comparator.encode_faces.assert_called_once()
+        self.assertEqual(self.comparator.encode_faces.call_args[0][1], [moved])
+        self.assertEqual(face_data["reused"], 1)
+        self.assertEqual([e[0] for e in face_data["encodings"]], [1.0, 9.0])
+        self.assertEqual(face_data["locations"], [self.FACES[0], moved])
+
+    def test_hidden_face_dropped(self):
+        face_data, _ = self.masked_face_data(
+            self.mask(0, 100, 100, 200), found=[self.FACES[0]]
+        )
+
+        self.assertEqual(face_data["reused"], 1)
+        self.assertEqual(len(face_data["encodings"]), 1)
+
+    def test_estimate_reencodes_touched_faces_without_detecting(self):
+        self.comparator.detect_faces = MagicMock()
+        every_face = self.mask(0, 100, 0, 200)
+        with patch("face_compare.face_recognition.face_locations") as locate:
+            face_data = self.comparator.get_masked_face_data(
+                self.image,
+                self.mask(0, 30, 100, 200),
+                unmasked=self.unmasked,
+                redetect=False,
+            )
+            hidden = self.comparator.get_masked_face_data(
+                self.image, every_face, unmasked=self.unmasked, redetect=False
+            )
+
+        locate.assert_not_called()
+        self.comparator.detect_faces.assert_not_called()
+        self.assertEqual(
+            self.comparator.encode_faces.call_args_list[0][0][1], [self.FACES[1]]
+        )
+        self.assertEqual(face_data["reused"], 1)
+        self.assertEqual([e[0] for e in face_data["encodings"]], [1.0, 9.0])
+        self.assertEqual(face_data["locations"], self.FACES)
+        self.assertEqual(hidden["reused"], 0)
+        self.assertEqual(len(hidden["encodings"]), 2)
+
+    def test_full_cascade_when_nothing_can_be_reused(self):
+        self.comparator.detect_faces = MagicMock(return_value=None)
+        every_face = self.mask(0, 100, 0, 200)
+        global_variation = dict(self.unmasked, variation="Enhanced contrast")
+
+        for mask, unmasked in (
+            (every_face, self.unmasked),
+            (self.mask(0, 5, 0, 5), global_variation),
+        ):
+            face_data, locate = self.masked_face_data(mask, unmasked=unmasked)
+            self.assertEqual(face_data["reused"], 0)
+            self.assertIsNone(face_data["encodings"])
+            locate.assert_not_called()
+        self.assertEqual(self.comparator.detect_faces.call_count, 2)
+
+    def test_detection_cache(self):
+        self.comparator.detect_faces = MagicMock(return_value=None)
+        for _ in range(2):
+            self.comparator.get_face_data_from_image(self.image)
+
+        self.assertEqual(self.comparator.detect_faces.call_count, 1)
+        self.assertEqual(self.comparator.detection_cache.metrics()["hits"], 1)
+
+        # Masking an image analyzed before starts from its cached faces
+        self.comparator.detection_cache.put(
+            DetectionCache.key(self.image), self.unmasked
+        )
+        face_data = self.comparator.get_masked_face_data(
+            self.image, self.mask(0, 100, 180, 200)
+        )
+        self.assertEqual(face_data["reused"], 2)
+
 
 class TestIntegration(unittest.TestCase):
     """Integration tests using actual image files."""
@@ -209,6 +391,30 @@ class TestIntegration(unittest.TestCase):
         self.assertIsInstance(is_same, bool)
         self.assertIsInstance(details, str)
 
+    def test_masked_reuse_matches_full_analysis(self):
+        """Test that reused encodings equal those of the masked image."""
+        test_dir = os.path.join(os.path.dirname(__file__), "test_data")
+        halves = [
+            Image.open(os.path.join(test_dir, name)).convert("RGB").resize((500, 500))
+            for name in ("me3.png", "me_different.png")
+        ]
+        image = np.concatenate([np.array(half) for half in halves], axis=1)
+        mask = np.zeros(image.shape[:2], dtype=bool)
+        mask[150:300, 600:900] = True  # The second face's eyes
+
+        comparator = FaceComparator(detection_cache=DetectionCache())
+        comparator.get_face_data_from_image(image)
+        reused = comparator.get_masked_face_data(image, mask)
+
+        masked = image.copy()
+        masked[mask] = 0
+        full = FaceComparator().get_face_data_from_image(masked)
+
+        self.assertEqual(reused["locations"], full["locations"])
+        self.assertGreaterEqual(reused["reused"], 1)
+        for encoding, expected in zip(reused["encodings"], full["encodings"]):
+            self.assertLess(np.linalg.norm(encoding - expected), 1e-4)
+
     def test_known_same_vs_different(self):
         """Test with known same and different face pairs."""
         # This test uses the known images in the project
@@ -268,6 +474,8 @@ def run_tests():
 
     # Add test classes
     suite.addTests(loader.loadTestsFromTestCase(TestFaceComparator))
+    suite.addTests(loader.loadTestsFromTestCase(TestBatchEncoding))
+    suite.addTests(loader.loadTestsFromTestCase(TestMaskedReuse))
     suite.addTests(loader.loadTestsFromTestCase(TestIntegration))
 
     # Run tests
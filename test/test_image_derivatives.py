@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Tests for display-sized derivatives of stored uploads.
+"""
+
+import concurrent.futures
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from PIL import Image
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from image_derivatives import (  # noqa: E402
+    EXIF_ORIENTATION,
+    DerivativeMaker,
+    decode_reduced,
+    render_derivative,
+)
+from upload_store import UploadStore  # noqa: E402
+
+
+def jpeg_bytes(size=(1600, 1200), orientation=None):
+    """Encode a solid-colour JPEG, optionally with an EXIF orientation."""
+    buffer = io.BytesIO()
+    image = Image.new("RGB", size, "gray")
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[EXIF_ORIENTATION] = orientation
+    image.save(buffer, "JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+class TestRenderDerivative(unittest.TestCase):
+    """Test downscaling and orienting derivatives."""
+
+    def test_fits_max_size_keeping_aspect(self):
+        derivative = render_derivative(np.zeros((1200, 1600, 3), np.uint8), 800)
+        self.assertEqual(derivative.size, (800, 600))
+
+    def test_small_images_not_enlarged(self):
+        derivative = render_derivative(np.zeros((100, 50, 3), np.uint8), 800)
+        self.assertEqual(derivative.size, (50, 100))
+
+    def test_resized_once(self):
+        resize = Image.Image.resize
+        with patch.object(
+            Image.Image, "resize", autospec=True, side_effect=resize
+        ) as resized:
+            derivative = render_derivative(np.zeros((1500, 2000, 3), np.uint8), 800)
+
+        self.assertEqual(derivative.size, (800, 600))
+        self.assertEqual(resized.call_count, 1)
+
+    def test_turned_upright(self):
+        derivative = render_derivative(np.zeros((600, 800, 3), np.uint8), 800, 6)
+        self.assertEqual(derivative.size, (600, 800))
+
+    def test_jpeg_decoded_at_reduced_scale(self):
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as f:
+            f.write(jpeg_bytes((3200, 2400), orientation=8))
+            f.flush()
+            image, orientation = decode_reduced(f.name, 800)
+        self.assertEqual(image.shape, (600, 800, 3))
+        self.assertEqual(orientation, 8)
+
+
+class TestDerivativeMaker(unittest.TestCase):
+    """Test rendering each derivative once into the upload store."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = UploadStore(os.path.join(self.root, "store"))
+        self.stored = self.store.save(io.BytesIO(jpeg_bytes()), "phone.jpg")
+        self.maker = DerivativeMaker(self.store, max_size=400)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_rendered_once_then_reused(self):
+        for _ in range(3):
+            path = self.maker.get(self.stored, "webp")
+
+        with Image.open(path) as derivative:
+            self.assertEqual(derivative.format, "WEBP")
+            self.assertEqual(derivative.size, (400, 300))
+        self.assertEqual(os.path.dirname(path), os.path.dirname(self.stored.path))
+        metrics = self.maker.metrics()
+        self.assertEqual((metrics["rendered"], metrics["hits"]), (1, 2))
+        self.assertLess(metrics["derivative_bytes"], metrics["original_bytes"])
+
+    def test_decoded_image_reused(self):
+        decoded = MagicMock(return_value=np.zeros((1200, 1600, 3), np.uint8))
+
+        path = self.maker.get(self.stored, "jpg", decoded)
+        self.maker.get(self.stored, "jpg", decoded)
+
+        decoded.assert_called_once()
+        with Image.open(path) as derivative:
+            self.assertEqual(derivative.format, "JPEG")
+
+    def test_concurrent_requests_share_one_rendering(self):
+        def slow_decode():
+            time.sleep(0.1)
+            return np.zeros((1200, 1600, 3), np.uint8)
+
+        decoded = MagicMock(side_effect=slow_decode)
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            paths = list(
+                executor.map(
+                    lambda _: self.maker.get(self.stored, "webp", decoded), range(4)
+                )
+            )
+
+        self.assertEqual(len(set(paths)), 1)
+        decoded.assert_called_once()
+
+    def test_failed_save_keeps_its_error(self):
+        with patch.object(Image.Image, "save", side_effect=OSError("disk full")):
+            with self.assertRaisesRegex(OSError, "disk full"):
+                self.maker.get(self.stored, "webp")
+
+        self.assertEqual(self.maker.metrics()["rendered"], 0)
+
+    def test_swept_with_their_image(self):
+        path = self.maker.get(self.stored, "webp")
+
+        report = self.store.sweep(max_bytes=0, now=time.time() + 60)
+
+        self.assertEqual(report["removed"], 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertGreater(report["reclaimed_bytes"], self.stored.size)
+
+
+def run_tests():
+    """Run all image derivative tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestRenderDerivative))
+    suite.addTests(loader.loadTestsFromTestCase(TestDerivativeMaker))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running image derivative tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All image derivative tests passed!")
+    else:
+        print("\n❌ Some image derivative tests failed!")
+        exit(1)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Tests for cached image handles and comparisons by image id.
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+import numpy as np
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from image_masking import ImageMasker  # noqa: E402
+from image_sessions import (  # noqa: E402
+    ImageCache,
+    ImageHandle,
+    compare_handles,
+    unmasked_face_data,
+)
+from single_flight import SingleFlight  # noqa: E402
+
+
+def image(height=10, width=10):
+    """Blank RGB image taking height * width * 3 bytes."""
+    return np.full((height, width, 3), 255, dtype=np.uint8)
+
+
+def counting_comparator():
+    """Comparator stub finding one face in every image it is given."""
+
+    def get_face_data_from_image(image, timings):
+        timings.update(detect=1.0, encode=1.0)
+        return {
+            "encodings": [np.zeros(128)],
+            "locations": [(0, 5, 5, 0)],
+            "strategy": "HOG",
+            "variation": "Original",
+            "image_size": (image.shape[1], image.shape[0]),
+            "message": "Found 1 faces",
+        }
+
+    comparator = MagicMock()
+    comparator.get_face_data_from_image.side_effect = get_face_data_from_image
+    comparator.compare_encodings.return_value = {
+        "is_match": True,
+        "best_distance": 0.0,
+        "confidence": 100.0,
+        "matches": [(1, 1, 0.0)],
+        "distances": [[0.0]],
+    }
+    return comparator
+
+
+class TestImageCache(unittest.TestCase):
+    """Test the bounded cache of decoded images."""
+
+    def test_least_recently_used_evicted_when_full(self):
+        cache = ImageCache(max_bytes=3 * 300)
+        for name in "abc":
+            cache.put(name, f"{name}.png", f"/{name}.png", image())
+        cache.get("a")
+        cache.put("d", "d.png", "/d.png", image())
+
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertEqual(cache.metrics()["bytes"], 900)
+        self.assertEqual(cache.metrics()["evictions"], 1)
+
+    def test_idle_images_expire(self):
+        cache = ImageCache(ttl_seconds=0.05)
+        cache.put("a", "a.png", "/a.png", image())
+        time.sleep(0.1)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.metrics()["images"], 0)
+
+    def test_oversized_image_rejected(self):
+        with self.assertRaises(ValueError):
+            ImageCache(max_bytes=100).put("a", "a.png", "/a.png", image())
+
+    def test_cached_arrays_are_read_only(self):
+        handle = ImageCache().put("a", "a.png", "/a.png", image(4, 6))
+
+        self.assertFalse(handle.image.flags.writeable)
+        self.assertEqual(handle.describe()["width"], 6)
+
+
+class TestCompareHandles(unittest.TestCase):
+    """Test comparing cached images with and without masks."""
+
+    def setUp(self):
+        cache = ImageCache()
+        self.handles = [
+            cache.put(name, f"{name}.png", f"/{name}.png", image()) for name in "ab"
+        ]
+
+    def compare(self, comparator, rectangles=()):
+        return compare_handles(
+            self.handles, list(rectangles), 0.45, comparator, ImageMasker(), MagicMock()
+        )
+
+    def test_unmasked_faces_detected_once(self):
+        comparator = counting_comparator()
+        first = self.compare(comparator)
+        second = self.compare(comparator)
+
+        self.assertEqual(comparator.get_face_data_from_image.call_count, 2)
+        self.assertIn("detect_image1", first["timings_ms"])
+        self.assertNotIn("detect_image1", second["timings_ms"])
+        self.assertEqual(second["images"], ["a", "b"])
+        self.assertTrue(second["is_same_person"])
+
+    def test_masked_rounds_reuse_unmasked_faces(self):
+        comparator = counting_comparator()
+        comparator.get_masked_face_data.side_effect = (
+            lambda image, mask, timings, unmasked: dict(unmasked, reused=1)
+        )
+        rectangles = [{"x": 0.0, "y": 0.0, "width": 0.5, "height": 1.0}]
+        first = self.compare(comparator, rectangles)
+        result = self.compare(comparator, rectangles)
+
+        self.assertTrue(result["mask_applied"])
+        self.assertAlmostEqual(result["mask_stats"]["mask_percentage"], 50.0)
+        self.assertEqual(result["faces"][0]["reused"], 1)
+        # The unmasked faces were found once, on the first round
+        self.assertEqual(comparator.get_face_data_from_image.call_count, 2)
+        self.assertIn("unmasked_detect_image1", first["timings_ms"])
+        self.assertNotIn("unmasked_detect_image1", result["timings_ms"])
+        image, mask = comparator.get_masked_face_data.call_args[0][:2]
+        self.assertIs(image, self.handles[1].image)
+        self.assertTrue(mask[:, :5].all() and not mask[:, 5:].any())
+        self.assertTrue(np.all(self.handles[0].image == 255))
+
+
+class TestUnmaskedFaceData(unittest.TestCase):
+    """Test finding the faces of uploaded-ahead images once."""
+
+    def test_concurrent_callers_share_one_detection(self):
+        release = threading.Event()
+        comparator = MagicMock()
+
+        def get_face_data_from_image(image):
+            release.wait(1.0)
+            return {"encodings": [np.zeros(128)]}
+
+        comparator.get_face_data_from_image.side_effect = get_face_data_from_image
+        handle = ImageHandle("a", "a.png", "/a.png", image())
+        flights = SingleFlight()
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(
+                    unmasked_face_data(handle, comparator, flights)
+                )
+            )
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        unmasked_face_data(handle, comparator, flights)
+
+        comparator.get_face_data_from_image.assert_called_once()
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result is handle.face_data for result in results))
+
+
+def run_tests():
+    """Run all image session tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestImageCache))
+    suite.addTests(loader.loadTestsFromTestCase(TestCompareHandles))
+    suite.addTests(loader.loadTestsFromTestCase(TestUnmaskedFaceData))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running image session tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All image session tests passed!")
+    else:
+        print("\n❌ Some image session tests failed!")
+        exit(1)
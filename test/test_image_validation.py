@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Tests for header checks of uploaded images.
+"""
+
+import io
+import os
+import struct
+import sys
+import unittest
+import zlib
+
+from PIL import Image
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from image_validation import ImageRejected, inspect_image, validate_image  # noqa: E402
+
+
+def image_stream(image_format, size=(12, 7), **save_args):
+    """Encode a small image into a stream."""
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "white").save(buffer, image_format, **save_args)
+    buffer.seek(0)
+    return buffer
+
+
+def png_header(width, height):
+    """The signature and IHDR chunk of a PNG claiming the given size."""
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    chunk = b"IHDR" + ihdr
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + struct.pack(">I", len(ihdr))
+        + chunk
+        + struct.pack(">I", zlib.crc32(chunk))
+    )
+
+
+def animated_gif(frames):
+    """Encode a GIF with the given number of distinct frames."""
+    buffer = io.BytesIO()
+    images = [Image.new("L", (4, 4), shade * 4) for shade in range(frames)]
+    images[0].save(buffer, "GIF", save_all=True, append_images=images[1:])
+    buffer.seek(0)
+    return buffer
+
+
+class TestInspectImage(unittest.TestCase):
+    """Test reading formats and dimensions from headers."""
+
+    def test_dimensions_of_each_format(self):
+        for image_format in ("PNG", "JPEG", "GIF", "BMP"):
+            with self.subTest(image_format=image_format):
+                info = inspect_image(image_stream(image_format))
+                self.assertEqual(info.format, image_format)
+                self.assertEqual((info.width, info.height), (12, 7))
+                self.assertEqual(info.frames, 1)
+
+    def test_progressive_jpeg(self):
+        info = inspect_image(image_stream("JPEG", progressive=True))
+        self.assertEqual((info.width, info.height), (12, 7))
+
+    def test_gif_frames_counted(self):
+        self.assertEqual(inspect_image(animated_gif(3)).frames, 3)
+
+    def test_not_an_image_rejected(self):
+        with self.assertRaises(ImageRejected):
+            inspect_image(io.BytesIO(b"<html>not an image</html>"))
+
+    def test_truncated_header_rejected(self):
+        with self.assertRaises(ImageRejected):
+            inspect_image(io.BytesIO(png_header(10, 10)[:20]))
+
+
+class TestValidateImage(unittest.TestCase):
+    """Test the limits applied before decoding."""
+
+    def test_accepted_image(self):
+        info = validate_image(image_stream("PNG"), "photo.png")
+        self.assertEqual(info.pixels, 84)
+
+    def test_extension_must_match_content(self):
+        with self.assertRaises(ImageRejected) as raised:
+            validate_image(image_stream("PNG"), "photo.jpg")
+        self.assertIn("is a PNG image, not JPEG", str(raised.exception))
+
+    def test_jpeg_accepts_both_extensions(self):
+        for filename in ("a.jpg", "a.JPEG"):
+            validate_image(image_stream("JPEG"), filename)
+
+    def test_decompression_bomb_rejected_from_header(self):
+        # Only the header exists: the check must not need the pixel data
+        with self.assertRaises(ImageRejected) as raised:
+            validate_image(io.BytesIO(png_header(60000, 60000)), "bomb.png")
+        self.assertIn("3600.0 MP", str(raised.exception))
+
+    def test_pixel_limit_configurable(self):
+        with self.assertRaises(ImageRejected):
+            validate_image(image_stream("PNG"), max_pixels=50)
+
+    def test_empty_image_rejected(self):
+        with self.assertRaises(ImageRejected):
+            validate_image(io.BytesIO(png_header(0, 10)))
+
+    def test_too_many_frames_rejected(self):
+        with self.assertRaises(ImageRejected) as raised:
+            validate_image(animated_gif(4), "anim.gif", max_frames=2)
+        self.assertIn("more than 2 frames", str(raised.exception))
+
+    def test_fake_image_names_upload(self):
+        with self.assertRaises(ImageRejected) as raised:
+            validate_image(io.BytesIO(b"MZ\x90\x00"), "face.png")
+        self.assertTrue(str(raised.exception).startswith("face.png: "))
+
+
+def run_tests():
+    """Run all image validation tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestInspectImage))
+    suite.addTests(loader.loadTestsFromTestCase(TestValidateImage))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running image validation tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All image validation tests passed!")
+    else:
+        print("\n❌ Some image validation tests failed!")
+        exit(1)
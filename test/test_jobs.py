@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent job queue and the staged comparison worker.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+
+import numpy as np
+from PIL import Image
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from image_masking import ImageMasker  # noqa: E402
+from job_queue import DONE, FAILED, QUEUED, RUNNING, JobQueue  # noqa: E402
+from jobs import (  # noqa: E402
+    JobWorker,
+    run_comparison_job,
+    start_workers,
+    stop_workers,
+)
+
+JOB_SECONDS = 0.2
+
+
+def fake_comparator(faces=(1, 1), distance=0.2):
+    """Comparator stub returning the given face counts and best distance."""
+    comparator = MagicMock()
+    comparator.get_face_data_from_image.side_effect = [
+        {
+            "encodings": [np.zeros(128)] * count if count else None,
+            "strategy": "HOG" if count else None,
+            "variation": "Original" if count else None,
+            "message": f"Found {count} faces",
+        }
+        for count in faces
+    ]
+    comparator.get_masked_face_data.side_effect = (
+        lambda image, mask, timings=None, unmasked=None: (
+            comparator.get_face_data_from_image(image, timings)
+        )
+    )
+    comparator.compare_encodings.return_value = {
+        "is_match": distance <= 0.45,
+        "best_distance": distance,
+        "confidence": (0.45 - distance) / 0.45 * 100,
+        "matches": [(1, 1, distance)] if distance <= 0.45 else [],
+    }
+    return comparator
+
+
+class SlowComparator:
+    """Picklable comparator stand-in that spends JOB_SECONDS per job."""
+
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+
+    def get_face_data_from_image(self, image, timings=None):
+        time.sleep(JOB_SECONDS / 2)
+        return {
+            "encodings": [np.zeros(128)],
+            "strategy": "HOG",
+            "variation": "Original",
+            "message": "Found 1 faces",
+        }
+
+    def compare_encodings(self, encodings1, encodings2):
+        return {
+            "is_match": True,
+            "best_distance": 0.0,
+            "confidence": 100.0,
+            "matches": [],
+        }
+
+
+class JobTestCase(unittest.TestCase):
+    """Shared temporary database and images."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.queue = JobQueue(os.path.join(self.test_dir, "jobs.sqlite3"))
+        self.image1 = os.path.join(self.test_dir, "a.png")
+        self.image2 = os.path.join(self.test_dir, "b.png")
+        Image.new("RGB", (40, 30), "white").save(self.image1)
+        Image.new("RGB", (20, 10), "white").save(self.image2)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def payload(self, rectangles=None):
+        return {
+            "image1": self.image1,
+            "image2": self.image2,
+            "rectangles": rectangles or [],
+            "tolerance": 0.45,
+        }
+
+
+class TestJobQueue(JobTestCase):
+    """Test queue ordering, persistence and events."""
+
+    def test_claim_in_submission_order(self):
+        first = self.queue.submit({"n": 1})
+        second = self.queue.submit({"n": 2})
+
+        self.assertEqual(self.queue.claim(), (first, {"n": 1}))
+        self.assertEqual(self.queue.claim(), (second, {"n": 2}))
+        self.assertIsNone(self.queue.claim())
+        self.assertEqual(self.queue.get(first)["status"], RUNNING)
+
+    def test_expired_lease_requeues_job(self):
+        job_id = self.queue.submit({"n": 1})
+        self.queue.claim("lost", lease_seconds=0.05)
+        time.sleep(0.1)
+
+        # A new process opening the same file takes the job over
+        reopened = JobQueue(self.queue.path)
+        self.assertEqual(reopened.claim("new"), (job_id, {"n": 1}))
+        job = reopened.get(job_id)
+        self.assertEqual((job["worker_id"], job["attempts"]), ("new", 2))
+        self.assertIn("requeued", [e["stage"] for e in reopened.events(job_id)])
+
+        # The lost worker can neither renew nor finish the job any more
+        self.assertFalse(reopened.heartbeat(job_id, "lost"))
+        self.assertFalse(reopened.complete(job_id, {}, worker_id="lost"))
+        self.assertTrue(reopened.complete(job_id, {}, worker_id="new"))
+
+    def test_heartbeat_keeps_lease(self):
+        job_id = self.queue.submit({})
+        self.queue.claim("worker", lease_seconds=0.1)
+        for _ in range(3):
+            time.sleep(0.05)
+            self.assertTrue(self.queue.heartbeat(job_id, "worker", lease_seconds=0.1))
+
+        self.assertEqual(self.queue.requeue_expired(), 0)
+        self.assertEqual(self.queue.get(job_id)["status"], RUNNING)
+
+    def test_repeatedly_lost_job_fails(self):
+        queue = JobQueue(self.queue.path, max_attempts=2)
+        job_id = queue.submit({})
+        for _ in range(2):
+            queue.claim("crashing", lease_seconds=0)
+            time.sleep(0.01)
+
+        self.assertEqual(queue.requeue_expired(), 1)
+        self.assertEqual(queue.get(job_id)["status"], FAILED)
+
+    def test_complete_and_fail(self):
+        done = self.queue.submit({})
+        failed = self.queue.submit({})
+        self.queue.complete(done, {"ok": True})
+        self.queue.fail(failed, ValueError("broken"))
+
+        self.assertEqual(self.queue.get(done)["result"], {"ok": True})
+        self.assertEqual(self.queue.get(failed)["error"], "broken")
+        self.assertEqual(self.queue.counts(), {DONE: 1, FAILED: 1})
+        self.assertIsNone(self.queue.get("missing"))
+
+    def test_events_after_sequence(self):
+        job_id = self.queue.submit({})
+        self.queue.add_event(job_id, "decoded", {"w": 1})
+        events = self.queue.events(job_id)
+
+        self.assertEqual([e["stage"] for e in events], [QUEUED, "decoded"])
+        self.assertEqual(self.queue.events(job_id, after=events[0]["seq"]), events[1:])
+
+
+class TestComparisonJob(JobTestCase):
+    """Test the staged pipeline and worker."""
+
+    def test_stages_reported_in_order(self):
+        stages = []
+        result = run_comparison_job(
+            self.payload(),
+            fake_comparator(),
+            ImageMasker(),
+            lambda stage, data: stages.append((stage, data)),
+        )
+
+        self.assertEqual(
+            [stage for stage, _ in stages],
+            ["decoded", "faces_image1", "faces_image2", "compared"],
+        )
+        self.assertEqual(stages[0][1]["image1"], {"width": 40, "height": 30})
+        self.assertEqual(stages[1][1]["strategy"], "HOG")
+        self.assertTrue(result["is_same_person"])
+        self.assertEqual(result["details"], "Distance: 0.200, Confidence: 55.6%")
+        self.assertFalse(result["mask_applied"])
+
+    def test_masking_applied(self):
+        rectangles = [{"x": 0.0, "y": 0.0, "width": 0.5, "height": 1.0}]
+        result = run_comparison_job(
+            self.payload(rectangles), fake_comparator(), ImageMasker(), MagicMock()
+        )
+
+        self.assertTrue(result["mask_applied"])
+        self.assertAlmostEqual(result["mask_stats"]["mask_percentage"], 50.0)
+        # Masks are applied in memory, without masked copies beside the uploads
+        self.assertFalse(
+            [name for name in os.listdir(self.test_dir) if name.startswith("masked_")]
+        )
+
+    def test_no_faces(self):
+        result = run_comparison_job(
+            self.payload(), fake_comparator(faces=(1, 0)), ImageMasker(), MagicMock()
+        )
+
+        self.assertFalse(result["is_same_person"])
+        self.assertEqual(result["details"], "Face detection failed")
+
+    def test_worker_records_result_and_failure(self):
+        good = self.queue.submit(self.payload())
+        bad = self.queue.submit(dict(self.payload(), image1="/missing.png"))
+        comparators = iter([fake_comparator(), fake_comparator()])
+        worker = JobWorker(self.queue, lambda tolerance: next(comparators), ImageMasker)
+
+        self.assertEqual(worker.run_once(), good)
+        self.assertEqual(worker.run_once(), bad)
+        self.assertIsNone(worker.run_once())
+
+        self.assertEqual(self.queue.get(good)["status"], DONE)
+        self.assertIn("compared", [e["stage"] for e in self.queue.events(good)])
+        self.assertEqual(self.queue.get(bad)["status"], FAILED)
+
+
+class TestWorkerFleet(JobTestCase):
+    """Test several worker processes sharing one queue."""
+
+    def run_fleet(self, processes, jobs):
+        """Queue jobs, run them with a fleet and return the elapsed seconds."""
+        queue = JobQueue(os.path.join(self.test_dir, f"fleet{processes}.sqlite3"))
+        workers = start_workers(
+            queue.path, processes, comparator_factory=SlowComparator, poll_interval=0.02
+        )
+        try:
+            started = time.perf_counter()
+            job_ids = [queue.submit(self.payload()) for _ in range(jobs)]
+            while queue.counts().get(DONE, 0) < jobs:
+                self.assertLess(time.perf_counter() - started, 30)
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - started
+        finally:
+            stop_workers(workers, timeout=10)
+
+        # Every job ran exactly once
+        for job_id in job_ids:
+            self.assertEqual(queue.get(job_id)["attempts"], 1)
+        return elapsed
+
+    def test_throughput_scales_with_workers(self):
+        jobs = 12
+        single = self.run_fleet(1, jobs)
+        fleet = self.run_fleet(4, jobs)
+
+        self.assertGreaterEqual(single, jobs * JOB_SECONDS)
+        self.assertGreater(single / fleet, 2.0)
+
+
+def run_tests():
+    """Run all job queue tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestJobQueue))
+    suite.addTests(loader.loadTestsFromTestCase(TestComparisonJob))
+    suite.addTests(loader.loadTestsFromTestCase(TestWorkerFleet))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running job queue tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All job queue tests passed!")
+    else:
+        print("\n❌ Some job queue tests failed!")
+        exit(1)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Tests for live mask-preview sessions and their debounced estimates.
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+import numpy as np
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from image_masking import ImageMasker  # noqa: E402
+from image_sessions import ImageHandle  # noqa: E402
+from mask_preview import (  # noqa: E402
+    PreviewManager,
+    RateLimited,
+    Superseded,
+    estimate_masked_match,
+)
+
+
+class RecordingEstimate:
+    """Estimate stand-in recording the rectangles it was asked about."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.started = threading.Event()
+
+    def __call__(self, session, rectangles, cancelled):
+        self.calls.append(rectangles)
+        self.started.set()
+        time.sleep(self.delay)
+        if cancelled():
+            raise Superseded()
+        return {"is_same_person": True, "rectangles": len(rectangles)}
+
+
+def wait_for(session, revision, timeout=2.0):
+    """The events published up to ``revision``, waiting for it to appear."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        events = session.wait_for_events(0, 0.05)
+        if events and events[-1]["revision"] >= revision:
+            return events
+    raise AssertionError(f"No estimate for revision {revision}")
+
+
+class TestPreviewManager(unittest.TestCase):
+    """Test debouncing, superseding and rate limiting of mask updates."""
+
+    def test_burst_of_edits_estimated_once(self):
+        estimate = RecordingEstimate()
+        manager = PreviewManager(estimate, debounce_seconds=0.1)
+        session = manager.create(["a", "b"], 0.6)
+
+        for count in range(1, 6):
+            revision = manager.update(session, [{}] * count)
+        events = wait_for(session, revision)
+
+        self.assertEqual(revision, 5)
+        self.assertEqual(estimate.calls, [[{}] * 5])
+        self.assertEqual(
+            events, [{"is_same_person": True, "rectangles": 5, "revision": 5}]
+        )
+        self.assertEqual(manager.metrics()["computed"], 1)
+
+    def test_edit_during_estimate_supersedes_it(self):
+        estimate = RecordingEstimate(delay=0.2)
+        manager = PreviewManager(estimate, debounce_seconds=0)
+        session = manager.create(["a", "b"], 0.6)
+
+        manager.update(session, [{}])
+        self.assertTrue(estimate.started.wait(1.0))
+        revision = manager.update(session, [{}, {}])
+        events = wait_for(session, revision)
+
+        self.assertEqual(len(estimate.calls), 2)
+        self.assertEqual([event["revision"] for event in events], [2])
+        self.assertEqual(manager.metrics()["superseded"], 1)
+
+    def test_updates_rate_limited_per_session(self):
+        manager = PreviewManager(
+            RecordingEstimate(), debounce_seconds=0, max_updates_per_second=3
+        )
+        session = manager.create(["a", "b"], 0.6)
+        other = manager.create(["c", "d"], 0.6)
+
+        for _ in range(3):
+            manager.update(session, [])
+        with self.assertRaises(RateLimited) as raised:
+            manager.update(session, [])
+
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertLessEqual(raised.exception.retry_after, 1.0)
+        self.assertEqual(manager.update(other, []), 1)
+        self.assertEqual(manager.metrics()["rate_limited"], 1)
+
+    def test_estimate_errors_published(self):
+        manager = PreviewManager(MagicMock(side_effect=RuntimeError("boom")), 0)
+        session = manager.create(["a", "b"], 0.6)
+
+        events = wait_for(session, manager.update(session, []))
+
+        self.assertEqual(events, [{"revision": 1, "error": "boom"}])
+
+    def test_idle_sessions_expire(self):
+        manager = PreviewManager(RecordingEstimate(), idle_seconds=0.05)
+        session = manager.create(["a", "b"], 0.6)
+        time.sleep(0.1)
+
+        self.assertTrue(manager.expired(session))
+        self.assertIsNone(manager.get(session.id))
+        self.assertEqual(manager.metrics()["sessions"], 0)
+
+
+class TestEstimateMaskedMatch(unittest.TestCase):
+    """Test the quick estimate for two cached images."""
+
+    def setUp(self):
+        self.handles = [
+            ImageHandle(name, f"{name}.png", f"/{name}.png", np.zeros((10, 10, 3)))
+            for name in ("a", "b")
+        ]
+        unmasked = {"encodings": [np.zeros(128)], "locations": [(0, 5, 5, 0)]}
+        self.comparator = MagicMock()
+        self.comparator.get_face_data_from_image.return_value = unmasked
+        self.comparator.get_masked_face_data.side_effect = (
+            lambda image, mask, **kw: dict(kw["unmasked"], reused=0)
+        )
+        self.comparator.compare_encodings.return_value = {
+            "is_match": True,
+            "best_distance": 0.25,
+            "confidence": 58.3,
+        }
+
+    def test_unmasked_faces_found_once_and_estimated_without_detection(self):
+        rectangles = [{"x": 0, "y": 0, "width": 0.5, "height": 0.5}]
+        for _ in range(2):
+            estimate = estimate_masked_match(
+                self.handles, rectangles, self.comparator, ImageMasker(), lambda: False
+            )
+
+        self.assertEqual(self.comparator.get_face_data_from_image.call_count, 2)
+        self.assertEqual(self.comparator.get_masked_face_data.call_count, 4)
+        self.assertFalse(
+            self.comparator.get_masked_face_data.call_args.kwargs["redetect"]
+        )
+        self.assertTrue(estimate["is_same_person"])
+        self.assertEqual(estimate["distance"], 0.25)
+        self.assertEqual(estimate["faces"], [1, 1])
+        self.assertEqual(estimate["reused"], [0, 0])
+
+    def test_without_rectangles_reuses_unmasked_faces(self):
+        estimate = estimate_masked_match(
+            self.handles, [], self.comparator, ImageMasker(), lambda: False
+        )
+
+        self.comparator.get_masked_face_data.assert_not_called()
+        self.assertEqual(estimate["reused"], [1, 1])
+
+    def test_cancelled_estimate_raises(self):
+        with self.assertRaises(Superseded):
+            estimate_masked_match(
+                self.handles, [], self.comparator, ImageMasker(), lambda: True
+            )
+
+
+def run_tests():
+    """Run all mask preview tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestPreviewManager))
+    suite.addTests(loader.loadTestsFromTestCase(TestEstimateMaskedMatch))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running mask preview tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All mask preview tests passed!")
+    else:
+        print("\n❌ Some mask preview tests failed!")
+        exit(1)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for resources created once per process.
+"""
+
+import os
+import sys
+import threading
+import unittest
+from unittest.mock import patch
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from per_process import PerProcess  # noqa: E402
+
+
+class TestPerProcess(unittest.TestCase):
+    """Test lazy creation, once per process."""
+
+    def test_created_once_on_first_use(self):
+        created = []
+        resource = PerProcess(lambda: created.append(1) or object())
+
+        self.assertIsNone(resource.current())
+        self.assertEqual(created, [])
+
+        first = resource.get()
+        self.assertIs(resource.get(), first)
+        self.assertIs(resource.current(), first)
+        self.assertEqual(created, [1])
+
+    def test_concurrent_first_use_creates_once(self):
+        created = []
+        started = threading.Barrier(8)
+        resource = PerProcess(lambda: created.append(1) or object())
+
+        def use():
+            started.wait()
+            resource.get()
+
+        threads = [threading.Thread(target=use) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(created, [1])
+
+    def test_created_again_in_forked_process(self):
+        resource = PerProcess(object)
+        parent = resource.get()
+
+        with patch("per_process.os.getpid", return_value=os.getpid() + 1):
+            # What the parent created is not this process's
+            self.assertIsNone(resource.current())
+            child = resource.get()
+            self.assertIsNot(child, parent)
+            self.assertIs(resource.get(), child)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork()")
+    def test_thread_started_again_after_fork(self):
+        resource = PerProcess(
+            lambda: threading.Thread(target=threading.Event().wait, daemon=True)
+        )
+        resource.get().start()
+
+        pid = os.fork()
+        if pid == 0:
+            # The parent's thread did not survive the fork; a new one starts
+            thread = resource.get()
+            thread.start()
+            os._exit(0 if thread.is_alive() else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+
+
+def run_tests():
+    """Run all per-process resource tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestPerProcess))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running per-process resource tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All per-process resource tests passed!")
+    else:
+        print("\n❌ Some per-process resource tests failed!")
+        exit(1)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent comparison result store.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from result_store import ResultStore  # noqa: E402
+
+
+class TestResultStore(unittest.TestCase):
+    """Test saving and loading results."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, "results.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_save_and_get(self):
+        store = ResultStore(self.path)
+        first = store.save({"is_same_person": True, "details": "Distance: 0.100"})
+        second = store.save({"is_same_person": False})
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(store.get(first)["details"], "Distance: 0.100")
+        self.assertIsNone(store.get("missing"))
+
+    def test_results_survive_reopening(self):
+        result_id = ResultStore(self.path).save({"mask_stats": None})
+
+        self.assertEqual(ResultStore(self.path).get(result_id), {"mask_stats": None})
+
+    def test_old_results_pruned(self):
+        store = ResultStore(self.path, max_age_seconds=3600)
+        old = store.save({"is_same_person": True})
+        with store._db.connect() as conn:
+            conn.execute(
+                "UPDATE results SET created_at = ? WHERE id = ?",
+                (time.time() - 7200, old),
+            )
+
+        # Pruning runs on the first save, then at most once per interval
+        store._last_prune = 0.0
+        new = store.save({"is_same_person": False})
+
+        self.assertIsNone(store.get(old))
+        self.assertEqual(store.get(new), {"is_same_person": False})
+
+    def test_results_kept_without_max_age(self):
+        store = ResultStore(self.path)
+        result_id = store.save({"is_same_person": True})
+
+        self.assertEqual(store.prune(0), 0)
+        self.assertIsNotNone(store.get(result_id))
+
+
+def run_tests():
+    """Run all result store tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestResultStore))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running result store tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All result store tests passed!")
+    else:
+        print("\n❌ Some result store tests failed!")
+        exit(1)
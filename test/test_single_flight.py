@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Tests for single-flight coalescing of identical in-flight work.
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from single_flight import SingleFlight  # noqa: E402
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test leader/follower sharing, error propagation and key release."""
+
+    def start_followers(self, flight, key, fn, count):
+        """Start threads calling flight.do(key, fn) and collect their outcomes."""
+        outcomes = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                outcome = flight.do(key, fn)
+            except BaseException as e:
+                outcome = e
+            with lock:
+                outcomes.append(outcome)
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, outcomes
+
+    def wait_until_joined(self, flight, expected):
+        """Block until the given number of callers are attached to the leader."""
+        for _ in range(1000):
+            if flight.metrics()["coalesced"] >= expected:
+                return
+            threading.Event().wait(0.005)
+        self.fail("followers never attached")
+
+    def test_duplicates_share_one_execution(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            release.wait()
+            return "result"
+
+        leader, outcomes = self.start_followers(flight, "key", work, 1)
+        while not calls:
+            threading.Event().wait(0.005)
+        followers, follower_outcomes = self.start_followers(flight, "key", work, 4)
+        self.wait_until_joined(flight, 4)
+        release.set()
+        for thread in leader + followers:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [("result", False)])
+        self.assertEqual(follower_outcomes, [("result", True)] * 4)
+        self.assertEqual(
+            flight.metrics(), {"executed": 1, "coalesced": 4, "in_flight": 0}
+        )
+
+    def test_errors_reach_every_caller(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        started = threading.Event()
+
+        def failing():
+            started.set()
+            release.wait()
+            raise ValueError("bad image")
+
+        leader, outcomes = self.start_followers(flight, "key", failing, 1)
+        started.wait()
+        followers, follower_outcomes = self.start_followers(flight, "key", failing, 2)
+        self.wait_until_joined(flight, 2)
+        release.set()
+        for thread in leader + followers:
+            thread.join()
+
+        for outcome in outcomes + follower_outcomes:
+            self.assertIsInstance(outcome, ValueError)
+
+    def test_base_exceptions_reach_every_caller(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        started = threading.Event()
+
+        def interrupted():
+            started.set()
+            release.wait()
+            raise KeyboardInterrupt
+
+        leader, outcomes = self.start_followers(flight, "key", interrupted, 1)
+        started.wait()
+        followers, follower_outcomes = self.start_followers(
+            flight, "key", interrupted, 2
+        )
+        self.wait_until_joined(flight, 2)
+        release.set()
+        for thread in leader + followers:
+            thread.join()
+
+        # No follower is handed a (None, True) result
+        self.assertEqual(len(outcomes + follower_outcomes), 3)
+        for outcome in outcomes + follower_outcomes:
+            self.assertIsInstance(outcome, KeyboardInterrupt)
+        self.assertEqual(flight.metrics()["in_flight"], 0)
+
+    def test_key_released_after_completion(self):
+        flight = SingleFlight()
+        calls = []
+
+        def work():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(flight.do("key", work), (1, False))
+        self.assertEqual(flight.do("key", work), (2, False))
+        self.assertEqual(flight.metrics()["in_flight"], 0)
+
+    def test_distinct_keys_run_separately(self):
+        flight = SingleFlight()
+
+        self.assertEqual(flight.do("a", lambda: "a"), ("a", False))
+        self.assertEqual(flight.do("b", lambda: "b"), ("b", False))
+        self.assertEqual(flight.metrics()["executed"], 2)
+
+
+def run_tests():
+    """Run all single-flight tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestSingleFlight))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running single-flight tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All single-flight tests passed!")
+    else:
+        print("\n❌ Some single-flight tests failed!")
+        exit(1)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for SQLite database files shared between threads and processes.
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from sqlite_db import SQLiteDatabase  # noqa: E402
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, name TEXT);"
+
+
+class TestSQLiteDatabase(unittest.TestCase):
+    """Test schema creation, journal mode and per-use connections."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "items.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_schema_created_in_wal_mode(self):
+        db = SQLiteDatabase(self.path, SCHEMA)
+
+        with db.connect() as conn:
+            mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            conn.execute("INSERT INTO items (name) VALUES ('a')")
+        self.assertEqual(mode, "wal")
+
+        # Opening the file again keeps what is in it
+        with SQLiteDatabase(self.path, SCHEMA).connect() as conn:
+            self.assertEqual(
+                conn.execute("SELECT name FROM items").fetchall(), [("a",)]
+            )
+
+    def test_journal_mode_and_row_factory(self):
+        db = SQLiteDatabase(
+            self.path, SCHEMA, journal_mode="delete", row_factory=sqlite3.Row
+        )
+
+        with db.connect() as conn:
+            self.assertEqual(
+                conn.execute("PRAGMA journal_mode").fetchone()[0], "delete"
+            )
+            conn.execute("INSERT INTO items (name) VALUES ('a')")
+            row = conn.execute("SELECT name FROM items").fetchone()
+        self.assertEqual(row["name"], "a")
+
+    def test_connection_closed_after_use(self):
+        db = SQLiteDatabase(self.path, SCHEMA)
+
+        with db.connect() as conn:
+            pass
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+    def test_autocommit_outside_explicit_transactions(self):
+        db = SQLiteDatabase(self.path, SCHEMA)
+
+        with db.connect() as conn:
+            conn.execute("INSERT INTO items (name) VALUES ('a')")
+            conn.execute("BEGIN")
+            conn.execute("INSERT INTO items (name) VALUES ('b')")
+            conn.execute("ROLLBACK")
+        with db.connect() as conn:
+            self.assertEqual(
+                conn.execute("SELECT COUNT(*) FROM items").fetchone()[0], 1
+            )
+
+
+def run_tests():
+    """Run all SQLite database tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestSQLiteDatabase))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running SQLite database tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All SQLite database tests passed!")
+    else:
+        print("\n❌ Some SQLite database tests failed!")
+        exit(1)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Tests for the upload retention sweeper.
+"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from PIL import Image
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from upload_retention import UploadSweeper  # noqa: E402
+from upload_store import UploadStore  # noqa: E402
+
+
+def png_bytes(color="white"):
+    """Encode a small solid-colour PNG."""
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class TestUploadSweeper(unittest.TestCase):
+    """Test the retention policy across the store and older uploads."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = UploadStore(os.path.join(self.root, "store"))
+        self.stored = [
+            self.store.save(io.BytesIO(png_bytes(color)), f"{color}.png")
+            for color in ("white", "gray", "black")
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_sweeper_removes_old_uploads_outside_the_store(self):
+        legacy = os.path.join(self.root, "IMG_1997.jpeg")
+        other = os.path.join(self.root, "IMG_1998.PNG")
+        for path in (legacy, other):
+            with open(path, "wb") as f:
+                f.write(b"x" * 100)
+        index = os.path.join(self.root, "notes.sqlite3")
+        open(index, "wb").close()
+        folder = os.path.join(self.root, "old")
+        os.makedirs(folder)
+        long_ago = time.time() - 3600
+        for path in (legacy, other, index, folder):
+            os.utime(path, (long_ago, long_ago))
+
+        sweeper = UploadSweeper(
+            self.store, legacy_folder=self.root, max_age_seconds=60, max_bytes=None
+        )
+        report = sweeper.sweep()
+
+        self.assertEqual(report["removed"], 2)
+        self.assertEqual(report["reclaimed_bytes"], 200)
+        self.assertFalse(os.path.exists(legacy))
+        self.assertFalse(os.path.exists(other))
+        # Only image files are uploads of older versions
+        self.assertTrue(os.path.exists(index))
+        self.assertTrue(os.path.exists(folder))
+        self.assertEqual(self.store.metrics()["images"], 3)
+        usage = sweeper.usage()
+        self.assertEqual((usage["sweeps"], usage["reclaimed_bytes"]), (1, 200))
+
+    def test_store_quota_applied(self):
+        sweeper = UploadSweeper(
+            self.store, max_bytes=self.stored[0].size, grace_seconds=0
+        )
+        report = sweeper.sweep()
+
+        self.assertEqual(report["removed"], 2)
+        self.assertEqual(sweeper.usage()["store"]["images"], 1)
+        self.assertEqual(sweeper.usage()["last_sweep"]["removed"], 2)
+
+    def test_background_sweeps(self):
+        sweeper = UploadSweeper(
+            self.store, max_bytes=0, interval_seconds=0.02, grace_seconds=0
+        )
+        sweeper.start()
+        sweeper.start()
+        try:
+            deadline = time.monotonic() + 2.0
+            while sweeper.usage()["sweeps"] == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            sweeper.stop()
+
+        self.assertGreaterEqual(sweeper.usage()["sweeps"], 1)
+        self.assertEqual(self.store.metrics()["images"], 0)
+
+
+def run_tests():
+    """Run all upload retention tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestUploadSweeper))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running upload retention tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All upload retention tests passed!")
+    else:
+        print("\n❌ Some upload retention tests failed!")
+        exit(1)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-addressed upload store.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from PIL import Image
+
+# Add src directory to path for imports
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Import after path modification  # noqa: E402
+from upload_store import UploadStore  # noqa: E402
+
+
+def image_bytes(color="white", image_format="PNG"):
+    """Encode a small solid-colour image."""
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class TestUploadStore(unittest.TestCase):
+    """Test storing uploads by content hash."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = UploadStore(os.path.join(self.root, "store"))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_stored_under_sharded_digest(self):
+        data = image_bytes(image_format="JPEG")
+        stored = self.store.save(io.BytesIO(data), "IMG_1997.jpeg")
+        digest = hashlib.sha256(data).hexdigest()
+
+        self.assertEqual(stored.digest, digest)
+        self.assertEqual(
+            stored.path,
+            os.path.join(self.store.root, digest[:2], digest[2:4], f"{digest}.jpg"),
+        )
+        self.assertEqual(stored.size, len(data))
+        self.assertFalse(stored.deduplicated)
+        with open(stored.path, "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    def test_same_name_different_content_kept_apart(self):
+        first = self.store.save(io.BytesIO(image_bytes("white")), "IMG_1997.png")
+        second = self.store.save(io.BytesIO(image_bytes("black")), "IMG_1997.png")
+
+        self.assertNotEqual(first.path, second.path)
+        self.assertTrue(os.path.exists(first.path))
+        self.assertTrue(os.path.exists(second.path))
+
+    def test_identical_content_stored_once(self):
+        data = image_bytes()
+        first = self.store.save(io.BytesIO(data), "a.png")
+        second = self.store.save(io.BytesIO(data), "copy of a.png")
+
+        self.assertEqual(first.path, second.path)
+        self.assertTrue(second.deduplicated)
+        self.assertEqual(self.store.get(first.digest).filename, "copy of a.png")
+        metrics = self.store.metrics()
+        self.assertEqual((metrics["images"], metrics["bytes"]), (1, len(data)))
+        self.assertEqual(metrics["deduplicated"], 1)
+        self.assertEqual(os.listdir(os.path.join(self.store.root, "tmp")), [])
+
+    def test_non_images_rejected_and_not_kept(self):
+        with self.assertRaises(ValueError):
+            self.store.save(io.BytesIO(b"not an image"), "x.png")
+
+        self.assertEqual(os.listdir(os.path.join(self.store.root, "tmp")), [])
+        self.assertEqual(self.store.metrics()["images"], 0)
+
+    def test_unknown_or_missing_digest(self):
+        stored = self.store.save(io.BytesIO(image_bytes()), "a.png")
+        os.remove(stored.path)
+
+        self.assertIsNone(self.store.get(stored.digest))
+        self.assertIsNone(self.store.get("0" * 64))
+
+
+class TestUploadStoreSweep(unittest.TestCase):
+    """Test sweeping the store by age and size quota."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = UploadStore(os.path.join(self.root, "store"))
+        self.stored = [
+            self.store.save(io.BytesIO(image_bytes(color)), f"{color}.png")
+            for color in ("white", "gray", "black")
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_expired_images_removed(self):
+        report = self.store.sweep(max_age_seconds=60, now=time.time() + 120)
+
+        self.assertEqual(report["removed"], 3)
+        self.assertEqual(report["reclaimed_bytes"], sum(s.size for s in self.stored))
+        self.assertFalse(any(os.path.exists(s.path) for s in self.stored))
+        self.assertEqual(self.store.metrics()["images"], 0)
+
+    def test_least_recently_used_removed_over_quota(self):
+        time.sleep(0.01)
+        self.store.get(self.stored[0].digest)
+        quota = self.stored[0].size + self.stored[2].size
+
+        report = self.store.sweep(max_bytes=quota)
+
+        self.assertEqual(report["removed"], 1)
+        self.assertIsNone(self.store.get(self.stored[1].digest))
+        self.assertIsNotNone(self.store.get(self.stored[0].digest))
+        self.assertIsNotNone(self.store.get(self.stored[2].digest))
+
+    def test_recently_used_images_kept(self):
+        report = self.store.sweep(max_bytes=0, grace_seconds=60)
+
+        self.assertEqual(report["removed"], 0)
+        self.assertEqual(self.store.metrics()["images"], 3)
+
+
+def run_tests():
+    """Run all upload store tests."""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    suite.addTests(loader.loadTestsFromTestCase(TestUploadStore))
+    suite.addTests(loader.loadTestsFromTestCase(TestUploadStoreSweep))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("Running upload store tests...")
+    print("=" * 50)
+
+    success = run_tests()
+
+    if success:
+        print("\n✅ All upload store tests passed!")
+    else:
+        print("\n❌ Some upload store tests failed!")
+        exit(1)
@@ -6,16 +6,73 @@ Tests for the Flask web application.
 import io
 import json
 import os
+import shutil
+import subprocess
 import sys
 import tempfile
 import unittest
 from pathlib import Path
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, MagicMock, patch
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 # Import after path modification  # noqa: E402
-from app import app  # noqa: E402
+from app import app, estimate_preview  # noqa: E402
+
+# Runs static/js/upload-ahead.js against a stand-in for the comparison form
+# and prints what the form would post
+UPLOAD_AHEAD_HARNESS = r"""
+const listeners = {};
+const element = (name) => ({
+    name,
+    value: "",
+    files: [],
+    on: {},
+    addEventListener(type, fn) { this.on[type] = fn; },
+});
+const fields = {};
+for (const name of ["image1", "image1_id", "image2", "image2_id"]) {
+    fields["#" + name] = element(name);
+}
+const form = {
+    dataset: { uploadAheadUrl: "/api/images/ahead" },
+    querySelector: (selector) => fields[selector],
+    addEventListener(type, fn) { listeners[type] = fn; },
+};
+global.document = {
+    addEventListener: (type, fn) => fn(),
+    querySelectorAll: () => [form],
+};
+const uploads = [];
+global.fetch = async (url, options) => {
+    uploads.push([...options.body.keys()]);
+    const file = options.body.get("image");
+    return { ok: true, json: async () => ({ image: { id: "id-" + file.name } }) };
+};
+
+function submit() {
+    const formData = new FormData();
+    for (const field of Object.values(fields)) {
+        formData.append(field.name, field.files[0] || field.value);
+    }
+    listeners.formdata({ formData });
+    return Object.fromEntries(formData);
+}
+
+function choose(name, file) {
+    fields[name].files = [file];
+    fields[name].on.change();
+    return new Promise((resolve) => setTimeout(resolve, 10));
+}
+
+require(process.argv[1]);
+(async () => {
+    await choose("#image1", new File(["a"], "a.png"));
+    const one = Object.keys(submit());
+    await choose("#image2", new File(["b"], "b.png"));
+    console.log(JSON.stringify({ uploads, one, both: submit() }));
+})();
+"""
 
 
 class WebAppTestCase(unittest.TestCase):
@@ -23,10 +80,26 @@ class WebAppTestCase(unittest.TestCase):
 
     def setUp(self):
         """Set up test environment."""
+        from app import activity_log
+
+        # Events queued by other tests go to their own database
+        activity_log.flush()
         self.app = app
         self.app.config["TESTING"] = True
         self.app.config["WTF_CSRF_ENABLED"] = False
         self.app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        self.app.config["JOB_DATABASE"] = os.path.join(
+            self.app.config["UPLOAD_FOLDER"], "jobs.sqlite3"
+        )
+        self.app.config["JOB_WORKER_THREADS"] = 0
+        self.app.config["UPLOAD_SWEEP_INTERVAL_SECONDS"] = 0
+        self.app.config["RESULT_DATABASE"] = os.path.join(
+            self.app.config["UPLOAD_FOLDER"], "results.sqlite3"
+        )
+        self.app.config["SCRATCH_FOLDER"] = tempfile.mkdtemp()
+        self.app.config["ACTIVITY_DATABASE"] = os.path.join(
+            self.app.config["UPLOAD_FOLDER"], "activity.sqlite3"
+        )
         self.client = self.app.test_client()
 
         # Create test upload directory
@@ -36,16 +109,55 @@ class WebAppTestCase(unittest.TestCase):
         """Clean up test environment."""
         import shutil
 
+        from app import activity_log, get_activity_aggregates
+
+        # Events still queued are written to this test's database, and
+        # counted there before it is removed
+        activity_log.flush()
+        get_activity_aggregates().snapshot()
         if os.path.exists(self.app.config["UPLOAD_FOLDER"]):
             shutil.rmtree(self.app.config["UPLOAD_FOLDER"])
+        shutil.rmtree(self.app.config["SCRATCH_FOLDER"], ignore_errors=True)
+
+    def mock_comparison(self, mock_comparator_class, distance=0.1):
+        """Make the patched FaceComparator find one face per image."""
+
+        def get_face_data_from_image(image, timings=None):
+            if timings is not None:
+                timings.update(detect=1.0, encode=2.0)
+            return {
+                "encodings": [[0.0] * 128],
+                "locations": [(10, 60, 60, 10)],
+                "strategy": "HOG",
+                "variation": "Original",
+                "image_size": (100, 100),
+                "message": "Found 1 faces using HOG on Original",
+            }
 
-    def create_test_image(self):
+        mock_comparator = MagicMock()
+        mock_comparator.get_face_data_from_image.side_effect = get_face_data_from_image
+        mock_comparator.get_masked_face_data.side_effect = (
+            lambda image, mask, timings=None, unmasked=None, redetect=True: (
+                get_face_data_from_image(image, timings)
+            )
+        )
+        mock_comparator.compare_encodings.return_value = {
+            "is_match": distance <= 0.45,
+            "best_distance": distance,
+            "confidence": max(0, (0.45 - distance) / 0.45 * 100),
+            "matches": [(1, 1, distance)] if distance <= 0.45 else [],
+            "distances": [[distance]],
+        }
+        mock_comparator_class.return_value = mock_comparator
+        return mock_comparator
+
+    def create_test_image(self, image_format="PNG"):
         """Create a simple test image file."""
         from PIL import Image
 
         img = Image.new("RGB", (100, 100), color="white")
         img_io = io.BytesIO()
-        img.save(img_io, "PNG")
+        img.save(img_io, image_format)
         img_io.seek(0)
         return img_io
 
@@ -110,12 +222,7 @@ class WebAppTestCase(unittest.TestCase):
     def test_compare_valid_images_success(self, mock_comparator_class):
         """Test compare endpoint with valid images that match."""
         # Mock the face comparator
-        mock_comparator = MagicMock()
-        mock_comparator.compare_faces.return_value = (
-            True,
-            "Distance: 0.123, Confidence: 95.5%",
-        )
-        mock_comparator_class.return_value = mock_comparator
+        self.mock_comparison(mock_comparator_class, distance=0.123)
 
         # Create test images
         img1 = self.create_test_image()
@@ -136,16 +243,11 @@ class WebAppTestCase(unittest.TestCase):
     def test_compare_valid_images_different(self, mock_comparator_class):
         """Test compare endpoint with valid images that don't match."""
         # Mock the face comparator
-        mock_comparator = MagicMock()
-        mock_comparator.compare_faces.return_value = (
-            False,
-            "Distance: 0.789, Confidence: 85.2%",
-        )
-        mock_comparator_class.return_value = mock_comparator
+        self.mock_comparison(mock_comparator_class, distance=0.789)
 
         # Create test images
-        img1 = self.create_test_image()
-        img2 = self.create_test_image()
+        img1 = self.create_test_image("JPEG")
+        img2 = self.create_test_image("JPEG")
 
         data = {"image1": (img1, "person1.jpg"), "image2": (img2, "person2.jpg")}
 
@@ -158,13 +260,203 @@ class WebAppTestCase(unittest.TestCase):
         self.assertIn(b"person1.jpg", response.data)
         self.assertIn(b"person2.jpg", response.data)
 
+    @patch("app.FaceComparator")
+    def test_compare_redirects_to_cacheable_result(self, mock_comparator_class):
+        """Test that results are stored and shown from a permalink."""
+        mock_comparator = self.mock_comparison(mock_comparator_class, distance=0.2)
+        data = {
+            "image1": (self.create_test_image(), "a.png"),
+            "image2": (self.create_test_image(), "b.png"),
+        }
+
+        response = self.client.post("/compare", data=data)
+        self.assertEqual(response.status_code, 303)
+        location = response.headers["Location"]
+        self.assertRegex(location, r"^/result/[0-9a-f]{32}$")
+
+        # Every view renders from the stored result without recomputing
+        for _ in range(2):
+            response = self.client.get(location)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b"SAME PERSON", response.data)
+            self.assertIn(b"Distance: 0.200", response.data)
+        self.assertEqual(mock_comparator.get_face_data_from_image.call_count, 2)
+
+        etag = response.headers["ETag"]
+        self.assertIn("max-age=", response.headers["Cache-Control"])
+        revalidated = self.client.get(location, headers={"If-None-Match": etag})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.data, b"")
+
+    @patch("app.FaceComparator")
+    def test_uploads_stored_by_content(self, mock_comparator_class):
+        """Test that same-named uploads never collide and repeats are stored once."""
+        import hashlib
+
+        from PIL import Image
+
+        from app import get_upload_store
+
+        self.mock_comparison(mock_comparator_class)
+        images = {}
+        for color in ("white", "gray"):
+            img_io = io.BytesIO()
+            Image.new("RGB", (100, 100), color).save(img_io, "PNG")
+            images[color] = img_io.getvalue()
+
+        for color in ("white", "gray"):
+            data = {
+                "image1": (io.BytesIO(images[color]), "IMG_1997.png"),
+                "image2": (io.BytesIO(images["white"]), "other.png"),
+            }
+            response = self.client.post("/compare", data=data, follow_redirects=True)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b"IMG_1997.png", response.data)
+
+            # The result page shows the image by content hash
+            digest = hashlib.sha256(images[color]).hexdigest()
+            self.assertIn(f"/uploads/{digest}".encode(), response.data)
+            served = self.client.get(f"/uploads/{digest}")
+            self.assertEqual(served.data, images[color])
+            self.assertEqual(served.mimetype, "image/png")
+            served.close()
+
+        metrics = get_upload_store().metrics()
+        self.assertEqual(metrics["images"], 2)
+        self.assertEqual(metrics["deduplicated"], 2)
+        # Nothing is saved under the uploaded names any more
+        names = os.listdir(self.app.config["UPLOAD_FOLDER"])
+        self.assertFalse([name for name in names if name.endswith(".png")])
+        self.assertEqual(self.client.get(f"/uploads/{'0' * 64}").status_code, 404)
+
+    @patch("app.FaceComparator")
+    def test_result_page_shows_cacheable_display_images(self, mock_comparator_class):
+        """Test that results embed small derivatives and link the originals."""
+        from PIL import Image
+
+        self.mock_comparison(mock_comparator_class)
+        img_io = io.BytesIO()
+        Image.new("RGB", (1600, 1200), "white").save(img_io, "JPEG")
+        img_io.seek(0)
+        data = {
+            "image1": (img_io, "phone.jpg"),
+            "image2": (self.create_test_image(), "b.png"),
+        }
+        response = self.client.post("/compare", data=data, follow_redirects=True)
+        image_id = response.get_data(as_text=True).split("/uploads/")[1][:64]
+        self.assertIn(f"/uploads/{image_id}/display".encode(), response.data)
+        self.assertIn(b"View original", response.data)
+
+        served = self.client.get(
+            f"/uploads/{image_id}/display", headers={"Accept": "image/webp,*/*"}
+        )
+        self.assertEqual(served.status_code, 200)
+        self.assertEqual(served.mimetype, "image/webp")
+        self.assertIn("immutable", served.headers["Cache-Control"])
+        self.assertIn("Accept", served.headers["Vary"])
+        with Image.open(io.BytesIO(served.data)) as derivative:
+            self.assertEqual(derivative.size, (800, 600))
+        etag = served.headers["ETag"]
+        served.close()
+
+        revalidated = self.client.get(
+            f"/uploads/{image_id}/display",
+            headers={"Accept": "image/webp", "If-None-Match": etag},
+        )
+        self.assertEqual(revalidated.status_code, 304)
+
+        served = self.client.get(
+            f"/uploads/{image_id}/display", headers={"Accept": "image/png"}
+        )
+        self.assertEqual(served.mimetype, "image/jpeg")
+        served.close()
+
+        original = self.client.get(f"/uploads/{image_id}")
+        self.assertIn("max-age=31536000", original.headers["Cache-Control"])
+        original.close()
+        self.assertEqual(
+            self.client.get(f"/uploads/{'0' * 64}/display").status_code, 404
+        )
+
+    @patch("app.FaceComparator")
+    def test_admin_uploads_reports_and_sweeps(self, mock_comparator_class):
+        """Test the upload usage endpoint and a sweep over the size quota."""
+        import time
+
+        self.mock_comparison(mock_comparator_class)
+        data = {
+            "image1": (self.create_test_image(), "a.png"),
+            "image2": (self.create_test_image(), "b.png"),
+        }
+        self.client.post("/compare", data=data)
+        old_upload = os.path.join(self.app.config["UPLOAD_FOLDER"], "old.png")
+        with open(old_upload, "wb") as f:
+            f.write(b"x" * 10)
+        week_ago = time.time() - 8 * 24 * 60 * 60
+        os.utime(old_upload, (week_ago, week_ago))
+
+        usage = self.client.get("/admin/uploads").get_json()
+        self.assertEqual(usage["store"]["images"], 1)
+        self.assertEqual(usage["sweeps"], 0)
+
+        from app import get_upload_sweeper
+
+        sweeper = get_upload_sweeper()
+        sweeper.max_bytes, sweeper.grace_seconds = 0, 0
+        usage = self.client.post("/admin/uploads").get_json()
+
+        self.assertEqual(usage["store"]["images"], 0)
+        self.assertEqual(usage["last_sweep"]["removed"], 2)
+        self.assertGreater(usage["reclaimed_bytes"], 10)
+        self.assertFalse(os.path.exists(old_upload))
+
+    def test_unknown_result_not_found(self):
+        """Test that an unknown result id is a 404."""
+        self.assertEqual(self.client.get("/result/missing").status_code, 404)
+
+    @patch("app.FaceComparator")
+    def test_result_expired_once_images_swept(self, mock_comparator_class):
+        """Test that a result whose images were swept shows an expired page."""
+        import time
+
+        from app import get_result_store, get_upload_sweeper
+
+        self.mock_comparison(mock_comparator_class)
+        data = {
+            "image1": (self.create_test_image(), "a.png"),
+            "image2": (self.create_test_image(), "b.png"),
+        }
+        location = self.client.post("/compare", data=data).headers["Location"]
+        etag = self.client.get(location).headers["ETag"]
+
+        sweeper = get_upload_sweeper()
+        sweeper.max_bytes, sweeper.grace_seconds = 0, 0
+        sweeper.sweep()
+
+        # Even for a browser revalidating its cached copy
+        response = self.client.get(location, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 410)
+        self.assertIn(b"Result Expired", response.data)
+        self.assertIn(b"up to 7 days", response.data)
+
+        # Results are removed once as old as the uploads are kept
+        store = get_result_store()
+        self.assertEqual(
+            store.max_age_seconds, self.app.config["UPLOAD_MAX_AGE_SECONDS"]
+        )
+        store.prune(time.time() + 1)
+        response = self.client.get(location)
+        self.assertEqual(response.status_code, 404)
+        self.assertIn(b"Result Expired", response.data)
+
     @patch("app.FaceComparator")
     def test_compare_face_comparison_error(self, mock_comparator_class):
         """Test compare endpoint when face comparison throws an error."""
         # Mock the face comparator to throw an exception
-        mock_comparator = MagicMock()
-        mock_comparator.compare_faces.side_effect = Exception("Face detection failed")
-        mock_comparator_class.return_value = mock_comparator
+        mock_comparator = self.mock_comparison(mock_comparator_class)
+        mock_comparator.get_face_data_from_image.side_effect = Exception(
+            "Face detection failed"
+        )
 
         # Create test images
         img1 = self.create_test_image()
@@ -229,12 +521,7 @@ class WebAppTestCase(unittest.TestCase):
     def test_compare_with_rectangle_data(self, mock_comparator_class):
         """Test compare endpoint with rectangle masking data."""
         # Mock the face comparator
-        mock_comparator = MagicMock()
-        mock_comparator.compare_faces.return_value = (
-            True,
-            "Distance: 0.234, Confidence: 92.1%",
-        )
-        mock_comparator_class.return_value = mock_comparator
+        self.mock_comparison(mock_comparator_class, distance=0.234)
 
         # Create test images
         img1 = self.create_test_image()
@@ -262,12 +549,7 @@ class WebAppTestCase(unittest.TestCase):
     def test_compare_without_rectangle_data(self, mock_comparator_class):
         """Test compare endpoint without rectangle masking."""
         # Mock the face comparator
-        mock_comparator = MagicMock()
-        mock_comparator.compare_faces.return_value = (
-            False,
-            "Distance: 0.789, Confidence: 88.3%",
-        )
-        mock_comparator_class.return_value = mock_comparator
+        self.mock_comparison(mock_comparator_class, distance=0.789)
 
         # Create test images
         img1 = self.create_test_image()
@@ -311,6 +593,521 @@ class WebAppTestCase(unittest.TestCase):
         # Should redirect back to index with error
         self.assertEqual(response.status_code, 302)
 
+    def test_metrics_endpoint(self):
+        """Test that the admin metrics endpoint reports scheduler statistics."""
+        response = self.client.get("/admin/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        metrics = response.get_json()["encoding_scheduler"]
+        self.assertIn("mean_batch_fill", metrics)
+        self.assertIn("batch_size_histogram", metrics)
+
+    def test_activity_logged_off_the_request_path(self):
+        """Test that queued activity reaches the admin log page."""
+        import uuid
+
+        agent = f"activity-test-{uuid.uuid4().hex[:8]}"
+        self.client.get("/", headers={"User-Agent": agent})
+
+        response = self.client.get("/admin/logs")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(agent.encode(), response.data)
+
+        for _ in range(3):
+            self.client.get("/")
+        response = self.client.get("/admin/logs?action=page_visit&limit=2")
+        self.assertEqual(response.data.count(b"badge-info"), 2)
+        older = response.get_data(as_text=True).split('href="/admin/logs?before=')[1]
+        older = "/admin/logs?before=" + older.split('"')[0].replace("&amp;", "&")
+        response = self.client.get(older)
+        self.assertEqual(response.data.count(b"badge-info"), 2)
+        self.assertNotIn(b"Older", response.data)
+        self.assertEqual(self.client.get("/admin/logs?before=x").status_code, 400)
+
+        metrics = self.client.get("/admin/metrics").get_json()["activity_log"]
+        self.assertEqual(metrics["sample_rates"], {"file_access": 0.1})
+        self.assertGreaterEqual(metrics["written"], 1)
+
+    @patch("app.FaceComparator")
+    def test_activity_summary(self, mock_comparator_class):
+        """Test comparison counts, error rates and results on the dashboard."""
+        self.mock_comparison(mock_comparator_class, distance=0.2)
+        for _ in range(2):
+            data = {
+                "image1": (self.create_test_image(), "api1.png"),
+                "image2": (self.create_test_image(), "api2.png"),
+            }
+            self.assertEqual(
+                self.client.post("/api/compare", data=data).status_code, 200
+            )
+        self.client.post("/compare", data={})
+
+        response = self.client.get("/admin/activity?minutes=5")
+
+        self.assertEqual(response.status_code, 200)
+        summary = response.get_json()
+        self.assertEqual(summary["comparisons"], 2)
+        self.assertEqual(len(summary["per_minute"]), 5)
+        self.assertEqual(summary["errors"]["missing_files"]["rate"], round(1 / 3, 4))
+        self.assertEqual(summary["results"]["same_ratio"], 1)
+        self.assertEqual(sum(bucket["count"] for bucket in summary["latency_ms"]), 2)
+        self.assertEqual(self.client.get("/admin/activity?minutes=0").status_code, 400)
+
+    @patch("app.FaceComparator")
+    def test_api_compare_multipart(self, mock_comparator_class):
+        """Test the JSON API with multipart uploads."""
+        self.mock_comparison(mock_comparator_class, distance=0.2)
+
+        data = {
+            "image1": (self.create_test_image(), "api1.png"),
+            "image2": (self.create_test_image(), "api2.png"),
+        }
+        response = self.client.post("/api/compare", data=data)
+
+        self.assertEqual(response.status_code, 200)
+        result = response.get_json()
+        self.assertTrue(result["is_same_person"])
+        self.assertEqual(result["distance"], 0.2)
+        self.assertEqual(result["distances"], [[0.2]])
+        self.assertEqual(result["matches"], [{"face1": 1, "face2": 1, "distance": 0.2}])
+        self.assertEqual(
+            result["faces"][0]["boxes"],
+            [{"top": 10, "right": 60, "bottom": 60, "left": 10}],
+        )
+        self.assertEqual(result["faces"][1]["strategy"], "HOG")
+        self.assertIsNone(result["mask_stats"])
+        for stage in ("decode", "detect_image1", "encode_image2", "compare", "total"):
+            self.assertIn(stage, result["timings_ms"])
+        # Nothing from the request is kept on disk, and the upload folder
+        # is never used for its scratch files
+        self.assertEqual(os.listdir(self.app.config["SCRATCH_FOLDER"]), [])
+        self.assertFalse(
+            os.path.exists(os.path.join(self.app.config["UPLOAD_FOLDER"], "api"))
+        )
+
+    @patch("app.FaceComparator")
+    def test_api_compare_base64(self, mock_comparator_class):
+        """Test the JSON API with base64 images, masks and a tolerance."""
+        import base64
+
+        self.mock_comparison(mock_comparator_class, distance=0.5)
+        encoded = base64.b64encode(self.create_test_image().read()).decode()
+
+        response = self.client.post(
+            "/api/compare",
+            json={
+                "image1": encoded,
+                "image2": "data:image/png;base64," + encoded,
+                "rectangles": [{"x": 0.0, "y": 0.0, "width": 0.5, "height": 0.5}],
+                "tolerance": 0.6,
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        result = response.get_json()
+        self.assertFalse(result["is_same_person"])
+        self.assertEqual(result["tolerance"], 0.6)
+        self.assertTrue(result["mask_applied"])
+        self.assertAlmostEqual(result["mask_stats"]["mask_percentage"], 25.0)
+        self.assertIn("mask", result["timings_ms"])
+        mock_comparator_class.assert_called_with(
+            tolerance=0.6, encoder=ANY, detection_cache=ANY
+        )
+
+    @patch("app.FaceComparator")
+    def test_api_compare_scratch_removed_on_errors(self, mock_comparator_class):
+        """Test that failed JSON comparisons leave no scratch files behind."""
+        mock_comparator = self.mock_comparison(mock_comparator_class)
+        mock_comparator.compare_encodings.side_effect = RuntimeError("dlib failed")
+        data = {
+            "image1": (self.create_test_image(), "api1.png"),
+            "image2": (self.create_test_image(), "api2.png"),
+        }
+
+        response = self.client.post("/api/compare", data=data)
+
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("dlib failed", response.get_json()["error"])
+        self.assertEqual(self.client.post("/api/compare").status_code, 400)
+        self.assertEqual(os.listdir(self.app.config["SCRATCH_FOLDER"]), [])
+
+    def test_api_compare_rejects_bad_input(self):
+        """Test that the JSON API reports input problems as 400 errors."""
+        self.assertEqual(self.client.post("/api/compare").status_code, 400)
+
+        response = self.client.post(
+            "/api/compare", json={"image1": "not base64!", "image2": ""}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("image1", response.get_json()["error"])
+
+        # Failures are counted by reason code, not by their messages
+        errors = self.client.get("/admin/activity?minutes=5").get_json()["errors"]
+        self.assertEqual(
+            {"missing_files", "invalid_image"} & set(errors),
+            {"missing_files", "invalid_image"},
+        )
+        self.assertFalse(any("base64" in reason for reason in errors))
+
+    @patch("app.FaceComparator")
+    def test_images_uploaded_once_compared_by_id(self, mock_comparator_class):
+        """Test comparing uploaded image ids repeatedly with new masks."""
+        mock_comparator = self.mock_comparison(mock_comparator_class)
+        response = self.client.post(
+            "/api/images",
+            data={
+                "image1": (self.create_test_image(), "a.png"),
+                "image2": (self.create_test_image(), "b.png"),
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        images = response.get_json()["images"]
+        self.assertEqual([image["filename"] for image in images], ["a.png", "b.png"])
+        self.assertEqual((images[0]["width"], images[0]["height"]), (100, 100))
+        ids = [image["id"] for image in images]
+
+        rectangles = [{"x": 0.0, "y": 0.0, "width": 0.5, "height": 0.5}]
+        for body in ({}, {}, {"rectangles": rectangles}):
+            body.update(image1=ids[0], image2=ids[1])
+            response = self.client.post("/api/images/compare", json=body)
+            self.assertEqual(response.status_code, 200)
+            result = response.get_json()
+            self.assertTrue(result["is_same_person"])
+            self.assertEqual(result["images"], ids)
+        self.assertAlmostEqual(result["mask_stats"]["mask_percentage"], 25.0)
+
+        # Unmasked faces were found once per image and handed to the masked
+        # round for reuse
+        self.assertEqual(mock_comparator.get_masked_face_data.call_count, 2)
+        unmasked = mock_comparator.get_masked_face_data.call_args.kwargs["unmasked"]
+        self.assertEqual(unmasked["strategy"], "HOG")
+        self.assertEqual(mock_comparator.get_face_data_from_image.call_count, 2)
+
+        # Another process (or an emptied cache) decodes the stored files again
+        from src.image_sessions import ImageCache
+
+        with patch("app.image_cache", ImageCache()):
+            response = self.client.post(
+                "/api/images/compare", json={"image1": ids[0], "image2": ids[1]}
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_image_compare_rejects_unknown_ids(self):
+        """Test that comparing ids that were never uploaded is a 404."""
+        response = self.client.post(
+            "/api/images/compare", json={"image1": "0" * 64, "image2": "../x"}
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("image1", response.get_json()["error"])
+
+        response = self.client.post(
+            "/api/images", data={"image": (io.BytesIO(b"not an image"), "x.png")}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @patch.dict(app.config, {"MAX_IMAGE_PIXELS": 5000})
+    def test_unsafe_images_rejected_before_decoding(self):
+        """Test that fake, misnamed and oversized images get clear 400s."""
+        cases = (
+            ((io.BytesIO(b"MZ\x90\x00 not an image"), "fake.png"), "not a PNG"),
+            ((self.create_test_image("JPEG"), "photo.png"), "is a JPEG image"),
+            ((self.create_test_image(), "big.png"), "at most"),
+        )
+        for upload, message in cases:
+            with self.subTest(message=message):
+                data = {"image1": upload, "image2": (self.create_test_image(), "b.png")}
+                response = self.client.post("/api/compare", data=data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(message, response.get_json()["error"])
+
+        data = {
+            "image1": (self.create_test_image(), "big.png"),
+            "image2": (self.create_test_image(), "b.png"),
+        }
+        response = self.client.post("/compare", data=data, follow_redirects=True)
+        self.assertIn(b"at most 0.005 MP", response.data)
+
+        data = {
+            "image1": (self.create_test_image(), "big.png"),
+            "image2": (self.create_test_image(), "b.png"),
+        }
+        response = self.client.post("/api/jobs", data=data)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.app.config["UPLOAD_FOLDER"], "jobs"))
+        )
+
+    @patch("app.run_comparison", side_effect=RuntimeError("boom"))
+    def test_api_scratch_removed_on_error(self, mock_run_comparison):
+        """Test that a failing API request leaves no scratch files behind."""
+        data = {
+            "image1": (self.create_test_image(), "api1.png"),
+            "image2": (self.create_test_image(), "api2.png"),
+        }
+        response = self.client.post("/api/compare", data=data)
+
+        self.assertEqual(response.status_code, 500)
+        scratch = os.path.dirname(mock_run_comparison.call_args[0][1])
+        self.assertEqual(os.path.dirname(scratch), self.app.config["SCRATCH_FOLDER"])
+        self.assertFalse(os.path.exists(scratch))
+
+    @patch("app.FaceComparator")
+    def test_compare_images_uploaded_ahead(self, mock_comparator_class):
+        """Test that the form can post ids of images uploaded when chosen."""
+        from PIL import Image
+
+        mock_comparator = self.mock_comparison(mock_comparator_class)
+        ids = []
+        for name, color in (("a.png", "white"), ("b.png", "gray")):
+            img_io = io.BytesIO()
+            Image.new("RGB", (100, 100), color).save(img_io, "PNG")
+            img_io.seek(0)
+            response = self.client.post(
+                "/api/images/ahead", data={"image": (img_io, name)}
+            )
+            self.assertEqual(response.status_code, 202)
+            ids.append(response.get_json()["image"]["id"])
+
+        response = self.client.post(
+            "/compare", data={"image1_id": ids[0], "image2_id": ids[1]}
+        )
+        self.assertEqual(response.status_code, 303)
+        page = self.client.get(response.headers["Location"])
+        self.assertIn(b"a.png", page.data)
+
+        # Faces were found once per image, by the background encoding or by
+        # the comparison waiting for it
+        self.assertEqual(mock_comparator.get_face_data_from_image.call_count, 2)
+
+        # Unknown ids fall back to requiring the files
+        response = self.client.post(
+            "/compare", data={"image1_id": "0" * 64, "image2_id": ids[1]}
+        )
+        self.assertEqual(response.status_code, 302)
+
+        response = self.client.post(
+            "/api/images/ahead",
+            data={
+                "image1": (self.create_test_image(), "a.png"),
+                "image2": (self.create_test_image(), "b.png"),
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @unittest.skipUnless(shutil.which("node"), "needs node to run the page script")
+    def test_form_posts_ids_of_images_uploaded_ahead(self):
+        """Test that the page script posts ids instead of files once both are set."""
+        page = self.client.get("/").data.decode()
+        self.assertIn('data-upload-ahead-url="/api/images/ahead"', page)
+        self.assertIn('name="image1_id"', page)
+        self.assertIn('name="image2_id"', page)
+        self.assertIn("/static/js/upload-ahead.js", page)
+
+        script = Path(self.app.static_folder, "js", "upload-ahead.js")
+        result = subprocess.run(
+            ["node", "-e", UPLOAD_AHEAD_HARNESS, str(script)],
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        posts = json.loads(result.stdout)
+
+        # Each file went ahead on its own as it was chosen
+        self.assertEqual(posts["uploads"], [["image"], ["image"]])
+        # With both ids set the form posts only the ids
+        self.assertEqual(
+            posts["both"], {"image1_id": "id-a.png", "image2_id": "id-b.png"}
+        )
+        # An upload still running (or failed) leaves the form posting files
+        self.assertEqual(sorted(posts["one"]), ["image1", "image2"])
+
+    @patch("app.FaceComparator")
+    def test_mask_preview_streams_estimates(self, mock_comparator_class):
+        """Test a preview session: mask updates answered over SSE."""
+        from src.mask_preview import PreviewManager
+
+        mock_comparator = self.mock_comparison(mock_comparator_class)
+        response = self.client.post(
+            "/api/images",
+            data={
+                "image1": (self.create_test_image(), "a.png"),
+                "image2": (self.create_test_image(), "b.png"),
+            },
+        )
+        ids = [image["id"] for image in response.get_json()["images"]]
+
+        manager = PreviewManager(
+            estimate_preview,
+            debounce_seconds=0,
+            max_updates_per_second=2,
+        )
+        with patch("app.preview_manager", manager):
+            response = self.client.post(
+                "/api/previews", json={"image1": ids[0], "image2": ids[1]}
+            )
+            self.assertEqual(response.status_code, 201)
+            preview = response.get_json()
+
+            rectangles = [{"x": 0.0, "y": 0.0, "width": 0.5, "height": 0.5}]
+            response = self.client.post(
+                preview["masks_url"], json={"rectangles": rectangles}
+            )
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.get_json()["revision"], 1)
+
+            response = self.client.get(preview["events_url"])
+            self.assertEqual(response.mimetype, "text/event-stream")
+            chunks = response.iter_encoded()
+            frame = next(chunk for chunk in chunks if chunk.startswith(b"id:"))
+            frame = frame.decode()
+            response.close()
+            self.assertTrue(frame.startswith("id: 1\nevent: estimate\n"))
+            estimate = json.loads(frame.split("data: ", 1)[1])
+            self.assertTrue(estimate["is_same_person"])
+            self.assertEqual(estimate["revision"], 1)
+            self.assertFalse(
+                mock_comparator.get_masked_face_data.call_args.kwargs["redetect"]
+            )
+
+            self.client.post(preview["masks_url"], json={"rectangles": []})
+            response = self.client.post(preview["masks_url"], json={"rectangles": []})
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers["Retry-After"], "1")
+
+    def test_mask_preview_unknown_ids(self):
+        """Test that previews of unknown images or sessions are 404s."""
+        response = self.client.post(
+            "/api/previews", json={"image1": "0" * 64, "image2": "0" * 64}
+        )
+        self.assertEqual(response.status_code, 404)
+        for path in ("/api/previews/nope/events", "/api/previews/nope/masks"):
+            method = self.client.get if path.endswith("events") else self.client.post
+            self.assertEqual(method(path, json={}).status_code, 404)
+
+    @patch("app.FaceComparator")
+    def test_api_batch_streams_ndjson(self, mock_comparator_class):
+        """Test the archive batch endpoint with a manifest inside the zip."""
+        import zipfile
+
+        self.mock_comparison(mock_comparator_class)
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            for name in ("a.png", "b.png", "c.png"):
+                zf.writestr(name, self.create_test_image().read())
+            zf.writestr("pairs.csv", "image1,image2\na.png,b.png\na.png,c.png\n")
+        archive.seek(0)
+
+        response = self.client.post(
+            "/api/batch", data={"archive": (archive, "pairs.zip")}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        records = [json.loads(line) for line in response.data.splitlines()]
+        self.assertEqual(
+            {(r["image1"], r["image2"]) for r in records[:-1]},
+            {("a.png", "b.png"), ("a.png", "c.png")},
+        )
+        self.assertEqual(records[-1]["summary"]["images"], 3)
+        # Members are never extracted to the upload folder
+        self.assertEqual(os.listdir(self.app.config["UPLOAD_FOLDER"]), [])
+
+    def test_api_batch_rejects_bad_archives(self):
+        """Test that unusable batch uploads are reported as 400 errors."""
+        self.assertEqual(self.client.post("/api/batch").status_code, 400)
+
+        response = self.client.post(
+            "/api/batch", data={"archive": (io.BytesIO(b"plain text"), "x.zip")}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("archive", response.get_json()["error"])
+
+    @patch("app.FaceComparator")
+    def test_job_api_lifecycle(self, mock_comparator_class):
+        """Test submitting, running, polling and streaming a comparison job."""
+        from app import JobWorker, get_job_queue, make_comparator
+
+        self.mock_comparison(mock_comparator_class)
+
+        data = {
+            "image1": (self.create_test_image(), "job1.png"),
+            "image2": (self.create_test_image(), "job2.png"),
+        }
+        response = self.client.post("/api/jobs", data=data)
+
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()["job_id"]
+        self.assertEqual(
+            self.client.get(f"/api/jobs/{job_id}").get_json()["status"], "queued"
+        )
+
+        # Job uploads are kept in the upload store, once per content
+        from app import get_upload_store
+
+        self.assertEqual(get_upload_store().metrics()["images"], 1)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.app.config["UPLOAD_FOLDER"], "jobs"))
+        )
+
+        JobWorker(get_job_queue(), make_comparator, MagicMock).run_once()
+
+        job = self.client.get(f"/api/jobs/{job_id}").get_json()
+        self.assertEqual(job["status"], "done")
+        self.assertTrue(job["result"]["is_same_person"])
+        self.assertEqual(
+            [e["stage"] for e in job["events"]],
+            [
+                "queued",
+                "running",
+                "decoded",
+                "faces_image1",
+                "faces_image2",
+                "compared",
+                "done",
+            ],
+        )
+
+        stream = self.client.get(f"/api/jobs/{job_id}/events")
+        self.assertEqual(stream.mimetype, "text/event-stream")
+        self.assertIn(b"event: faces_image1", stream.data)
+        self.assertTrue(stream.data.rstrip().endswith(b"data: {}"))
+        stream.close()
+
+    @patch("app.FaceComparator")
+    def test_event_streams_capped(self, mock_comparator_class):
+        """Test that open event streams beyond the cap get a 503."""
+        self.mock_comparison(mock_comparator_class)
+        data = {
+            "image1": (self.create_test_image(), "job1.png"),
+            "image2": (self.create_test_image(), "job2.png"),
+        }
+        job_id = self.client.post("/api/jobs", data=data).get_json()["job_id"]
+        self.app.config["EVENT_STREAM_MAX"] = 1
+        try:
+            # The queued job's stream stays open until it is closed
+            first = self.client.get(f"/api/jobs/{job_id}/events")
+            self.assertEqual(first.status_code, 200)
+
+            second = self.client.get(f"/api/jobs/{job_id}/events")
+            self.assertEqual(second.status_code, 503)
+            self.assertEqual(second.headers["Retry-After"], "5")
+            metrics = self.client.get("/admin/metrics").get_json()["event_streams"]
+            self.assertEqual((metrics["open"], metrics["max"]), (1, 1))
+
+            first.close()
+            third = self.client.get(f"/api/jobs/{job_id}/events")
+            self.assertEqual(third.status_code, 200)
+            third.close()
+        finally:
+            self.app.config["EVENT_STREAM_MAX"] = 4
+
+    def test_job_api_rejects_bad_uploads(self):
+        """Test that job submission validates uploads like /compare."""
+        response = self.client.post("/api/jobs")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get("/api/jobs/unknown").status_code, 404)
+
     def test_rectangle_data_validation(self):
         """Test that rectangle data is properly validated."""
         from src.image_masking import ImageMasker